@@ -0,0 +1,171 @@
+"""
+Concurrent-user throughput: gunicorn sync workers (``portfolio.wsgi``, the
+Procfile today) versus uvicorn workers (``portfolio/gunicorn_asgi.py``).
+
+Both servers run the same number of worker processes against one SQLite
+file and a stand-in market data provider that sleeps ``--upstream-ms`` per
+call, like a yfinance round trip. Every simulated user loops over the
+dashboard (database reads plus the cached ticker table) and ``/quotes/`` for
+a symbol nobody asked for yet (a cache miss, so an upstream call).
+
+    python -m benchmarks.asgi_load --users 50 --workers 2 --seconds 15 --upstream-ms 300
+"""
+import argparse
+import itertools
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from .common import percentile, print_table, setup
+
+from trading_portfolio.providers import BAR_COLUMNS, MarketDataProvider
+
+
+class SlowProvider(MarketDataProvider):
+    """One flat bar per symbol after a fixed delay (``BENCH_UPSTREAM_MS``)."""
+
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        time.sleep(float(os.environ.get('BENCH_UPSTREAM_MS', 300)) / 1000)
+        index = pd.DatetimeIndex([pd.Timestamp.now(tz='UTC').floor('min')], name='timestamp')
+        return {symbol: pd.DataFrame([[100.0, 101.0, 99.0, 100.5, 1000.0]], index=index, columns=BAR_COLUMNS)
+                for symbol in symbols}
+
+
+def prepare(directory):
+    """Migrate a file database, add a user with some history and return its session cookie."""
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.core.management import call_command
+
+    from trading_portfolio.trading import execute_trade
+
+    call_command('migrate', verbosity=0)
+    user = User.objects.create_user('loadtest', password='loadtest-password')
+    for i in range(40):
+        execute_trade(user, f'SYM{i % 8}', 'BUY', '1', '10')
+
+    session = SessionStore()
+    session.update({SESSION_KEY: str(user.pk), BACKEND_SESSION_KEY: 'django.contrib.auth.backends.ModelBackend',
+                    HASH_SESSION_KEY: user.get_session_auth_hash()})
+    session.create()
+    return f'sessionid={session.session_key}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f"server did not start: {' '.join(command)}\n{process.stderr.read().decode()}")
+
+
+def check_login(base_url, cookie):
+    request = urllib.request.Request(base_url + '/dashboard/', headers={'Cookie': cookie})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        if not response.geturl().endswith('/dashboard/'):
+            raise SystemExit(f"dashboard redirected to {response.geturl()}, the session cookie was rejected")
+
+
+def load(base_url, cookie, users, seconds):
+    """Run ``users`` closed-loop clients for ``seconds`` and return (latencies, errors)."""
+    latencies, errors = [], []
+    symbols = itertools.count()
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def user():
+        while time.monotonic() < deadline:
+            for path in ('/dashboard/', f'/quotes/?symbols=LOAD{next(symbols)}'):
+                request = urllib.request.Request(base_url + path, headers={'Cookie': cookie})
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=60) as response:
+                        response.read()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                except (urllib.error.URLError, OSError) as e:
+                    with lock:
+                        errors.append(e)
+
+    threads = [threading.Thread(target=user) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--upstream-ms', type=float, default=300)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='asgi_load_')
+    env = {
+        **os.environ,
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite3')}",
+        'CACHE_DIR': os.path.join(directory, 'cache'),
+        'REDIS_URL': '',
+        'MARKET_DATA_PROVIDER': 'benchmarks.asgi_load.SlowProvider',
+        'BENCH_UPSTREAM_MS': str(args.upstream_ms),
+        'QUOTE_CACHE_BACKGROUND_REFRESH': 'False',
+        'DJANGO_SETTINGS_MODULE': 'portfolio.settings',
+    }
+    os.environ.update(env)
+    try:
+        setup()
+        cookie = prepare(directory)
+
+        rows = []
+        for label, command in (
+            ('WSGI, sync workers', ['gunicorn', 'portfolio.wsgi']),
+            ('ASGI, uvicorn workers', ['gunicorn', 'portfolio.asgi:application', '-c', 'portfolio/gunicorn_asgi.py']),
+        ):
+            port = free_port()
+            server = start_server(
+                [sys.executable, '-m', *command, '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}',
+                 '--timeout', '120'], port, env)
+            try:
+                check_login(f'http://127.0.0.1:{port}', cookie)
+                load(f'http://127.0.0.1:{port}', cookie, 2, 2)  # warm up imports and the ticker snapshot
+                latencies, errors = load(f'http://127.0.0.1:{port}', cookie, args.users, args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+            rows.append([label, len(latencies), f'{len(latencies) / args.seconds:.1f}',
+                         f'{percentile(latencies, 50) * 1000:.0f}', f'{percentile(latencies, 95) * 1000:.0f}',
+                         len(errors)])
+
+        print(f"{args.users} users, {args.workers} workers, {args.upstream_ms:g} ms upstream, {args.seconds:g}s\n")
+        print_table(['server', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'errors'], rows)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Throughput of N orders submitted one POST at a time to ``trade_asset``
+versus one POST to ``trade_batch``.
+
+    python -m benchmarks.batch_orders --orders 1000
+"""
+import argparse
+import json
+import random
+
+from .common import count_queries, print_table, setup, test_database, timed
+
+
+def make_orders(count, symbols, seed=42):
+    rng = random.Random(seed)
+    return [{
+        'symbol': f'SYM{rng.randrange(symbols)}',
+        'transaction_type': 'BUY',
+        'quantity': str(rng.randint(1, 10)),
+        'price': f'{rng.uniform(1, 100):.2f}',
+    } for _ in range(count)]
+
+
+def reset_account(user, balance):
+    from trading_portfolio.models import PortfolioPosition, Transaction, UserProfile
+
+    Transaction.objects.all().delete()
+    PortfolioPosition.objects.all().delete()
+    UserProfile.objects.filter(user=user).update(account_balance=balance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--symbols', type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from django.test import Client
+
+        from trading_portfolio.models import Transaction
+
+        balance = 10 ** 9
+        user = User.objects.create_user('bench', password='bench-pass-123')
+        orders = make_orders(args.orders, args.symbols)
+        client = Client()
+        client.force_login(user)
+
+        reset_account(user, balance)
+        with count_queries() as loop_queries:
+            loop_seconds, _ = timed(lambda: [client.post('/trade_asset/', order) for order in orders])
+        assert Transaction.objects.count() == args.orders
+
+        reset_account(user, balance)
+        with count_queries() as batch_queries:
+            batch_seconds, response = timed(
+                client.post, '/trade_batch/', json.dumps(orders), content_type='application/json')
+        assert response.json()['filled'] == args.orders
+
+        print(f"{args.orders} orders over {args.symbols} symbols on {connection.vendor}\n")
+        print_table(
+            ['mode', 'seconds', 'orders/s', 'queries'],
+            [
+                ['trade_asset loop', f'{loop_seconds:.3f}', f'{args.orders / loop_seconds:,.0f}',
+                 len(loop_queries)],
+                ['trade_batch', f'{batch_seconds:.3f}', f'{args.orders / batch_seconds:,.0f}',
+                 len(batch_queries)],
+            ],
+        )
+        print(f"\nspeedup: {loop_seconds / batch_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
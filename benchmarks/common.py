@@ -0,0 +1,81 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway test database created from the configured
+``DATABASES['default']`` (``test_<NAME>``), exactly like ``manage.py test``.
+Run them from the project root, e.g. ``python -m benchmarks.batch_orders``.
+"""
+import contextlib
+import os
+import time
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio.settings')
+    django.setup()
+    # the create_portfolio post_save receiver lives in views.py
+    import trading_portfolio.views  # noqa: F401
+
+
+@contextlib.contextmanager
+def test_database(verbosity=0):
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+class QueryCounter:
+    """Counts SQL statements via ``connection.execute_wrapper`` (unlike ``connection.queries``, not capped at 9000)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return self.count
+
+
+@contextlib.contextmanager
+def count_queries():
+    from django.db import connection
+
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def timed(func, *args, **kwargs):
+    """Call ``func`` and return ``(seconds, result)``."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_table(headers, rows):
+    rows = [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(str(h)), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print('  '.join(cell.ljust(w) for cell, w in zip(row, widths)))
@@ -0,0 +1,111 @@
+"""
+Synthetic data for benchmarks: users with profiles and portfolios, assets and
+a trade history, written with ``bulk_create`` in chunks.
+
+The same arguments and seed always produce the same rows. Prices follow
+``FakeProvider`` (``MARKET_DATA_PROVIDER = 'fake'``), so the dashboard and
+the charts agree with the history. Sells never exceed the holding. Positions
+and the cost basis ledger are derived from the generated history, so trades
+placed on top of it behave like on real accounts. Every user shares one
+password, which is hashed once.
+
+Used by ``benchmarks.load``. Run on its own to fill the configured database,
+for example a local copy to try the site with realistic volumes:
+
+    python -m benchmarks.data --users 1000 --assets 200 --transactions 1000000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from .common import setup, timed
+
+PASSWORD = 'bench-password-123'
+CHUNK = 5000
+HISTORY_DAYS = 730
+
+
+def generate(users=100, assets=50, transactions=10000, seed=0, prefix='bench', password=PASSWORD):
+    """Create the data set and return ``{'users': [...], 'symbols': [...], 'password': ...}``."""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    from trading_portfolio.ledger import rebuild
+    from trading_portfolio.models import Asset, Portfolio, PortfolioPosition, Transaction, UserProfile
+    from trading_portfolio.providers import FakeProvider
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+    hashed = make_password(password)
+    usernames = [f'{prefix}{i:06d}' for i in range(users)]
+    User.objects.bulk_create([User(username=name, email=f'{name}@example.com', password=hashed, date_joined=now)
+                              for name in usernames], batch_size=1000)
+    # fetched back because MySQL does not return the primary keys of bulk inserts
+    user_ids = list(User.objects.filter(username__in=usernames).order_by('id').values_list('id', flat=True))
+    UserProfile.objects.bulk_create([
+        UserProfile(user_id=user_id, account_balance=Decimal(rng.randrange(10_000, 1_000_000)))
+        for user_id in user_ids
+    ], batch_size=1000)
+    Portfolio.objects.bulk_create([Portfolio(user_id=user_id) for user_id in user_ids], batch_size=1000)
+    portfolio_ids = list(Portfolio.objects.filter(user_id__in=user_ids).order_by('id').values_list('id', flat=True))
+
+    symbols = [f'{prefix.upper()}{i:04d}' for i in range(assets)]
+    Asset.objects.bulk_create([Asset(symbol=symbol, name=f'{symbol} Inc.', asset_type='stock') for symbol in symbols],
+                              batch_size=1000)
+    asset_ids = dict(Asset.objects.filter(symbol__in=symbols).values_list('symbol', 'id'))
+    # a few assets are traded far more often than the rest, like real order flow
+    weights = [1 / (rank + 1) for rank in range(assets)]
+
+    start = now - timedelta(days=HISTORY_DAYS)
+    step = (now - start) / max(transactions, 1)
+    holdings = {}
+    batch = []
+    for i in range(transactions):
+        portfolio_id = rng.choice(portfolio_ids)
+        symbol = rng.choices(symbols, weights)[0]
+        timestamp = start + step * i
+        held = holdings.get((portfolio_id, symbol), 0)
+        quantity = rng.randint(1, 20)
+        if held and rng.random() < 0.4:
+            transaction_type, quantity = 'SELL', min(quantity, held)
+        else:
+            transaction_type = 'BUY'
+        holdings[(portfolio_id, symbol)] = held + (quantity if transaction_type == 'BUY' else -quantity)
+        price = FakeProvider.closes(symbol, int(timestamp.timestamp()) // 60)
+        batch.append(Transaction(portfolio_id=portfolio_id, asset_id=asset_ids[symbol],
+                                 transaction_type=transaction_type, quantity=quantity,
+                                 price=Decimal(f'{price:.4f}'), timestamp=timestamp))
+        if len(batch) == CHUNK:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+
+    PortfolioPosition.objects.bulk_create([
+        PortfolioPosition(portfolio_id=portfolio_id, asset_id=asset_ids[symbol], quantity=quantity)
+        for (portfolio_id, symbol), quantity in holdings.items() if quantity > 0
+    ], batch_size=1000)
+    rebuild(portfolio_ids)
+    return {'users': usernames, 'symbols': symbols, 'password': password}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--assets', type=int, default=50)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefix', default='bench', help="Username and symbol prefix, must not exist yet")
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+
+    seconds, _ = timed(generate, args.users, args.assets, args.transactions, args.seed, args.prefix)
+    print(f"{args.users} users, {args.assets} assets, {args.transactions} transactions "
+          f"written to {connection.vendor} in {seconds:.1f}s (password {PASSWORD!r})")
+
+
+if __name__ == '__main__':
+    main()
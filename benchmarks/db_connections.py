@@ -0,0 +1,112 @@
+"""
+Serve authenticated requests through the WSGI handler with a new database
+connection per request (``CONN_MAX_AGE=0``) versus a persistent, health-checked
+connection, and report connects, time spent connecting and reuse.
+
+SQLite is the local stand-in for the remote MySQL server: its connects are
+nearly free, so ``--handshake-ms`` adds a fixed delay to every new connection
+to model the TCP + TLS + auth round trips to a hosted database. Point
+``DATABASE_URL`` at a local MySQL (with ``--handshake-ms 0``) to measure the
+real handshake instead.
+
+    python -m benchmarks.db_connections --requests 500 --handshake-ms 20
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from .common import percentile, print_table, setup, test_database
+
+
+def environ(path, cookie):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1', 'HTTP_COOKIE': cookie,
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+
+
+def serve(handler, path, cookie, requests):
+    latencies = []
+    for _ in range(requests):
+        statuses = []
+        started = time.perf_counter()
+        response = handler(environ(path, cookie), lambda status, headers: statuses.append(status))
+        b''.join(response)
+        response.close()  # fires request_finished, which closes connections older than CONN_MAX_AGE
+        latencies.append(time.perf_counter() - started)
+        assert statuses[0].startswith('200'), statuses[0]
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--handshake-ms', type=float, default=20.0,
+                        help="Delay added to each new connection (0 for a real remote database)")
+    parser.add_argument('--path', default='/transactions/')
+    args = parser.parse_args()
+
+    setup()
+    from django.db import DEFAULT_DB_ALIAS, connections
+
+    connection = connections[DEFAULT_DB_ALIAS]
+
+    if connection.vendor == 'sqlite':
+        # an in-memory test database is never closed, so connection reuse cannot be observed on it
+        test_name = os.path.join(tempfile.gettempdir(), 'benchmark_db_connections.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+
+    with test_database():
+        from django.contrib.auth.models import User
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.test import Client
+
+        from trading_portfolio.dbstats import InstrumentedConnectionMixin, connection_stats
+
+        if not isinstance(connection, InstrumentedConnectionMixin):
+            raise SystemExit("set DB_INSTRUMENT=True to count connects")
+        if args.handshake_ms:
+            # patch the stock backend underneath the mixin so the delay counts as connect time
+            backend = next(cls for cls in type(connection).__mro__ if 'get_new_connection' in vars(cls)
+                           and cls.__module__.startswith('django.db.backends.'))
+            get_new_connection = backend.get_new_connection
+
+            def slow_connect(self, conn_params):
+                time.sleep(args.handshake_ms / 1000)
+                return get_new_connection(self, conn_params)
+
+            backend.get_new_connection = slow_connect
+
+        user = User.objects.create_user('bench', password='bench-password')
+        client = Client()
+        client.force_login(user)
+        cookie = f"sessionid={client.cookies['sessionid'].value}"
+        handler = WSGIHandler()
+
+        rows = []
+        for label, max_age in (('new connection per request', 0), ('persistent + health checks', 600)):
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            connection.settings_dict['CONN_HEALTH_CHECKS'] = bool(max_age)
+            serve(handler, args.path, cookie, 5)  # warm up imports and caches
+            connection_stats.reset()
+            latencies = serve(handler, args.path, cookie, args.requests)
+            stats = connection_stats.stats()[connection.alias]
+            rows.append([
+                label, f'{sum(latencies):.2f}', f'{percentile(latencies, 50) * 1000:.2f}',
+                f'{percentile(latencies, 95) * 1000:.2f}', stats['connects'], stats['avg_connect_ms'],
+                stats['reuse_ratio'],
+            ])
+        connection.close()
+
+        print(f"{args.requests} x GET {args.path} on {connection.vendor}, "
+              f"{args.handshake_ms:g} ms added per connect\n")
+        print_table(['mode', 'seconds', 'p50 ms', 'p95 ms', 'connects', 'avg connect ms', 'reuse'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Reproducible load test of the main user flows on synthetic data.
+
+Generates users, assets and history with ``benchmarks.data`` in a throwaway
+file database and switches market data to the deterministic ``fake``
+provider. Then, for each scenario, ``--users`` concurrent clients send
+``--requests`` requests each through the full middleware stack:
+
+* ``login``: POST the login form (a fresh session and a password check)
+* ``dashboard``: the authenticated dashboard
+* ``trade``: alternating BUY and SELL of one share through ``trade_asset``
+* ``chart``: a PNG chart of a random asset
+
+Every scenario reports throughput, latency percentiles, and SQL statements
+and provider calls per request. The last two are read from the
+``Server-Timing`` header, so they need ``METRICS_ENABLED``. ``--output``
+saves the results with the commit they were measured on. ``--compare``
+prints the change against an earlier file:
+
+    python -m benchmarks.load --output before.json
+    git checkout my-branch
+    python -m benchmarks.load --compare before.json
+
+Clients are threads in this process, so the numbers compare commits on one
+machine. For server-level concurrency see ``benchmarks.asgi_load``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from .common import percentile, print_table, setup, test_database
+
+SERVER_TIMING = re.compile(r'db;[^,]*desc="(\d+) queries".*upstream;[^,]*desc="(\d+) calls"')
+
+
+def login(client, user, rng, context):
+    from django.test import Client
+
+    response = Client().post('/login/', {'username': user, 'password': context['password']})
+    return response, response.status_code == 302 and response['Location'] == '/dashboard/'
+
+
+def dashboard(client, user, rng, context):
+    response = client.get('/dashboard/')
+    return response, response.status_code == 200
+
+
+def trade(client, user, rng, context):
+    # each client buys a share and sells it back, so balances and positions stay bounded
+    held = context['holdings'].get(user)
+    symbol = held or rng.choice(context['symbols'])
+    response = client.post('/trade_asset/', {'symbol': symbol, 'transaction_type': 'SELL' if held else 'BUY',
+                                             'quantity': '1', 'price': '100'})
+    ok = response.status_code == 302
+    if ok:
+        context['holdings'][user] = None if held else symbol
+    return response, ok
+
+
+def chart(client, user, rng, context):
+    response = client.get(f"/get-chart/{rng.choice(context['symbols'])}/", {'range': '5d', 'interval': '15m'})
+    return response, response.status_code == 200
+
+
+SCENARIOS = {
+    'login': login,
+    'dashboard': dashboard,
+    'trade': trade,
+    'chart': chart,
+}
+
+
+def run_scenario(scenario, clients, requests, context, seed):
+    """Run every client in its own thread; return ``(wall seconds, samples, errors)``."""
+    from django.db import connections
+
+    samples, errors = [], []
+    lock = threading.Lock()
+
+    def worker(index, user, client):
+        rng = random.Random(f'{seed}:{scenario.__name__}:{index}')
+        mine = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                try:
+                    response, ok = scenario(client, user, rng, context)
+                except Exception as e:
+                    with lock:
+                        errors.append(repr(e))
+                    continue
+                elapsed = time.perf_counter() - started
+                if not ok:
+                    with lock:
+                        errors.append(f'HTTP {response.status_code}')
+                    continue
+                timing = SERVER_TIMING.search(response.get('Server-Timing', ''))
+                mine.append((elapsed, *(map(int, timing.groups()) if timing else (None, None))))
+        finally:
+            connections.close_all()
+        with lock:
+            samples.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(i, user, client)) for i, (user, client) in enumerate(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, samples, errors
+
+
+def summarise(seconds, samples, errors):
+    latencies = [sample[0] for sample in samples]
+    queries = [sample[1] for sample in samples if sample[1] is not None]
+    upstream = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'seconds': round(seconds, 3),
+        'throughput': round(len(samples) / seconds, 2) if seconds else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'upstream_per_request': round(sum(upstream) / len(upstream), 2) if upstream else None,
+        'sample_errors': sorted(set(errors))[:5],
+    }
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{revision}-dirty' if dirty else revision
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nagainst {baseline_path} ({baseline['meta'].get('revision')})\n")
+
+    def change(new, old, lower_is_better):
+        if new is None or old in (None, 0):
+            return '-'
+        delta = (new - old) / old
+        worse = delta > 0.05 if lower_is_better else delta < -0.05
+        return f"{delta:+.1%}{' !' if worse else ''}"
+
+    rows = []
+    for name, now in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        rows.append([name, change(now['throughput'], before['throughput'], False),
+                     change(now['p50_ms'], before['p50_ms'], True), change(now['p95_ms'], before['p95_ms'], True),
+                     f"{before['queries_per_request']} -> {now['queries_per_request']}"])
+    print_table(['scenario', 'req/s', 'p50', 'p95', 'queries/request'], rows)
+    print("\n! = more than 5% worse")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--users', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--requests', type=int, default=25, help="Requests per client per scenario")
+    parser.add_argument('--data-users', type=int, default=200)
+    parser.add_argument('--assets', type=int, default=50)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--upstream-ms', type=float, default=0, help="Delay per market data call")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fast-passwords', action='store_true',
+                        help="Hash passwords with MD5 so login measures the app instead of PBKDF2")
+    parser.add_argument('--output', help="Write the results as JSON")
+    parser.add_argument('--compare', help="Results JSON from an earlier run")
+    args = parser.parse_args()
+    names = args.scenarios.split(',')
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.users > args.data_users:
+        parser.error("--users cannot exceed --data-users")
+
+    setup()
+    from django.conf import settings
+    from django.db import DEFAULT_DB_ALIAS, connections
+    from django.test import Client, override_settings
+
+    from .data import generate
+
+    overrides = {'MARKET_DATA_PROVIDER': 'fake', 'MARKET_DATA_FAKE_LATENCY_MS': args.upstream_ms,
+                 'QUOTE_CACHE_BACKGROUND_REFRESH': False}
+    if args.fast_passwords:
+        overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == 'sqlite':
+        # the client threads need a database they can all open, and concurrent writers need
+        # transactions that take the write lock up front instead of failing when they upgrade to it
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tempfile.gettempdir(),
+                                                                            'benchmark_load.sqlite3')
+        connection.settings_dict['OPTIONS'].setdefault('transaction_mode', 'IMMEDIATE')
+
+    with test_database(), override_settings(**overrides):
+        from django.core.cache import caches
+
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        data = generate(args.data_users, args.assets, args.transactions, args.seed)
+        context = {'password': data['password'], 'symbols': data['symbols'], 'holdings': {}}
+        clients = []
+        for user in data['users'][:args.users]:
+            client = Client()
+            client.login(username=user, password=data['password'])
+            clients.append((user, client))
+
+        results = {}
+        for name in names:
+            scenario = SCENARIOS[name]
+            run_scenario(scenario, clients[:1], 2, context, args.seed)  # warm up imports, templates and caches
+            results[name] = summarise(*run_scenario(scenario, clients, args.requests, context, args.seed))
+
+        meta = {
+            'revision': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': connection.vendor,
+            'argv': sys.argv[1:],
+            **{key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        }
+
+    print(f"{args.users} clients x {args.requests} requests per scenario on {meta['database']}, "
+          f"{args.data_users} users / {args.assets} assets / {args.transactions} transactions, "
+          f"{args.upstream_ms:g} ms upstream, revision {meta['revision']}\n")
+    print_table(['scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries/req',
+                 'upstream/req'],
+                [[name, r['requests'], r['errors'], r['throughput'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+                  r['queries_per_request'], r['upstream_per_request']] for name, r in results.items()])
+    for name, r in results.items():
+        if r['sample_errors']:
+            print(f"{name} errors: {'; '.join(r['sample_errors'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+        print(f"\nwrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Cost of the request metrics: the same authenticated requests through the WSGI
+handler with ``METRICS_ENABLED`` on and off.
+
+With metrics on, every request pays for the ``Server-Timing`` header, the
+histogram update and one timing per SQL statement and template render. With
+metrics off, neither the middleware nor the template backend is installed and
+no execute wrapper is added. Rounds alternate which handler goes first so
+drift (thermal, caches, a growing database) hits both equally.
+
+    python -m benchmarks.metrics_overhead --requests 2000 --rounds 5
+"""
+import argparse
+import statistics
+
+from .common import print_table, setup, test_database
+from .db_connections import serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per handler per round")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--path', default='/transactions/')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.db import DEFAULT_DB_ALIAS, connections
+
+    connection = connections[DEFAULT_DB_ALIAS]
+
+    with test_database():
+        from django.contrib.auth.models import User
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.test import Client, override_settings
+
+        from trading_portfolio import metrics
+        from trading_portfolio.models import Asset, Portfolio, Transaction
+
+        user = User.objects.create_user('bench', password='bench-password')
+        asset = Asset.objects.create(symbol='AAPL', name='Apple', asset_type='stock')
+        portfolio = Portfolio.objects.get(user=user)
+        Transaction.objects.bulk_create([
+            Transaction(portfolio=portfolio, asset=asset, transaction_type='BUY', quantity=1, price=100 + i)
+            for i in range(50)
+        ])
+        client = Client()
+        client.force_login(user)
+        cookie = f"sessionid={client.cookies['sessionid'].value}"
+
+        stock_templates = [{**settings.TEMPLATES[0], 'BACKEND': 'django.template.backends.django.DjangoTemplates'}]
+        enabled = WSGIHandler()
+        with override_settings(METRICS_ENABLED=False, TEMPLATES=stock_templates):
+            disabled = WSGIHandler()
+
+        def run(handler, on):
+            if on:
+                metrics.install_query_timer(connection)
+                return serve(handler, args.path, cookie, args.requests)
+            connection.execute_wrappers[:] = [w for w in connection.execute_wrappers if w is not metrics.time_query]
+            with override_settings(METRICS_ENABLED=False, TEMPLATES=stock_templates):
+                return serve(handler, args.path, cookie, args.requests)
+
+        # warm up imports, templates and the connection
+        run(enabled, True)
+        run(disabled, False)
+        means = {True: [], False: []}
+        for round_number in range(args.rounds):
+            order = ((False, disabled), (True, enabled))
+            for on, handler in order if round_number % 2 else reversed(order):
+                means[on].append(statistics.fmean(run(handler, on)))
+        metrics.install_query_timer(connection)
+
+        off, on = statistics.median(means[False]), statistics.median(means[True])
+        print(f"{args.rounds} rounds x {args.requests} x GET {args.path} on {connection.vendor}\n")
+        print_table(['metrics', 'median mean ms', 'best mean ms', 'overhead'], [
+            ['off', f'{off * 1000:.3f}', f'{min(means[False]) * 1000:.3f}', ''],
+            ['on', f'{on * 1000:.3f}', f'{min(means[True]) * 1000:.3f}', f'{(on - off) / off:+.2%}'],
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Order book throughput with ``--orders`` resting limit and stop orders.
+
+Creates ``--users`` accounts and ``--orders`` open orders on ``--assets``
+assets. Orders that trigger on a falling price sit below 100 and the others
+above it. The benchmark then times:
+
+- the rebuild after a restart (``OrderBook.sync`` on an empty book);
+- quotes at 100 that trigger nothing;
+- placing and cancelling orders in memory;
+- sweeping every asset down and up, which triggers every order.
+
+Finally it fills ``--fills`` BUY limits through ``orders.execute``, the
+database path ``match_quotes`` takes for each triggered order.
+
+    python -m benchmarks.order_book --orders 100000 --assets 500 --users 1000
+"""
+import argparse
+import random
+from decimal import Decimal
+
+from .common import count_queries, print_table, setup, test_database, timed
+
+KINDS = [('BUY', 'limit'), ('SELL', 'stop'), ('SELL', 'limit'), ('BUY', 'stop')]
+
+
+def populate(users, assets, orders, seed):
+    from trading_portfolio.models import Asset, Order, Portfolio
+    from trading_portfolio.orders import falls
+    from trading_portfolio.provisioning import provision
+
+    rng = random.Random(seed)
+    provision(({'username': f'book{i:06d}'} for i in range(users)), password='bench-password-123')
+    portfolio_ids = list(Portfolio.objects.values_list('id', flat=True))
+    Asset.objects.bulk_create([Asset(symbol=f'BOOK{i:04d}', name=f'BOOK{i:04d}', asset_type='stock')
+                               for i in range(assets)])
+    asset_ids = list(Asset.objects.filter(symbol__startswith='BOOK').values_list('id', flat=True))
+
+    rows = []
+    for _ in range(orders):
+        transaction_type, order_type = rng.choice(KINDS)
+        cents = rng.randint(9000, 9999) if falls(transaction_type, order_type) else rng.randint(10001, 11000)
+        rows.append(Order(portfolio_id=rng.choice(portfolio_ids), asset_id=rng.choice(asset_ids),
+                          transaction_type=transaction_type, order_type=order_type, quantity=1,
+                          price=Decimal(cents) / 100))
+    Order.objects.bulk_create(rows, batch_size=5000)
+    return asset_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=100, help="Quotes per asset that trigger nothing")
+    parser.add_argument('--churn', type=int, default=10000, help="Orders placed and cancelled in memory")
+    parser.add_argument('--fills', type=int, default=500, help="Orders filled through the database")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup()
+    with test_database():
+        from trading_portfolio.models import Order
+        from trading_portfolio.orders import OrderBook, execute
+
+        seconds, asset_ids = timed(populate, args.users, args.assets, args.orders, args.seed)
+        print(f"{args.orders} open orders on {args.assets} assets for {args.users} accounts, "
+              f"created in {seconds:.1f}s\n")
+        rows = []
+
+        def row(step, events, seconds, queries=0):
+            rows.append([step, events, f'{seconds:.3f}', f'{seconds / max(events, 1) * 1e6:.2f}',
+                         f'{events / seconds:,.0f}' if seconds else '-', queries])
+
+        book = OrderBook()
+        with count_queries() as queries:
+            seconds, loaded = timed(book.sync)
+        row('rebuild from the table', loaded, seconds, len(queries))
+
+        flat = Decimal('100.00')
+        seconds, triggered = timed(lambda: sum(len(book.match(asset_id, flat))
+                                               for _ in range(args.ticks) for asset_id in asset_ids))
+        assert triggered == 0
+        row('quote, nothing triggered', args.ticks * len(asset_ids), seconds)
+
+        rng = random.Random(args.seed)
+        churn = [(10 ** 9 + i, rng.choice(asset_ids), rng.random() < 0.5, Decimal(rng.randint(9000, 9999)) / 100)
+                 for i in range(args.churn)]
+        seconds, _ = timed(lambda: [book.add(*order) for order in churn])
+        row('place', len(churn), seconds)
+        seconds, _ = timed(lambda: [book.remove(order[0]) for order in churn])
+        row('cancel', len(churn), seconds)
+
+        resting = len(book)
+        seconds, swept = timed(lambda: sum(len(book.match(asset_id, price))
+                                           for price in (Decimal('89'), Decimal('111')) for asset_id in asset_ids))
+        assert swept == resting == args.orders, (swept, resting)
+        row('sweep, every order triggered', swept, seconds)
+
+        sample = list(Order.objects.filter(transaction_type='BUY', order_type='limit')
+                      .values_list('id', flat=True)[:args.fills])
+        with count_queries() as queries:
+            seconds, statuses = timed(lambda: [execute(order_id, Decimal('89')) for order_id in sample])
+        assert statuses.count('filled') == len(sample), statuses
+        row('fill through the trade path', len(sample), seconds, len(queries))
+
+    print_table(['step', 'events', 'seconds', 'us per event', 'events/s', 'queries'], rows)
+
+
+if __name__ == '__main__':
+    main()
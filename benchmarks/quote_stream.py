@@ -0,0 +1,143 @@
+"""
+Quote stream fan-out: N subscribers on one symbol set, fed by the fake feed.
+
+In-process by default: the hub, its poller and one consumer task per
+subscriber share an event loop, so the numbers are the per-tick fan-out cost
+without sockets. ``--url`` opens real SSE connections instead, against a
+running ASGI server started with ``QUOTE_STREAM_FEED=fake``:
+
+    python -m benchmarks.quote_stream --subscribers 5000 --seconds 10
+    QUOTE_STREAM_FEED=fake gunicorn portfolio.asgi:application -c portfolio/gunicorn_asgi.py -w 1 &
+    python -m benchmarks.quote_stream --subscribers 5000 --url http://127.0.0.1:8000/quotes/stream/
+
+``--slow`` is the fraction of subscribers that never read; they must be
+dropped once their queue is full instead of growing memory.
+"""
+import argparse
+import asyncio
+import resource
+import time
+import urllib.parse
+
+from .common import percentile, print_table, setup
+
+SYMBOLS = ['AAPL', 'MSFT', 'TSLA', 'GOOG', 'AMZN', 'RGTI', 'UBER', 'JEPQ', 'LCID']
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def in_process(args):
+    from trading_portfolio.streaming import QuoteHub, RandomWalkFeed
+
+    feed = RandomWalkFeed(seed=1)
+    polls = 0
+    fan_out = []
+
+    async def timed_feed(symbols):
+        nonlocal polls
+        polls += 1
+        return await feed(symbols)
+
+    hub = QuoteHub(feed=timed_feed)
+    received = [0] * args.subscribers
+    deadline = time.monotonic() + args.seconds
+    slow_every = round(1 / args.slow) if args.slow else 0
+
+    async def consume(index, subscriber):
+        if slow_every and index % slow_every == 0:
+            # never reads: the hub drops it
+            while time.monotonic() < deadline and not subscriber.dropped:
+                await asyncio.sleep(0.1)
+            return
+        while time.monotonic() < deadline:
+            message = await subscriber.next(timeout=1)
+            if message is None:
+                return
+            received[index] += 1
+
+    subscribers = [hub.subscribe(SYMBOLS) for _ in range(args.subscribers)]
+    channel = subscribers[0].channel
+    publish = channel.publish
+
+    def timed_publish(rows):
+        started = time.perf_counter()
+        changed = publish(rows)
+        fan_out.append(time.perf_counter() - started)
+        return changed
+
+    channel.publish = timed_publish
+    await asyncio.gather(*(consume(i, s) for i, s in enumerate(subscribers)))
+    stats = hub.stats()
+    for subscriber in subscribers:
+        hub.unsubscribe(subscriber)
+    return polls, received, stats['dropped'], fan_out
+
+
+async def over_http(args):
+    url = urllib.parse.urlsplit(args.url)
+    received = [0] * args.subscribers
+    failed = 0
+    deadline = time.monotonic() + args.seconds
+
+    async def subscribe(index):
+        nonlocal failed
+        try:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        except OSError:
+            failed += 1
+            return
+        writer.write(f"GET {url.path}?{url.query} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                     f"Accept: text/event-stream\r\n\r\n".encode())
+        try:
+            while time.monotonic() < deadline:
+                line = await asyncio.wait_for(reader.readline(), max(0.1, deadline - time.monotonic()))
+                if not line:
+                    break
+                if line.startswith(b'event: quotes'):
+                    received[index] += 1
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(subscribe(i) for i in range(args.subscribers)))
+    return received, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=0.5, help="Seconds between upstream polls")
+    parser.add_argument('--queue-size', type=int, default=16, help="QUOTE_STREAM_QUEUE_SIZE")
+    parser.add_argument('--slow', type=float, default=0.05, help="Fraction of subscribers that never read")
+    parser.add_argument('--url', help="Stream endpoint of a running ASGI server")
+    args = parser.parse_args()
+
+    if args.url:
+        started = time.perf_counter()
+        received, failed = asyncio.run(over_http(args))
+        live = [count for count in received if count]
+        print(f"{args.subscribers:,} SSE connections to {args.url} for {time.perf_counter() - started:.1f}s\n")
+        print_table(['connected', 'failed', 'updates p50', 'updates min'],
+                    [[len(live), failed, percentile(live, 50), min(live, default=0)]])
+        return
+
+    setup()
+    from django.test.utils import override_settings
+
+    with override_settings(QUOTE_STREAM_INTERVAL=args.interval, QUOTE_STREAM_QUEUE_SIZE=args.queue_size):
+        polls, received, dropped, fan_out = asyncio.run(in_process(args))
+    readers = [count for count in received if count]
+    print(f"{args.subscribers:,} subscribers, one symbol set, {args.interval:g}s ticks, {args.seconds:g}s\n")
+    headers = ['upstream polls', 'fan-out p50 ms', 'fan-out max ms', 'updates per reader', 'dropped', 'max RSS MB']
+    print_table(headers, [[
+        polls, f'{percentile(fan_out, 50) * 1000:.2f}', f'{max(fan_out, default=0) * 1000:.2f}',
+        percentile(readers, 50), dropped, f'{rss_mb():.0f}',
+    ]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Risk scoring of every portfolio: one vectorised pass against one report at a
+time.
+
+Creates ``--portfolios`` accounts (``provisioning.provision``) holding
+``--holdings`` of ``--assets`` assets each (popular assets more often), plus
+``--days`` daily bars per asset and the benchmark from ``FakeProvider``
+prices. It then times ``analyse()`` over all portfolios, which loads one close
+matrix and does one matrix product per chunk. It also times
+``--sample`` portfolios scored one by one (``analyse([id])``, what the
+endpoint does on a cache miss) and extrapolates that to all of them.
+
+    python -m benchmarks.risk --portfolios 10000 --assets 500 --holdings 12
+"""
+import argparse
+import random
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+
+from .common import count_queries, print_table, setup, test_database, timed
+
+
+def populate(portfolios, assets, holdings, days, seed):
+    from trading_portfolio.models import Asset, Portfolio, PortfolioPosition, PriceBar
+    from trading_portfolio.providers import FakeProvider
+    from trading_portfolio.provisioning import provision
+
+    rng = random.Random(seed)
+    provision(({'username': f'risk{i:06d}'} for i in range(portfolios)), password='bench-password-123')
+    portfolio_ids = list(Portfolio.objects.order_by('id').values_list('id', flat=True))
+
+    symbols = ['SPY'] + [f'RISK{i:04d}' for i in range(assets)]
+    Asset.objects.bulk_create([Asset(symbol=symbol, name=symbol, asset_type='stock') for symbol in symbols])
+    asset_ids = dict(Asset.objects.filter(symbol__in=symbols).values_list('symbol', 'id'))
+    today = datetime.combine(datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc)
+    bars = []
+    for symbol in symbols:
+        for day in range(days):
+            stamp = today - timedelta(days=days - 1 - day)
+            close = Decimal(f"{FakeProvider.closes(symbol, int(stamp.timestamp()) // 60):.4f}")
+            bars.append(PriceBar(asset_id=asset_ids[symbol], interval='1d', timestamp=stamp, open=close, high=close,
+                                 low=close, close=close))
+    PriceBar.objects.bulk_create(bars, batch_size=5000)
+
+    weights = [1 / (rank + 1) for rank in range(assets)]
+    positions = []
+    for portfolio_id in portfolio_ids:
+        chosen = set()
+        while len(chosen) < holdings:
+            chosen.add(rng.choices(symbols[1:], weights)[0])
+        positions.extend(PortfolioPosition(portfolio_id=portfolio_id, asset_id=asset_ids[symbol],
+                                           quantity=rng.randint(1, 100)) for symbol in chosen)
+    PortfolioPosition.objects.bulk_create(positions, batch_size=5000)
+    return portfolio_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--portfolios', type=int, default=10000)
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--holdings', type=int, default=12)
+    parser.add_argument('--days', type=int, default=370, help="Calendar days of daily bars")
+    parser.add_argument('--sample', type=int, default=200, help="Portfolios scored one at a time")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup()
+    from django.test import override_settings
+
+    with test_database(), override_settings(RISK_BENCHMARK='SPY', RISK_LOOKBACK_DAYS=252):
+        from trading_portfolio.registry import asset_registry
+        from trading_portfolio.risk import analyse
+
+        seconds, portfolio_ids = timed(populate, args.portfolios, args.assets, args.holdings, args.days, args.seed)
+        print(f"{args.portfolios} portfolios x {args.holdings} holdings of {args.assets} assets, "
+              f"{args.days} daily bars each, created in {seconds:.1f}s\n")
+
+        asset_registry.clear()
+        analyse(portfolio_ids[:1]).__next__()  # warm the registry and imports
+        rows = []
+        with count_queries() as queries:
+            seconds, reports = timed(lambda: list(analyse()))
+        rows.append(['all at once', len(reports), len(queries), f'{seconds:.2f}',
+                     f'{seconds / len(reports) * 1000:.3f}', f'{seconds:.1f}'])
+
+        sample = portfolio_ids[:args.sample]
+        with count_queries() as queries:
+            seconds, singles = timed(lambda: [next(analyse([portfolio_id])) for portfolio_id in sample])
+        rows.append(['one at a time', len(singles), len(queries), f'{seconds:.2f}',
+                     f'{seconds / len(singles) * 1000:.3f}', f'{seconds / len(singles) * args.portfolios:.1f}'])
+        assert singles == reports[:len(singles)], "batched and single reports differ"
+
+    print_table(['mode', 'portfolios', 'queries', 'seconds', 'ms per portfolio', f'seconds for {args.portfolios}'],
+                rows)
+
+
+if __name__ == '__main__':
+    main()
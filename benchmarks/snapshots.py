@@ -0,0 +1,102 @@
+"""
+Backfill two years of daily equity snapshots: vectorised ``backfill()`` versus
+a day-by-day ORM loop (one holdings aggregate and one price query per day).
+
+    python -m benchmarks.snapshots --portfolios 500 --trades 100 --days 730
+"""
+import argparse
+import random
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from .common import count_queries, print_table, setup, test_database, timed
+from .valuation import create_accounts
+
+
+def create_history(portfolio_ids, assets, trades, days, rng):
+    from trading_portfolio.models import PriceBar, Transaction
+
+    start = datetime.combine(datetime.now(dt_timezone.utc).date() - timedelta(days=days - 1), time(15),
+                             tzinfo=dt_timezone.utc)
+    PriceBar.objects.bulk_create([
+        PriceBar(asset=asset, interval='1d', timestamp=start + timedelta(days=day), open=price, high=price,
+                 low=price, close=price, volume=1000)
+        for asset in assets for day, price in enumerate(random_walk(rng, days))
+    ], batch_size=2000)
+
+    batch = []
+    for portfolio_id in portfolio_ids:
+        for _ in range(trades):
+            batch.append(Transaction(portfolio_id=portfolio_id, asset=rng.choice(assets), transaction_type='BUY',
+                                     quantity=Decimal(rng.randint(1, 20)), price=Decimal('10'),
+                                     timestamp=start + timedelta(days=rng.randrange(days))))
+        if len(batch) >= 20000:
+            Transaction.objects.bulk_create(batch, batch_size=1000)
+            batch = []
+    Transaction.objects.bulk_create(batch, batch_size=1000)
+    return start.date()
+
+
+def random_walk(rng, days):
+    price = 100.0
+    for _ in range(days):
+        price = max(1.0, price * (1 + rng.gauss(0, 0.02)))
+        yield round(price, 2)
+
+
+def day_by_day(first_day, days):
+    """The loop the backfill replaces: aggregate holdings and look up prices once per day."""
+    from django.db.models import Sum
+
+    from trading_portfolio.models import PriceBar, Transaction
+
+    equity = defaultdict(dict)
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        closes = dict(PriceBar.objects.filter(interval='1d', timestamp__date=day).values_list('asset_id', 'close'))
+        holdings = (Transaction.objects.filter(timestamp__date__lte=day)
+                    .values('portfolio_id', 'asset_id').annotate(quantity=Sum('quantity')))
+        for row in holdings:
+            value = row['quantity'] * closes.get(row['asset_id'], 0)
+            equity[row['portfolio_id']][day] = equity[row['portfolio_id']].get(day, 0) + value
+    return equity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--portfolios', type=int, default=500)
+    parser.add_argument('--trades', type=int, default=100, help="Trades per portfolio")
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--assets', type=int, default=50)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    setup()
+    with test_database():
+        from django.db import connection
+
+        from trading_portfolio.models import Asset
+        from trading_portfolio.snapshots import backfill
+
+        assets = Asset.objects.bulk_create(
+            [Asset(symbol=f'SYM{i}', name=f'Symbol {i}', asset_type='stock') for i in range(args.assets)])
+        portfolio_ids = create_accounts(args.portfolios)
+        seconds, first_day = timed(create_history, portfolio_ids, assets, args.trades, args.days, rng)
+        print(f"created {args.portfolios:,} portfolios x {args.trades} trades over {args.days} days "
+              f"in {seconds:.1f}s on {connection.vendor}\n")
+
+        with count_queries() as vectorised_queries:
+            vectorised, written = timed(backfill, provider='database')
+        with count_queries() as loop_queries:
+            loop, _ = timed(day_by_day, first_day, args.days)
+
+        print_table(['method', 'seconds', 'queries'], [
+            ['backfill() incl. writing snapshots', f'{vectorised:.2f}', len(vectorised_queries)],
+            ['day-by-day ORM loop, no writes', f'{loop:.2f}', len(loop_queries)],
+        ])
+        print(f"\n{written:,} snapshots written")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Worker boot cost: import time and memory after loading the URLconf.
+
+Each scenario runs in a fresh interpreter under ``python -X importtime``:
+
+* ``lazy``: what a worker loads now (settings, models, views, URLconf).
+* ``eager``: the same plus ``warm_up()``, i.e. what every worker used to
+  import when views.py pulled in yfinance, pandas and matplotlib at import time.
+* ``preload``: ``eager`` in a parent process that then forks, like
+  ``gunicorn --preload`` with the ``when_ready`` hook; the memory columns
+  are the forked worker's, whose heavy pages are shared with the master.
+
+    python -m benchmarks.startup
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+from .common import print_table
+
+PACKAGES = ('numpy', 'pandas', 'yfinance', 'matplotlib')
+
+SCENARIO = r'''
+import gc, json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import portfolio.urls  # noqa
+if MODE in ('eager', 'preload'):
+    # plain import statements: -X importtime does not log importlib.import_module()
+    import numpy, pandas, yfinance, matplotlib.figure  # noqa
+    from trading_portfolio.warmup import warm_up
+    warm_up()
+boot = time.perf_counter() - started
+
+def memory():
+    with open('/proc/self/smaps_rollup') as f:
+        kb = {k: int(v.split()[0]) for k, v in (line.split(':', 1) for line in f if ':' in line and 'kB' in line)}
+    return kb['Rss'] / 1024, (kb['Private_Clean'] + kb['Private_Dirty']) / 1024
+
+def report():
+    rss, private = memory()
+    heavy = [name for name in ('pandas', 'yfinance', 'matplotlib') if name in sys.modules]
+    print(json.dumps({'boot': boot, 'rss': rss, 'private': private, 'heavy': heavy}), flush=True)
+
+if MODE == 'preload':
+    gc.freeze()
+    pid = os.fork()
+    if pid == 0:
+        report()
+        os._exit(0)
+    os.waitpid(pid, 0)
+else:
+    report()
+'''
+
+
+def run(mode):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'portfolio.settings')}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'MODE = {mode!r}\n' + SCENARIO],
+                            env=env, capture_output=True, text=True, check=True)
+    metrics = json.loads(result.stdout.strip().splitlines()[-1])
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$', line)
+        if match and match.group(2) in PACKAGES:
+            cumulative[match.group(2)] = int(match.group(1)) / 1e6
+    return metrics, cumulative
+
+
+def main():
+    rows = []
+    for mode in ('lazy', 'eager', 'preload'):
+        metrics, cumulative = run(mode)
+        rows.append([
+            mode, f"{metrics['boot']:.2f}", *(f"{cumulative.get(name, 0):.2f}" for name in PACKAGES),
+            f"{metrics['rss']:.0f}", f"{metrics['private']:.0f}", ','.join(metrics['heavy']) or '-',
+        ])
+    print_table(['scenario', 'boot s', *(f'{name} s' for name in PACKAGES), 'RSS MB', 'private MB',
+                 'heavy modules loaded'], rows)
+    print("\nimport columns are -X importtime cumulative seconds; 'preload' memory is measured in the forked worker")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Symbol autocomplete: the in-memory prefix index against the database queries
+it replaces.
+
+Generates ``--instruments`` synthetic instruments (symbols of one to five
+letters, names drawn from a word list), builds the index and reports its build
+time and memory (``tracemalloc``). Then it times ``--queries`` lookups typed
+the way people type them: one to four letters of a symbol or of a name word,
+sometimes two words. The same queries go through ``symbol__istartswith`` /
+``name__icontains`` on an ``Asset`` table holding the instruments.
+
+    python -m benchmarks.symbol_search --instruments 100000 --queries 5000
+"""
+import argparse
+import random
+import string
+import time
+import tracemalloc
+
+from .common import percentile, print_table, setup, test_database, timed
+
+WORDS = ('Acme', 'Advanced', 'Alpha', 'American', 'Atlantic', 'Bancorp', 'Bio', 'Capital', 'Cloud', 'Dynamics',
+         'Energy', 'Financial', 'First', 'Global', 'Health', 'Holdings', 'Income', 'Industries', 'International',
+         'Label', 'Medical', 'Micro', 'National', 'Networks', 'Northern', 'Pacific', 'Partners', 'Pharma', 'Power',
+         'Realty', 'Resources', 'Semiconductor', 'Solar', 'Systems', 'Technologies', 'Therapeutics', 'Trust',
+         'United', 'Ventures', 'Water')
+
+
+def instruments(count, seed):
+    rng = random.Random(seed)
+    listing = {}
+    while len(listing) < count:
+        symbol = ''.join(rng.choices(string.ascii_uppercase, k=rng.choice((1, 2, 3, 3, 4, 4, 4, 5))))
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        # a made up word per name so name prefixes are as varied as real ones
+        invented = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))).title()
+        listing.setdefault(symbol, (' '.join([invented, *words, 'Inc.']), 'stock'))
+    return listing
+
+
+def queries(listing, count, seed):
+    rng = random.Random(seed)
+    symbols = list(listing)
+    typed = []
+    for _ in range(count):
+        symbol = rng.choice(symbols)
+        words = listing[symbol][0].split()
+        kind = rng.random()
+        if kind < 0.5:
+            typed.append(symbol[:rng.randint(1, len(symbol))])
+        elif kind < 0.85:
+            typed.append(rng.choice(words[:-1])[:rng.randint(1, 4)])
+        else:
+            typed.append(f'{words[0]} {words[1][:rng.randint(1, 3)]}')
+    return typed
+
+
+def latencies(search, typed):
+    samples = []
+    for query in typed:
+        started = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--instruments', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.db.models import Q
+
+    from trading_portfolio.models import Asset
+    from trading_portfolio.search import SymbolIndex
+
+    listing = instruments(args.instruments, args.seed)
+    typed = queries(listing, args.queries, args.seed)
+
+    index = SymbolIndex()
+    tracemalloc.start()
+    build_seconds, _ = timed(index.load, listing, [])
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # built, so lookups do not check the (absent) table; the database run below measures that cost
+    index.ensure_ready = lambda: None
+
+    rows = []
+    # the first pass fills the memo of short prefixes, the second is steady state
+    for label in ('index, cold memo', 'index, warm'):
+        samples = latencies(lambda query: index.search(query, args.limit), typed)
+        rows.append([label, *(f'{percentile(samples, p) * 1000:.3f}' for p in (50, 95, 99)),
+                     f'{max(samples) * 1000:.3f}'])
+
+    with test_database():
+        Asset.objects.bulk_create([Asset(symbol=symbol, name=name, asset_type=asset_type)
+                                   for symbol, (name, asset_type) in listing.items()], batch_size=5000)
+
+        def query_database(query):
+            word = query.split()[0]
+            return list(Asset.objects.filter(Q(symbol__istartswith=word) | Q(name__icontains=word))
+                        .values_list('symbol', 'name')[:args.limit])
+
+        samples = latencies(query_database, typed[:max(1, args.queries // 10)])
+        rows.append([f'{connection.vendor} istartswith/icontains', *(f'{percentile(samples, p) * 1000:.3f}'
+                                                                     for p in (50, 95, 99)),
+                     f'{max(samples) * 1000:.3f}'])
+
+    print(f"{len(listing)} instruments, {index.stats()['tokens']} tokens: built in {build_seconds:.2f}s, "
+          f"{memory / 2 ** 20:.1f} MiB; {args.queries} queries, limit {args.limit}\n")
+    print_table(['lookup', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Transaction history page latency as one portfolio's history grows.
+
+Compares the keyset cursor (first page and a page 90% deep) with the
+OFFSET pagination a plain Paginator would do.
+
+    python -m benchmarks.transaction_history --sizes 1000,10000,100000,1000000
+"""
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+
+from .common import print_table, setup, test_database, timed
+
+CHUNK = 20000
+
+
+def grow_history(portfolio, assets, start_count, target):
+    from trading_portfolio.models import Transaction
+
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    for offset in range(start_count, target, CHUNK):
+        Transaction.objects.bulk_create([
+            Transaction(portfolio=portfolio, asset=assets[i % len(assets)],
+                        transaction_type='BUY' if i % 2 else 'SELL', quantity=1, price=100,
+                        timestamp=start + timedelta(seconds=i))
+            for i in range(offset, min(offset + CHUNK, target))
+        ], batch_size=1000)
+
+
+def median_ms(func, repeat):
+    return statistics.median(timed(func)[0] for _ in range(repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    setup()
+    with test_database():
+        from django.contrib.auth.models import User
+        from django.db import connection
+
+        from trading_portfolio.history import encode_cursor, transaction_page
+        from trading_portfolio.models import Asset, Transaction
+
+        user = User.objects.create_user('bench', password='bench-pass-123')
+        portfolio = user.portfolio
+        assets = Asset.objects.bulk_create(
+            [Asset(symbol=f'SYM{i}', name=f'Symbol {i}', asset_type='stock') for i in range(20)])
+
+        rows = []
+        count = 0
+        for size in sizes:
+            grow_history(portfolio, assets, count, size)
+            count = size
+            deep = (Transaction.objects.filter(portfolio=portfolio)
+                    .order_by('-timestamp', '-id')[int(size * 0.9)])
+            deep_cursor = encode_cursor(deep)
+
+            first = median_ms(lambda: transaction_page(portfolio.pk), args.repeat)
+            keyset = median_ms(lambda: transaction_page(portfolio.pk, cursor=deep_cursor), args.repeat)
+            offset = median_ms(lambda: list(
+                Transaction.objects.filter(portfolio=portfolio).select_related('asset')
+                .order_by('-timestamp', '-id')[int(size * 0.9):int(size * 0.9) + 25]), args.repeat)
+            rows.append([f'{size:,}', f'{first:.2f}', f'{keyset:.2f}', f'{offset:.2f}'])
+
+        print(f"median of {args.repeat} runs on {connection.vendor}, 25 rows per page\n")
+        print_table(['rows', 'first page ms', 'keyset @90% ms', 'offset @90% ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
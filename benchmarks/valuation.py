@@ -0,0 +1,101 @@
+"""
+Value every portfolio in one pass: 10k portfolios x 50 positions by default.
+
+Times ``value_portfolios()`` end to end and compares its arithmetic with a
+per-row Decimal loop over the same rows.
+
+    python -m benchmarks.valuation --portfolios 10000 --positions 50
+"""
+import argparse
+import random
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+
+from .common import print_table, setup, test_database, timed
+
+CHUNK = 2000
+
+
+def create_accounts(count):
+    """Users, profiles and portfolios in bulk (bulk_create skips the post_save receivers)."""
+    from django.contrib.auth.models import User
+
+    from trading_portfolio.models import Portfolio, UserProfile
+
+    for offset in range(0, count, CHUNK):
+        users = User.objects.bulk_create(
+            [User(username=f'bench{i}', password='!') for i in range(offset, min(offset + CHUNK, count))])
+        UserProfile.objects.bulk_create([UserProfile(user=user, account_balance=10000) for user in users])
+        Portfolio.objects.bulk_create([Portfolio(user=user) for user in users])
+    return list(Portfolio.objects.values_list('id', flat=True))
+
+
+def create_positions(portfolio_ids, assets, per_portfolio, rng):
+    from trading_portfolio.models import PortfolioPosition
+
+    batch = []
+    for portfolio_id in portfolio_ids:
+        for asset in rng.sample(assets, per_portfolio):
+            batch.append(PortfolioPosition(portfolio_id=portfolio_id, asset=asset,
+                                           quantity=Decimal(rng.randint(1, 500))))
+        if len(batch) >= 20000:
+            PortfolioPosition.objects.bulk_create(batch, batch_size=1000)
+            batch = []
+    PortfolioPosition.objects.bulk_create(batch, batch_size=1000)
+
+
+def decimal_loop(rows, prices):
+    totals = defaultdict(Decimal)
+    for portfolio_id, symbol, quantity in rows:
+        totals[portfolio_id] += quantity * prices[symbol]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--portfolios', type=int, default=10000)
+    parser.add_argument('--positions', type=int, default=50)
+    parser.add_argument('--assets', type=int, default=500)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    setup()
+    with test_database():
+        from django.db import connection
+
+        from trading_portfolio.models import Asset, PortfolioPosition
+        from trading_portfolio.valuation import value_portfolios
+
+        assets = Asset.objects.bulk_create(
+            [Asset(symbol=f'SYM{i}', name=f'Symbol {i}', asset_type='stock') for i in range(args.assets)])
+        prices = {asset.symbol: round(rng.uniform(1, 500), 2) for asset in assets}
+        seconds, portfolio_ids = timed(create_accounts, args.portfolios)
+        seconds += timed(create_positions, portfolio_ids, assets, args.positions, rng)[0]
+        print(f"created {args.portfolios:,} portfolios x {args.positions} positions in {seconds:.1f}s "
+              f"on {connection.vendor}\n")
+
+        vectorised, valuation = timed(value_portfolios, prices=prices, costs={})
+        decimal_prices = {symbol: Decimal(str(price)) for symbol, price in prices.items()}
+        baseline, _ = timed(lambda: decimal_loop(
+            PortfolioPosition.objects.values_list('portfolio_id', 'asset__symbol', 'quantity'), decimal_prices))
+
+        # arithmetic alone, on rows already in memory
+        rows = list(PortfolioPosition.objects.values_list('portfolio_id', 'asset__symbol', 'quantity'))
+        loop, _ = timed(decimal_loop, rows, decimal_prices)
+        slot = np.searchsorted(valuation.portfolios, valuation.portfolio_id)
+        arrays, _ = timed(lambda: np.bincount(slot, weights=valuation.quantity * valuation.price))
+
+        print_table(['step', 'seconds'], [
+            ['value_portfolios() end to end', f'{vectorised:.3f}'],
+            ['per-row Decimal valuation end to end', f'{baseline:.3f}'],
+            ['arithmetic only: NumPy', f'{arrays:.4f}'],
+            ['arithmetic only: Decimal loop', f'{loop:.4f}'],
+        ])
+        print(f"\n{len(valuation.portfolio_id):,} positions valued, "
+              f"total equity {valuation.equity.sum():,.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Upstream cost of per-user watchlists: one provider call per user versus the
+shared per-symbol quote cache with cross-request batching.
+
+``--users`` users, each watching ``--size`` symbols drawn (popular symbols
+more often) from a universe of ``--universe``, load their ticker table at
+the same time from ``--threads`` threads. The provider is the deterministic
+``fake`` one with ``--upstream-ms`` of latency per call.
+
+    python -m benchmarks.watchlists --users 500 --size 15 --universe 300 --threads 32
+"""
+import argparse
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import print_table, setup, timed
+
+from trading_portfolio.providers import FakeProvider
+
+
+class CountingProvider(FakeProvider):
+    calls = 0
+    symbols = 0
+    lock = threading.Lock()
+
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        with CountingProvider.lock:
+            CountingProvider.calls += 1
+            CountingProvider.symbols += len(symbols)
+        return super().get_bars(symbols, period, interval)
+
+    @classmethod
+    def reset(cls):
+        cls.calls = cls.symbols = 0
+
+
+def watchlists(users, size, universe, seed):
+    rng = random.Random(seed)
+    symbols = [f'W{i:04d}' for i in range(universe)]
+    weights = [1 / (rank + 1) for rank in range(universe)]
+    lists = []
+    for _ in range(users):
+        chosen = {}
+        while len(chosen) < size:
+            chosen[rng.choices(symbols, weights)[0]] = None
+        lists.append(list(chosen))
+    return lists
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--size', type=int, default=15)
+    parser.add_argument('--universe', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--upstream-ms', type=float, default=100)
+    parser.add_argument('--window-ms', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.cache import cache
+    from django.test import override_settings
+    from django.utils.module_loading import import_string
+
+    from trading_portfolio.quotes import fetch_quotes, quote_cache
+
+    # the class get_provider() instantiates, not this module's copy when run as __main__
+    counter = import_string('benchmarks.watchlists.CountingProvider')
+
+    lists = watchlists(args.users, args.size, args.universe, args.seed)
+    distinct = len({symbol for symbols in lists for symbol in symbols})
+
+    rows = []
+    # room for every symbol: LocMemCache culls a third of its entries at 300 by default
+    locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}
+    with override_settings(CACHES={'default': locmem},
+                           MARKET_DATA_PROVIDER='benchmarks.watchlists.CountingProvider',
+                           MARKET_DATA_FAKE_LATENCY_MS=args.upstream_ms, QUOTE_BATCH_WINDOW_MS=args.window_ms,
+                           QUOTE_CACHE_BACKGROUND_REFRESH=False):
+        for label, load in (('one call per user', fetch_quotes), ('per-symbol cache + batching', quote_cache.get)):
+            cache.clear()
+            counter.reset()
+            with ThreadPoolExecutor(args.threads) as pool:
+                seconds, _ = timed(lambda: list(pool.map(load, lists)))
+            rows.append([label, counter.calls, counter.symbols, f'{seconds:.2f}'])
+
+    print(f"{args.users} users x {args.size} symbols ({distinct} distinct of {args.universe}), "
+          f"{args.threads} threads, {args.upstream_ms:g} ms per provider call, {args.window_ms:g} ms window\n")
+    print_table(['mode', 'provider calls', 'symbols fetched', 'seconds'], rows)
+
+
+if __name__ == '__main__':
+    main()
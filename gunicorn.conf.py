@@ -0,0 +1,7 @@
+"""
+Gunicorn settings picked up automatically by ``gunicorn portfolio.wsgi`` (see the Procfile).
+
+Add ``--preload`` (or ``GUNICORN_CMD_ARGS=--preload``) to load the application and the
+heavy market data libraries once in the master, see trading_portfolio/warmup.py.
+"""
+from trading_portfolio.warmup import when_ready  # noqa: F401
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# the quote stream skips the Django request cycle, see trading_portfolio/streaming.py
+from trading_portfolio.streaming import STREAM_PATH, stream_app  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        await stream_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,30 @@
+"""
+Gunicorn profile for serving ``portfolio.asgi`` with uvicorn workers.
+
+    gunicorn portfolio.asgi:application -c portfolio/gunicorn_asgi.py
+
+(in the Procfile: ``web: gunicorn portfolio.asgi:application -c portfolio/gunicorn_asgi.py``)
+
+Each worker runs an event loop, so a request waiting on yfinance or the
+database no longer holds the whole worker: async views overlap upstream
+fetches with ORM reads and push blocking libraries into a pool of
+``ASYNC_BLOCKING_THREADS`` threads. Under ASGI every request's ORM calls run
+in a fresh thread, so persistent connections are never reused and are
+turned off here; on PostgreSQL set ``DB_POOL=True`` instead.
+"""
+import multiprocessing
+import os
+
+from trading_portfolio.warmup import when_ready  # noqa: F401  (warm-up for --preload)
+
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+# one event loop per core is enough, unlike sync workers that need one process per in-flight request
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# uvicorn's concurrency limit; every open quote stream (/quotes/stream/) holds a connection
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 10000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
-from decouple import config
+from django.core.exceptions import ImproperlyConfigured
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,12 +46,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'trading_portfolio.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'trading_portfolio.middleware.SessionActivityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,14 +90,129 @@ DATABASES = {
     #     'HOST': '127.0.0.1',
     #     'PORT': '3306',
     # }
-    'default': dj_database_url.config(default=config('DATABASE_URL'))
+    'default': dj_database_url.config(
+        default=config('DATABASE_URL'),
+        # keep connections open between requests (seconds, 0 = close after each request, None = forever);
+        # health checks ping a reused connection once per request before handing it out
+        conn_max_age=config('DB_CONN_MAX_AGE', default=60, cast=int),
+        conn_health_checks=config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+    )
 }
-# Add Aiven SSL options (mysqlclient expects this format)
-DATABASES["default"]["OPTIONS"] = {
-    "ssl": {
-        "ca": os.path.join(BASE_DIR, "ca.pem")  # correct
+DB_VENDOR = DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]
+
+if DB_VENDOR == 'mysql':
+    # Add Aiven SSL options (mysqlclient expects this format)
+    DATABASES["default"]["OPTIONS"] = {
+        "ssl": {
+            "ca": os.path.join(BASE_DIR, "ca.pem")  # correct
+        }
     }
-}
+
+# Connection pool (psycopg 3 only). Meant for ASGI, where every request runs in a new thread and
+# persistent connections cannot be reused; the pool replaces CONN_MAX_AGE.
+if config('DB_POOL', default=False, cast=bool):
+    if DB_VENDOR != 'postgresql':
+        raise ImproperlyConfigured('DB_POOL needs a PostgreSQL database, use DB_CONN_MAX_AGE instead.')
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+    }
+
+# Time connects (TCP + TLS + auth) and count reused connections, see trading_portfolio/dbstats.py
+if config('DB_INSTRUMENT', default=True, cast=bool) and DB_VENDOR in ('mysql', 'postgresql', 'sqlite3'):
+    DATABASES['default']['ENGINE'] = f'trading_portfolio.db_backends.{DB_VENDOR}'
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Must be shared by all gunicorn workers (quote snapshots and refresh locks live here).
+# Set REDIS_URL in production: the file cache is only shared between workers on one host, and its add()/incr()
+# are not atomic, so two workers can take the same quote refresh lock (see trading_portfolio/quotes.py).
+
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'portfolio_cache')),
+        }
+    }
+
+# Quote cache (seconds)
+QUOTE_CACHE_TTL = config('QUOTE_CACHE_TTL', default=30, cast=int)
+QUOTE_CACHE_STALE_TTL = config('QUOTE_CACHE_STALE_TTL', default=300, cast=int)
+QUOTE_CACHE_LOCK_TIMEOUT = config('QUOTE_CACHE_LOCK_TIMEOUT', default=30, cast=int)
+QUOTE_CACHE_WAIT = config('QUOTE_CACHE_WAIT', default=5, cast=int)
+QUOTE_CACHE_BACKGROUND_REFRESH = config('QUOTE_CACHE_BACKGROUND_REFRESH', default=True, cast=bool)
+# concurrent cache misses in a worker within this window share one provider call (0 turns batching off)
+QUOTE_BATCH_WINDOW_MS = config('QUOTE_BATCH_WINDOW_MS', default=20, cast=float)
+
+# Quote stream (server-sent events, ASGI only): one poller per symbol set per worker, see trading_portfolio/streaming.py
+QUOTE_STREAM_FEED = config('QUOTE_STREAM_FEED', default='cache')  # cache, fake or a dotted path
+QUOTE_STREAM_INTERVAL = config('QUOTE_STREAM_INTERVAL', default=1.0, cast=float)
+QUOTE_STREAM_QUEUE_SIZE = config('QUOTE_STREAM_QUEUE_SIZE', default=32, cast=int)  # messages before a client is dropped
+QUOTE_STREAM_HEARTBEAT = config('QUOTE_STREAM_HEARTBEAT', default=15, cast=float)
+
+# Market data
+# Views read from MARKET_DATA_PROVIDER; set it to 'database' when the ingest_market_data worker runs.
+MARKET_DATA_PROVIDER = config('MARKET_DATA_PROVIDER', default='yfinance')
+MARKET_DATA_INGEST_PROVIDER = config('MARKET_DATA_INGEST_PROVIDER', default='yfinance')
+MARKET_DATA_DIR = config('MARKET_DATA_DIR', default=os.path.join(BASE_DIR, 'market_data'))
+MARKET_DATA_SYMBOLS = config('MARKET_DATA_SYMBOLS', default='AAPL,MSFT,TSLA,GOOG,AMZN,RGTI,UBER,JEPQ,LCID',
+                             cast=Csv())
+MARKET_DATA_POLL_INTERVAL = config('MARKET_DATA_POLL_INTERVAL', default=60, cast=float)
+# 'fake' is deterministic synthetic data for tests and benchmarks; this delay stands in for the network
+MARKET_DATA_FAKE_LATENCY_MS = config('MARKET_DATA_FAKE_LATENCY_MS', default=0, cast=float)
+
+# Symbol search: a per-worker prefix index over Asset plus this listing (CSV or pipe separated, symbol and name
+# columns, e.g. nasdaqlisted.txt), see trading_portfolio/search.py
+SYMBOL_LISTING_FILE = config('SYMBOL_LISTING_FILE', default=os.path.join(MARKET_DATA_DIR, 'listing.csv'))
+SYMBOL_INDEX_SYNC_SECONDS = config('SYMBOL_INDEX_SYNC_SECONDS', default=30, cast=float)  # pick up other workers' edits
+
+# Charts: rendered images are cached per worker for one bucket (seconds)
+CHART_DEFAULT_FORMAT = config('CHART_DEFAULT_FORMAT', default='png')  # png, svg or json (legacy base64)
+CHART_CACHE_BUCKET_SECONDS = config('CHART_CACHE_BUCKET_SECONDS', default=60, cast=int)
+CHART_CACHE_MAX_ENTRIES = config('CHART_CACHE_MAX_ENTRIES', default=256, cast=int)
+CHART_CACHE_MAX_BYTES = config('CHART_CACHE_MAX_BYTES', default=32 * 1024 * 1024, cast=int)
+SERIES_MAX_POINTS = config('SERIES_MAX_POINTS', default=5000, cast=int)
+
+# Trading
+ASSET_CACHE_MAX_ENTRIES = config('ASSET_CACHE_MAX_ENTRIES', default=10000, cast=int)  # symbol registry, per worker
+TRADE_BATCH_MAX_ORDERS = config('TRADE_BATCH_MAX_ORDERS', default=5000, cast=int)
+# cost basis for new ledger rows: 'fifo' or 'average' (rebuild_ledger re-applies it to existing rows)
+COST_BASIS_METHOD = config('COST_BASIS_METHOD', default='fifo')
+# resting limit/stop orders per portfolio, see trading_portfolio/orders.py
+ORDERS_MAX_OPEN = config('ORDERS_MAX_OPEN', default=100, cast=int)
+
+# Admin: unfiltered changelists over tables estimated above this many rows skip COUNT(*), see trading_portfolio/pagination.py
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
+# Risk analytics from stored daily bars (ingest_market_data --bar-interval 1d), see trading_portfolio/risk.py
+RISK_BENCHMARK = config('RISK_BENCHMARK', default='SPY')
+RISK_LOOKBACK_DAYS = config('RISK_LOOKBACK_DAYS', default=252, cast=int)  # trading days of returns
+RISK_CONFIDENCE = config('RISK_CONFIDENCE', default=0.95, cast=float)  # value at risk level
+
+# Sessions: last_activity is written back at most once per interval per session (seconds)
+SESSION_ACTIVITY_FLUSH_SECONDS = config('SESSION_ACTIVITY_FLUSH_SECONDS', default=60, cast=int)
+
+# Async views: threads per worker for blocking libraries (yfinance, pandas, matplotlib), see trading_portfolio/blocking.py
+ASYNC_BLOCKING_THREADS = config('ASYNC_BLOCKING_THREADS', default=8, cast=int)
+
+# Request metrics: Server-Timing headers and per-view histograms at /metrics, see trading_portfolio/metrics.py
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=15, cast=int)  # worker totals -> shared cache
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # bearer token for scrapers; staff only when empty
+if METRICS_ENABLED:
+    TEMPLATES[0]['BACKEND'] = 'trading_portfolio.metrics.TimedDjangoTemplates'
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,127 @@
+"""
+Session activity tracking.
+
+A login upserts its ``UserSession`` row by ``session_key`` (one statement, any
+number of sessions per user). After that, requests only touch the shared
+cache: ``cache.add`` on a per-session key lets through at most one activity
+mark per session every ``SESSION_ACTIVITY_FLUSH_SECONDS`` across all workers,
+and the marks are buffered in the process. The buffer is written back with
+one ``UPDATE ... CASE`` for every pending session at most once per interval;
+it only moves ``last_activity`` forward on sessions that are still active, so
+a mark buffered by another worker cannot revive a session that logged out.
+Marks still buffered when a worker exits are lost (the session then looks idle
+for up to one more interval). Sessions idle for longer than
+``SESSION_COOKIE_AGE`` are marked inactive by ``sweep``, which runs at most
+once per interval across all workers and uses ``user_session_idle_idx``.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import UserSession
+
+KEY_PREFIX = 'session_activity'
+FLUSH_CHUNK = 500
+
+
+def get_client_ip(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def start_session(request, user, replaced_key=None):
+    """
+    Record a login for ``request.session`` with a single upsert on ``session_key``.
+
+    ``login()`` cycles the session key; pass the key it replaced so that row is closed.
+    """
+    now = timezone.now()
+    if replaced_key and replaced_key != request.session.session_key:
+        end_session(user, replaced_key)
+    UserSession.objects.bulk_create([UserSession(
+        user=user, session_key=request.session.session_key, ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''), created_at=now, last_activity=now, is_active=True,
+    )], update_conflicts=True, unique_fields=['session_key'],
+        update_fields=['user', 'ip_address', 'user_agent', 'last_activity', 'is_active'])
+    activity.mark(request.session.session_key)
+
+
+def end_session(user, session_key):
+    activity.discard(session_key)
+    UserSession.objects.filter(user=user, session_key=session_key, is_active=True).update(
+        is_active=False, last_activity=timezone.now())
+
+
+class ActivityBuffer:
+    """Per-process buffer of ``session_key -> last seen`` flushed in bulk."""
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    # settings are read on every call so override_settings works in tests
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def interval(self):
+        return getattr(settings, 'SESSION_ACTIVITY_FLUSH_SECONDS', 60)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def mark(self, session_key):
+        """Claim this interval's write-back for ``session_key``; the first request in it wins."""
+        self.cache.add(f'{KEY_PREFIX}:{session_key}', 1, timeout=self.interval)
+
+    def record(self, session_key):
+        if not self.cache.add(f'{KEY_PREFIX}:{session_key}', 1, timeout=self.interval):
+            return False
+        with self._lock:
+            self._pending[session_key] = timezone.now()
+        return True
+
+    def discard(self, session_key):
+        with self._lock:
+            self._pending.pop(session_key, None)
+        self.cache.delete(f'{KEY_PREFIX}:{session_key}')
+
+    def due(self):
+        return time.monotonic() - self._flushed_at >= self.interval
+
+    def flush(self):
+        """Write pending activity in one statement per chunk; return the number of sessions updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        for offset in range(0, len(items), FLUSH_CHUNK):
+            chunk = items[offset:offset + FLUSH_CHUNK]
+            UserSession.objects.filter(session_key__in=[key for key, _ in chunk], is_active=True).update(
+                last_activity=Case(*(When(session_key=key, then=Value(seen)) for key, seen in chunk),
+                                   output_field=DateTimeField()),
+            )
+        return len(items)
+
+    def sweep(self):
+        """Mark sessions idle for ``SESSION_COOKIE_AGE`` inactive, once per interval across all workers."""
+        if not self.cache.add(f'{KEY_PREFIX}:sweep', 1, timeout=self.interval):
+            return None
+        idle_since = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        return UserSession.objects.filter(is_active=True, last_activity__lt=idle_since).update(is_active=False)
+
+
+activity = ActivityBuffer()
@@ -1,8 +1,29 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 
-from trading_portfolio.models import UserProfile, Asset, Portfolio, Transaction, PortfolioPosition
+from trading_portfolio.models import UserProfile, Asset, Portfolio, Transaction, PortfolioPosition, Watchlist, Order
+from trading_portfolio.pagination import EstimatedCountPaginator
+
+
+class ScalableChangeList(ChangeList):
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.only(*self.model_admin.list_only) if self.model_admin.list_only else queryset
+
+
+# changelists for big tables: a fixed number of queries per page whatever the row count.
+# list_select_related must cover every relation __str__ walks, list_only names the columns the page shows,
+# and the row count is estimated (see pagination.py) and never run a second time unfiltered
+class ScalableModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_only = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ScalableChangeList
 
 
 # Register your models here.
@@ -26,22 +47,64 @@ class AssetAdmin(admin.ModelAdmin):
     list_filter = ('asset_type',)
 
 @admin.register(Portfolio)
-class PortfolioAdmin(admin.ModelAdmin):
+class PortfolioAdmin(ScalableModelAdmin):
     list_display = ('user', 'name', 'created_at')
+    list_select_related = ('user',)
+    list_only = ('name', 'created_at', 'user__username')
     search_fields = ('user__username',)
+    autocomplete_fields = ('user',)
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(ScalableModelAdmin):
     list_display = ('portfolio', 'asset', 'transaction_type', 'quantity', 'price', 'timestamp')
-    list_filter = ('transaction_type', 'asset__symbol')
-    search_fields = ('portfolio__user__username', 'asset__symbol')
+    list_select_related = ('portfolio__user', 'asset')
+    list_only = ('transaction_type', 'quantity', 'price', 'timestamp', 'portfolio__user__username',
+                 'asset__symbol', 'asset__name')
+    # the asset filter listed every distinct symbol in the table; search by exact symbol instead
+    list_filter = ('transaction_type',)
+    search_fields = ('portfolio__user__username', '=asset__symbol')
+    # min/max and years come from transaction_timestamp_idx
+    date_hierarchy = 'timestamp'
+    ordering = ('-timestamp', '-id')
+    autocomplete_fields = ('portfolio', 'asset')
 
 @admin.register(PortfolioPosition)
-class PortfolioPositionAdmin(admin.ModelAdmin):
+class PortfolioPositionAdmin(ScalableModelAdmin):
     list_display = ('portfolio', 'asset', 'quantity')
-    search_fields = ('portfolio__user__username', 'asset__symbol')
+    list_select_related = ('portfolio__user', 'asset')
+    list_only = ('quantity', 'portfolio__user__username', 'asset__symbol', 'asset__name')
+    search_fields = ('portfolio__user__username', '=asset__symbol')
+    autocomplete_fields = ('portfolio', 'asset')
+
+@admin.register(Order)
+class OrderAdmin(ScalableModelAdmin):
+    list_display = ('portfolio', 'asset', 'order_type', 'transaction_type', 'quantity', 'price', 'status',
+                    'created_at')
+    list_select_related = ('portfolio__user', 'asset')
+    list_only = ('order_type', 'transaction_type', 'quantity', 'price', 'status', 'created_at',
+                 'portfolio__user__username', 'asset__symbol', 'asset__name')
+    list_filter = ('status', 'order_type')
+    search_fields = ('portfolio__user__username', '=asset__symbol')
+    ordering = ('-id',)
+    autocomplete_fields = ('portfolio', 'asset')
+    raw_id_fields = ('trade',)
+
+@admin.register(Watchlist)
+class WatchlistAdmin(ScalableModelAdmin):
+    list_display = ('user', 'updated_at')
+    list_select_related = ('user',)
+    list_only = ('updated_at', 'user__username')
+    search_fields = ('user__username',)
+    autocomplete_fields = ('user',)
+
+@admin.register(UserProfile)
+class UserProfileAdmin(ScalableModelAdmin):
+    list_display = ('user', 'account_balance')
+    list_select_related = ('user',)
+    list_only = ('account_balance', 'user__username')
+    search_fields = ('user__username',)
+    autocomplete_fields = ('user',)
 
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
-admin.site.register(UserProfile)
 
@@ -0,0 +1,51 @@
+"""
+Bounded thread pool for blocking libraries called from async views.
+
+yfinance, pandas and matplotlib have no async API. Async views hand them to
+this pool instead of the default executor so a burst of slow upstream calls
+occupies at most ``ASYNC_BLOCKING_THREADS`` threads per worker, and the event
+loop keeps serving requests that only need the database or the cache.
+
+The work may still reach the ORM (the ``database`` market data provider
+does). A pool thread keeps its own database connection, and no
+request_started/finished signal fires there. So every call is wrapped in
+``close_old_connections()`` before and after, which applies ``CONN_MAX_AGE``
+and the health checks just as a request would.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_BLOCKING_THREADS', 8),
+                                           thread_name_prefix='blocking')
+        return _executor
+
+
+def call_with_fresh_connections(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run ``func(*args, **kwargs)`` in the bounded pool and await its result."""
+    loop = asyncio.get_running_loop()
+    # like sync_to_async, carry the context over (request timings, see metrics.py)
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, call_with_fresh_connections, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
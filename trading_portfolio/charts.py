@@ -0,0 +1,129 @@
+"""
+Chart rendering service for ``get_chart``.
+
+Rendered images (and the JSON series from ``series.py``) are kept in a
+per-process LRU keyed by (symbol, period, interval, format, time bucket) and
+bounded both by entry count and by total bytes. Within one bucket every
+request for the same chart is a dict lookup, and the ETag lets browsers
+revalidate without a download. matplotlib is imported on the first render.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+
+from .providers import get_provider
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+class RenderedChart:
+    __slots__ = ('content', 'content_type', 'etag', 'expires_at')
+
+    def __init__(self, content, content_type, expires_at):
+        self.content = content
+        self.content_type = content_type
+        self.etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        self.expires_at = expires_at
+
+    @property
+    def max_age(self):
+        return max(0, int(self.expires_at - time.time()))
+
+
+class ChartCache:
+    """Thread-safe LRU bounded by ``max_entries`` and ``max_bytes``."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            chart = self._entries.get(key)
+            if chart is not None:
+                self._entries.move_to_end(key)
+            return chart
+
+    def set(self, key, chart):
+        if len(chart.content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.content)
+            self._entries[key] = chart
+            self.size += len(chart.content)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.content)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+chart_cache = ChartCache(
+    max_entries=getattr(settings, 'CHART_CACHE_MAX_ENTRIES', 256),
+    max_bytes=getattr(settings, 'CHART_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+)
+
+
+def render_chart(symbol, period='1d', interval='1m', fmt='png'):
+    """Render the close price of ``symbol`` and return the encoded image bytes."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    data = get_provider().get_bars([symbol], period=period, interval=interval).get(symbol)
+    if data is None or data.empty:
+        raise LookupError(f"No market data for {symbol}")
+
+    # object-oriented API: no pyplot global state, safe to call from several threads
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(data.index, data['close'], label='Close Price', color='r')
+    ax.set_title(f'{symbol} - {period}')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Price (USD)')
+    ax.grid(True)
+    ax.legend()
+
+    buf = BytesIO()
+    fig.savefig(buf, format=fmt, metadata={'Date': None} if fmt == 'svg' else None)
+    return buf.getvalue()
+
+
+def get_cached(key, render, content_type):
+    """Return the cached ``RenderedChart`` for ``key`` in the current time bucket, calling ``render`` on a miss."""
+    bucket_seconds = getattr(settings, 'CHART_CACHE_BUCKET_SECONDS', 60)
+    bucket = int(time.time() // bucket_seconds)
+    key = (*key, bucket)
+
+    chart = chart_cache.get(key)
+    if chart is None:
+        chart = RenderedChart(render(), content_type, expires_at=(bucket + 1) * bucket_seconds)
+        chart_cache.set(key, chart)
+    return chart
+
+
+def get_chart_image(symbol, period='1d', interval='1m', fmt='png'):
+    """Return a cached image, rendering at most once per symbol/range/format per bucket."""
+    return get_cached(
+        ('chart', symbol, period, interval, fmt),
+        lambda: render_chart(symbol, period, interval, fmt),
+        CONTENT_TYPES[fmt],
+    )
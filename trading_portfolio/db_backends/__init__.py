@@ -0,0 +1,7 @@
+"""
+Database backends that time every new connection (see ``dbstats.py``).
+
+Each is the stock Django backend plus ``InstrumentedConnectionMixin``; the
+settings swap them in for ``django.db.backends.<vendor>`` when
+``DB_INSTRUMENT`` is on.
+"""
@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from trading_portfolio.dbstats import InstrumentedConnectionMixin
+
+
+class DatabaseWrapper(InstrumentedConnectionMixin, base.DatabaseWrapper):
+    pass
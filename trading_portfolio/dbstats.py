@@ -0,0 +1,77 @@
+"""
+Connection reuse instrumentation.
+
+``InstrumentedConnectionMixin`` times ``get_new_connection``: the TCP, TLS and
+authentication handshake for a fresh connection, or the checkout when a pool
+is configured. A ``request_started`` receiver (it runs after Django's own
+``close_old_connections``) counts requests that found their connection
+still open. Counters are per process and per database alias.
+"""
+import threading
+import time
+
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+class ConnectionStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aliases = {}
+
+    def _counters(self, alias):
+        return self._aliases.setdefault(alias, {
+            'connects': 0, 'connect_seconds': 0.0, 'max_connect_seconds': 0.0, 'requests': 0, 'reused': 0,
+        })
+
+    def record_connect(self, alias, seconds):
+        with self._lock:
+            counters = self._counters(alias)
+            counters['connects'] += 1
+            counters['connect_seconds'] += seconds
+            counters['max_connect_seconds'] = max(counters['max_connect_seconds'], seconds)
+
+    def record_request(self, alias, reused):
+        with self._lock:
+            counters = self._counters(alias)
+            counters['requests'] += 1
+            counters['reused'] += reused
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for alias, counters in self._aliases.items():
+                connects, requests = counters['connects'], counters['requests']
+                result[alias] = {
+                    **counters,
+                    'avg_connect_ms': round(counters['connect_seconds'] / connects * 1000, 3) if connects else None,
+                    'max_connect_ms': round(counters['max_connect_seconds'] * 1000, 3),
+                    'reuse_ratio': round(counters['reused'] / requests, 4) if requests else None,
+                }
+                del result[alias]['connect_seconds'], result[alias]['max_connect_seconds']
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._aliases.clear()
+
+
+connection_stats = ConnectionStats()
+
+
+class InstrumentedConnectionMixin:
+
+    def get_new_connection(self, conn_params):
+        started = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        connection_stats.record_connect(self.alias, time.perf_counter() - started)
+        return connection
+
+
+@receiver(request_started)
+def count_reused_connections(sender, **kwargs):
+    for conn in connections.all(initialized_only=True):
+        if isinstance(conn, InstrumentedConnectionMixin):
+            connection_stats.record_request(conn.alias, conn.connection is not None)
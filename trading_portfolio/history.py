@@ -0,0 +1,67 @@
+"""
+Keyset-paginated transaction history.
+
+Pages are ordered newest first by ``(timestamp, id)`` and continue from an
+opaque cursor holding the last row's key, so every page is a range scan on
+``transaction_history_idx`` no matter how deep it is (no OFFSET, no COUNT).
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Transaction
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(trans):
+    raw = f"{trans.timestamp.isoformat()}|{trans.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def transaction_page(portfolio_id, cursor=None, limit=DEFAULT_PAGE_SIZE, symbol=None, side=None):
+    """Return ``(transactions, next_cursor)``; ``next_cursor`` is None on the last page."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    queryset = Transaction.objects.filter(portfolio_id=portfolio_id)
+    if symbol:
+        queryset = queryset.filter(asset__symbol=symbol.upper())
+    if side:
+        queryset = queryset.filter(transaction_type=side.upper())
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        # the plain timestamp bound lets the index seek; the OR only breaks ties
+        queryset = queryset.filter(timestamp__lte=timestamp).filter(Q(timestamp__lt=timestamp) | Q(id__lt=pk))
+
+    # one extra row tells us whether there is a next page
+    rows = list(queryset.select_related('asset').order_by('-timestamp', '-id')[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def serialize_transaction(trans):
+    return {
+        'id': trans.pk,
+        'asset': str(trans.asset),
+        'symbol': trans.asset.symbol,
+        'transaction_type': trans.transaction_type,
+        'quantity': str(trans.quantity),
+        'price': str(trans.price),
+        'timestamp': trans.timestamp.isoformat(),
+    }
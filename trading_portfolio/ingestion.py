@@ -0,0 +1,72 @@
+"""
+Market data ingestion used by the ``ingest_market_data`` management command.
+
+Each cycle makes one batched provider call for the whole symbol universe and
+upserts the latest quote and the 1-minute bars into ``Quote``/``PriceBar``.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import PriceBar, Quote
+from .registry import asset_registry
+
+logger = logging.getLogger(__name__)
+
+BAR_UPDATE_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def to_decimal(value):
+    return Decimal(str(round(float(value), 8)))
+
+
+def ingest_once(provider, symbols, interval='1m', period='1d'):
+    """Run one ingestion cycle; return the number of bars and quotes written."""
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    bars = provider.get_bars(symbols, period=period, interval=interval)
+    assets = asset_registry.resolve([symbol for symbol in symbols if symbol in bars])
+
+    # only the newest stored bar can still change, everything before it is final
+    latest = dict(PriceBar.objects
+                  .filter(asset_id__in=[asset.id for asset in assets.values()], interval=interval)
+                  .values('asset')
+                  .annotate(latest=Max('timestamp'))
+                  .values_list('asset', 'latest'))
+
+    bar_rows = []
+    quote_rows = []
+    for symbol, asset in assets.items():
+        frame = bars[symbol]
+        if frame.empty:
+            continue
+        since = latest.get(asset.id)
+        new = frame[frame.index >= since] if since is not None else frame
+        for timestamp, row in zip(new.index, new.itertuples(index=False)):
+            bar_rows.append(PriceBar(
+                asset_id=asset.id, interval=interval, timestamp=timestamp.to_pydatetime(),
+                open=to_decimal(row.open), high=to_decimal(row.high), low=to_decimal(row.low),
+                close=to_decimal(row.close), volume=int(row.volume),
+            ))
+        last = frame.iloc[-1]
+        quote_rows.append(Quote(
+            asset_id=asset.id, last_price=to_decimal(last['close']), open_price=to_decimal(last['open']),
+            timestamp=frame.index[-1].to_pydatetime(),
+        ))
+
+    with transaction.atomic():
+        PriceBar.objects.bulk_create(
+            bar_rows, batch_size=1000, update_conflicts=True,
+            unique_fields=['asset', 'interval', 'timestamp'], update_fields=BAR_UPDATE_FIELDS,
+        )
+        if interval == '1m':
+            Quote.objects.bulk_create(
+                quote_rows, update_conflicts=True, unique_fields=['asset'],
+                update_fields=['last_price', 'open_price', 'timestamp', 'updated_at'],
+            )
+
+    missing = sorted(set(symbols) - set(bars))
+    if missing:
+        logger.warning("No market data returned for %s", ', '.join(missing))
+    return len(bar_rows), (len(quote_rows) if interval == '1m' else 0)
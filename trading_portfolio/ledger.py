@@ -0,0 +1,178 @@
+"""
+Cost basis and realised P&L ledger.
+
+One ``PositionLedger`` row per (portfolio, asset) keeps the open quantity,
+running ``avg_cost`` and cumulative ``realized_pnl``; in FIFO mode the open
+lots live in ``Lot``. Fills are applied incrementally from the trade path
+(``apply_fills``) and only touch the ledger rows and lots of the assets they
+trade, so reading P&L is O(positions) rather than a replay of the history.
+``rebuild`` replays ``Transaction`` rows for existing data.
+
+The method (``COST_BASIS_METHOD``: ``fifo`` or ``average``) is stored on each
+ledger row; switching it only applies to rows created afterwards until the
+ledger is rebuilt.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Lot, PositionLedger, Transaction
+
+PLACES = Decimal('0.00000001')
+ZERO = Decimal('0')
+LEDGER_FIELDS = ['quantity', 'avg_cost', 'realized_pnl', 'updated_at']
+
+
+def default_method():
+    return getattr(settings, 'COST_BASIS_METHOD', 'fifo')
+
+
+class Book:
+    """In-memory view of one ledger row and its open lots while fills are applied."""
+
+    def __init__(self, ledger, lots=()):
+        self.ledger = ledger
+        self.lots = list(lots)
+        self.new_lots = []
+        self.changed_lots = {}
+        self.closed_lots = []
+
+    def buy(self, quantity, price, timestamp):
+        ledger = self.ledger
+        open_cost = ledger.avg_cost * ledger.quantity + quantity * price
+        ledger.quantity += quantity
+        ledger.avg_cost = (open_cost / ledger.quantity).quantize(PLACES)
+        if ledger.method == 'fifo':
+            lot = Lot(portfolio_id=ledger.portfolio_id, asset_id=ledger.asset_id,
+                      quantity=quantity, price=price, opened_at=timestamp)
+            self.lots.append(lot)
+            self.new_lots.append(lot)
+
+    def sell(self, quantity, price):
+        ledger = self.ledger
+        # history from before the ledger existed is realised at cost until a rebuild
+        matched = min(quantity, ledger.quantity)
+
+        if ledger.method == 'fifo':
+            consumed = ZERO
+            remaining = matched
+            while remaining > 0 and self.lots:
+                lot = self.lots[0]
+                take = min(lot.quantity, remaining)
+                consumed += take * lot.price
+                lot.quantity -= take
+                remaining -= take
+                if lot.quantity == 0:
+                    self.lots.pop(0)
+                    if lot.pk is None:
+                        self.new_lots.remove(lot)
+                    else:
+                        self.changed_lots.pop(lot.pk, None)
+                        self.closed_lots.append(lot.pk)
+                elif lot.pk is not None:
+                    self.changed_lots[lot.pk] = lot
+            consumed += remaining * ledger.avg_cost
+            open_quantity = sum((lot.quantity for lot in self.lots), ZERO)
+            open_cost = sum((lot.quantity * lot.price for lot in self.lots), ZERO)
+        else:
+            consumed = matched * ledger.avg_cost
+            open_quantity = ledger.quantity - matched
+            open_cost = open_quantity * ledger.avg_cost
+
+        ledger.realized_pnl = (ledger.realized_pnl + matched * price - consumed).quantize(PLACES)
+        ledger.quantity -= matched
+        ledger.avg_cost = (open_cost / open_quantity).quantize(PLACES) if open_quantity > 0 else ZERO
+
+
+def load_books(portfolio_id, asset_ids, with_lots):
+    """Lock and load the ledger rows (and FIFO lots when selling) for ``asset_ids``."""
+    ledgers = {ledger.asset_id: ledger for ledger in
+               PositionLedger.objects.select_for_update().filter(portfolio_id=portfolio_id, asset_id__in=asset_ids)}
+    lots = defaultdict(list)
+    if with_lots and any(ledger.method == 'fifo' for ledger in ledgers.values()):
+        for lot in (Lot.objects.select_for_update()
+                    .filter(portfolio_id=portfolio_id, asset_id__in=list(ledgers))
+                    .order_by('opened_at', 'id')):
+            lots[lot.asset_id].append(lot)
+
+    method = default_method()
+    return {
+        asset_id: Book(
+            ledgers.get(asset_id) or PositionLedger(portfolio_id=portfolio_id, asset_id=asset_id, method=method),
+            lots[asset_id],
+        )
+        for asset_id in asset_ids
+    }
+
+
+def save_books(books):
+    ledgers = [book.ledger for book in books]
+    created = [ledger for ledger in ledgers if ledger.pk is None]
+    updated = [ledger for ledger in ledgers if ledger.pk is not None]
+    new_lots = [lot for book in books for lot in book.new_lots]
+    changed_lots = [lot for book in books for lot in book.changed_lots.values()]
+    closed_lots = [pk for book in books for pk in book.closed_lots]
+
+    if created:
+        PositionLedger.objects.bulk_create(created, batch_size=500)
+    if updated:
+        PositionLedger.objects.bulk_update(updated, LEDGER_FIELDS, batch_size=500)
+    if new_lots:
+        Lot.objects.bulk_create(new_lots, batch_size=500)
+    if changed_lots:
+        Lot.objects.bulk_update(changed_lots, ['quantity'], batch_size=500)
+    if closed_lots:
+        Lot.objects.filter(pk__in=closed_lots).delete()
+
+
+def apply_fills(portfolio_id, fills):
+    """
+    Apply ``(asset_id, transaction_type, quantity, price, timestamp)`` fills in order.
+
+    Must run inside the trade's ``transaction.atomic()`` block.
+    """
+    asset_ids = sorted({fill[0] for fill in fills})
+    books = load_books(portfolio_id, asset_ids, with_lots=any(fill[1] == 'SELL' for fill in fills))
+    for asset_id, transaction_type, quantity, price, timestamp in fills:
+        if transaction_type == 'BUY':
+            books[asset_id].buy(quantity, price, timestamp)
+        else:
+            books[asset_id].sell(quantity, price)
+    save_books(books.values())
+    return books
+
+
+def rebuild(portfolio_ids=None, method=None, chunk_size=500):
+    """Replay the transaction history into fresh ledger rows and lots; return the ledger row count."""
+    from .models import Portfolio
+
+    method = method or default_method()
+    if portfolio_ids is None:
+        portfolio_ids = list(Portfolio.objects.order_by('id').values_list('id', flat=True))
+
+    written = 0
+    for start in range(0, len(portfolio_ids), chunk_size):
+        chunk = portfolio_ids[start:start + chunk_size]
+        with transaction.atomic():
+            Lot.objects.filter(portfolio_id__in=chunk).delete()
+            PositionLedger.objects.filter(portfolio_id__in=chunk).delete()
+
+            books = {}
+            history = (Transaction.objects.filter(portfolio_id__in=chunk)
+                       .order_by('portfolio_id', 'asset_id', 'timestamp', 'id')
+                       .values_list('portfolio_id', 'asset_id', 'transaction_type', 'quantity', 'price', 'timestamp'))
+            for portfolio_id, asset_id, transaction_type, quantity, price, timestamp in history.iterator(2000):
+                book = books.get((portfolio_id, asset_id))
+                if book is None:
+                    book = books[(portfolio_id, asset_id)] = Book(
+                        PositionLedger(portfolio_id=portfolio_id, asset_id=asset_id, method=method))
+                if transaction_type == 'BUY':
+                    book.buy(quantity, price, timestamp)
+                else:
+                    book.sell(quantity, price)
+
+            save_books(books.values())
+            written += len(books)
+    return written
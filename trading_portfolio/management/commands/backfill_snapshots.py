@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from trading_portfolio.snapshots import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild daily equity snapshots from the transaction history and daily bars."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (default: first trade)")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day (default: today)")
+        parser.add_argument('--portfolio', type=int, action='append', dest='portfolios',
+                            help="Only backfill these portfolio ids (repeatable)")
+        parser.add_argument('--provider', help="Market data provider for daily bars (default: MARKET_DATA_PROVIDER)")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Portfolios per pass")
+
+    def handle(self, *args, **options):
+        count = backfill(options['portfolios'], start=options['start'], end=options['end'],
+                         provider=options['provider'], chunk_size=options['chunk_size'])
+        self.stdout.write(f"Wrote {count} snapshots")
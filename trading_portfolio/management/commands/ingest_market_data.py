@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from trading_portfolio.ingestion import ingest_once
+from trading_portfolio.models import BAR_INTERVALS
+from trading_portfolio.orders import match_quotes
+from trading_portfolio.providers import FileProvider, get_provider
+
+
+class Command(BaseCommand):
+    help = ("Poll the market data provider, upsert quotes and 1m (or --bar-interval) bars into the database and "
+            "fill the resting orders the new quotes trigger.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--symbols', help="Comma separated symbols (default: MARKET_DATA_SYMBOLS)")
+        parser.add_argument('--provider', help="Provider alias or dotted path (default: MARKET_DATA_INGEST_PROVIDER)")
+        parser.add_argument('--data-dir', help="CSV directory for the file provider")
+        parser.add_argument('--interval', type=float, default=settings.MARKET_DATA_POLL_INTERVAL,
+                            help="Seconds between polls")
+        parser.add_argument('--period', default='1d', help="How much history each poll requests")
+        parser.add_argument('--bar-interval', default='1m', choices=[interval for interval, _ in BAR_INTERVALS],
+                            help="Bar size to store; 1d bars feed the risk analytics (e.g. --period 2y --once)")
+        parser.add_argument('--once', action='store_true', help="Run a single cycle and exit")
+        parser.add_argument('--no-orders', action='store_true',
+                            help="Do not match resting limit/stop orders against the new quotes")
+
+    def handle(self, *args, **options):
+        symbols = options['symbols'].split(',') if options['symbols'] else settings.MARKET_DATA_SYMBOLS
+        if options['data_dir']:
+            provider = FileProvider(options['data_dir'])
+        else:
+            provider = get_provider(options['provider'] or settings.MARKET_DATA_INGEST_PROVIDER)
+
+        self.stdout.write(f"Ingesting {len(symbols)} symbols with {type(provider).__name__}")
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            try:
+                bars, quotes = ingest_once(provider, symbols, interval=options['bar_interval'], period=options['period'])
+            except Exception as e:
+                # keep the worker alive through provider outages
+                self.stderr.write(f"Ingestion cycle failed: {e}")
+            else:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"Upserted {bars} bars and {quotes} quotes in {elapsed:.2f}s")
+                if quotes and not options['no_orders']:
+                    self.match_orders()
+
+            if options['once']:
+                break
+            try:
+                time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
+            except KeyboardInterrupt:
+                break
+
+    def match_orders(self):
+        # this process holds the order book, see trading_portfolio/orders.py
+        try:
+            counts = match_quotes()
+        except Exception as e:
+            self.stderr.write(f"Order matching failed: {e}")
+        else:
+            if any(counts.values()):
+                self.stdout.write("Orders: " + ', '.join(f"{count} {name}" for name, count in counts.items()))
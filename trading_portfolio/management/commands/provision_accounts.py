@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trading_portfolio.provisioning import CHUNK, provision, read_accounts
+
+
+class Command(BaseCommand):
+    help = ("Create users with their profile and portfolio in bulk from a CSV (with a header row) or JSON file. "
+            "Columns: username, email, first_name, last_name, account_balance, password or password_hash.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help="Default: from the file extension")
+        parser.add_argument('--password', help="Password for rows without one, hashed once "
+                                               "(default: an unusable password)")
+        parser.add_argument('--chunk', type=int, default=CHUNK, help="Accounts per transaction")
+
+    def handle(self, *args, **options):
+        try:
+            rows = read_accounts(options['path'], options['format'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        started = time.perf_counter()
+        result = provision(rows, password=options['password'], chunk=options['chunk'])
+        for line, message in result['errors'][:20]:
+            self.stderr.write(f"row {line}: {message}")
+        self.stdout.write(f"Created {result['created']} accounts, skipped {result['skipped']} existing or "
+                          f"repeated, {len(result['errors'])} invalid in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from trading_portfolio.ledger import rebuild
+from trading_portfolio.models import COST_METHODS
+
+
+class Command(BaseCommand):
+    help = "Rebuild the cost basis and realised P&L ledger by replaying the transaction history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=[method for method, _ in COST_METHODS],
+                            help="Cost basis method (default: COST_BASIS_METHOD)")
+        parser.add_argument('--portfolio', type=int, action='append', dest='portfolios',
+                            help="Only rebuild these portfolio ids (repeatable)")
+
+    def handle(self, *args, **options):
+        count = rebuild(options['portfolios'], method=options['method'])
+        self.stdout.write(f"Rebuilt {count} ledger rows")
@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from trading_portfolio.risk import CACHE_SECONDS, CHUNK, analyse, cache_key
+
+
+class Command(BaseCommand):
+    help = ("Compute the risk report of every portfolio (or --portfolio ids) and store it in the cache the /risk/ "
+            "endpoint reads, e.g. after the daily bars are ingested.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--portfolio', type=int, action='append', dest='portfolios',
+                            help="Only score these portfolio ids (repeatable)")
+        parser.add_argument('--benchmark', help="Benchmark symbol (default: RISK_BENCHMARK)")
+        parser.add_argument('--lookback', type=int, help="Trading days of returns (default: RISK_LOOKBACK_DAYS)")
+        parser.add_argument('--confidence', type=float, help="VaR confidence level (default: RISK_CONFIDENCE)")
+        parser.add_argument('--chunk', type=int, default=CHUNK, help="Portfolios per matrix product")
+        parser.add_argument('--output', help="Also write the reports to this file, one JSON object per line")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        reports = analyse(options['portfolios'], benchmark=options['benchmark'], lookback=options['lookback'],
+                          confidence=options['confidence'], chunk_size=options['chunk'])
+        # the endpoint serves defaults only, other parameters are not cached under its keys
+        cacheable = not (options['benchmark'] or options['lookback'] or options['confidence'])
+        output = open(options['output'], 'w') if options['output'] else None
+        count = 0
+        batch = {}
+        try:
+            for report in reports:
+                count += 1
+                if cacheable:
+                    batch[cache_key(report['portfolio_id'])] = report
+                    if len(batch) == options['chunk']:
+                        cache.set_many(batch, timeout=CACHE_SECONDS)
+                        batch = {}
+                if output:
+                    output.write(json.dumps(report) + '\n')
+            if batch:
+                cache.set_many(batch, timeout=CACHE_SECONDS)
+        finally:
+            if output:
+                output.close()
+        self.stdout.write(f"Scored {count} portfolios in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from trading_portfolio.snapshots import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Write today's equity snapshot for every portfolio (schedule once a day, after the close)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--portfolio', type=int, action='append', dest='portfolios',
+                            help="Only snapshot these portfolio ids (repeatable)")
+
+    def handle(self, *args, **options):
+        count = take_snapshots(portfolio_ids=options['portfolios'])
+        self.stdout.write(f"Wrote {count} snapshots")
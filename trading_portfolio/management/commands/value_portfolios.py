@@ -0,0 +1,24 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from trading_portfolio.valuation import value_portfolios
+
+
+class Command(BaseCommand):
+    help = "Value every portfolio in one pass and write cash, market value, unrealised and realised P&L and equity as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--portfolio', type=int, action='append', dest='portfolios',
+                            help="Only value these portfolio ids (repeatable)")
+
+    def handle(self, *args, **options):
+        valuation = value_portfolios(options['portfolios'])
+
+        writer = csv.writer(self.stdout)
+        writer.writerow(['portfolio_id', 'cash', 'market_value', 'unrealized_pnl', 'realized_pnl', 'equity'])
+        for row in zip(valuation.portfolios.tolist(), valuation.cash.round(2).tolist(),
+                       valuation.total_market_value.round(2).tolist(),
+                       valuation.total_unrealized_pnl.round(2).tolist(),
+                       valuation.total_realized_pnl.round(2).tolist(), valuation.equity.round(2).tolist()):
+            writer.writerow(row)
@@ -0,0 +1,277 @@
+"""
+Per-request timings, per-view histograms and the ``/metrics`` exposition.
+
+``RequestMetricsMiddleware`` puts a ``RequestTimings`` in a context variable
+for the duration of a request. Three hooks add to it:
+
+* a database execute wrapper (installed on every connection through
+  ``connection_created``) counts statements and their time,
+* ``@timed('upstream')`` on the network market data providers counts provider
+  calls (``DatabaseProvider`` is left to the execute wrapper, so no time is
+  counted twice),
+* ``TimedDjangoTemplates`` times template rendering.
+
+Context variables follow ``sync_to_async`` and ``run_blocking`` into their
+threads, so async views are measured too. Outside a request every hook is a
+single ``ContextVar.get``; with ``METRICS_ENABLED = False`` the middleware and
+the template backend are not installed at all.
+
+The middleware answers with a ``Server-Timing`` header and folds the request
+into the worker's ``MetricsRegistry``. Every ``METRICS_FLUSH_SECONDS`` the
+worker stores its cumulative totals in the shared cache, and ``/metrics``
+merges the totals of every live worker into the Prometheus text format.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+KEY_PREFIX = 'metrics'
+
+# log-spaced from 1 ms to ~25 s so the quantiles interpolated from them stay within 50%
+BUCKETS = tuple(round(0.001 * 1.5 ** i, 6) for i in range(26))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """What one request spent where; updated from every thread working on it."""
+
+    __slots__ = ('started', 'db_queries', 'db_seconds', 'upstream_calls', 'upstream_seconds', 'render_seconds',
+                 '_lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = self.upstream_calls = 0
+        self.db_seconds = self.upstream_seconds = self.render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, kind, seconds):
+        with self._lock:
+            if kind == 'db':
+                self.db_queries += 1
+                self.db_seconds += seconds
+            elif kind == 'upstream':
+                self.upstream_calls += 1
+                self.upstream_seconds += seconds
+            else:
+                self.render_seconds += seconds
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f'upstream;dur={self.upstream_seconds * 1000:.1f};desc="{self.upstream_calls} calls"',
+            f'render;dur={self.render_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def timed(kind):
+    """Decorator adding the call's duration to the current request's ``kind`` bucket."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(kind, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - started)
+
+
+def install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(connection_created)
+def add_query_timer(sender, connection, **kwargs):
+    if getattr(settings, 'METRICS_ENABLED', True):
+        install_query_timer(connection)
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        timings = current.get()
+        if timings is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.add('render', time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose templates report their render time (includes are part of it)."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class MetricsRegistry:
+    """Cumulative per-view totals for this worker, mirrored into the shared cache."""
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self.views = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    # settings are read on every call so override_settings works in tests
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def interval(self):
+        return getattr(settings, 'METRICS_FLUSH_SECONDS', 15)
+
+    def observe(self, view, timings, duration):
+        bucket = next((i for i, bound in enumerate(BUCKETS) if duration <= bound), len(BUCKETS))
+        with self._lock:
+            totals = self.views.get(view)
+            if totals is None:
+                totals = self.views[view] = {
+                    'requests': 0, 'seconds': 0.0, 'buckets': [0] * (len(BUCKETS) + 1),
+                    'db_queries': 0, 'db_seconds': 0.0, 'upstream_calls': 0, 'upstream_seconds': 0.0,
+                    'render_seconds': 0.0,
+                }
+            totals['requests'] += 1
+            totals['seconds'] += duration
+            totals['buckets'][bucket] += 1
+            totals['db_queries'] += timings.db_queries
+            totals['db_seconds'] += timings.db_seconds
+            totals['upstream_calls'] += timings.upstream_calls
+            totals['upstream_seconds'] += timings.upstream_seconds
+            totals['render_seconds'] += timings.render_seconds
+
+    def due(self):
+        return time.monotonic() - self._flushed_at >= self.interval
+
+    def flush(self):
+        """Store this worker's totals in the shared cache and register the worker."""
+        with self._lock:
+            snapshot = {view: {**totals, 'buckets': list(totals['buckets'])} for view, totals in self.views.items()}
+            self._flushed_at = time.monotonic()
+        pid = os.getpid()
+        # a worker that stops flushing (it exited) drops out after a few intervals
+        self.cache.set(f'{KEY_PREFIX}:worker:{pid}', snapshot, timeout=max(60, self.interval * 4))
+        workers = self.cache.get(f'{KEY_PREFIX}:workers') or set()
+        if pid not in workers:
+            # racing workers may drop each other here, they re-register on their next flush
+            self.cache.set(f'{KEY_PREFIX}:workers', workers | {pid}, timeout=None)
+
+    def collect(self):
+        """Totals per view summed over every worker that flushed recently."""
+        workers = self.cache.get(f'{KEY_PREFIX}:workers') or set()
+        snapshots = self.cache.get_many([f'{KEY_PREFIX}:worker:{pid}' for pid in workers])
+        alive = {int(key.rsplit(':', 1)[1]) for key in snapshots}
+        if alive != workers:
+            self.cache.set(f'{KEY_PREFIX}:workers', alive, timeout=None)
+        merged = {}
+        for snapshot in snapshots.values():
+            for view, totals in snapshot.items():
+                into = merged.get(view)
+                if into is None:
+                    merged[view] = {**totals, 'buckets': list(totals['buckets'])}
+                    continue
+                for key, value in totals.items():
+                    if key == 'buckets':
+                        into['buckets'] = [a + b for a, b in zip(into['buckets'], value)]
+                    else:
+                        into[key] += value
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+
+
+registry = MetricsRegistry()
+
+
+def quantile(buckets, q):
+    """Estimate the ``q`` quantile from per-bucket counts by linear interpolation."""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            lower = BUCKETS[i - 1] if i else 0.0
+            upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return BUCKETS[-1]
+
+
+def exposition(views):
+    """Prometheus text format (0.0.4) for ``collect()`` output."""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('portfolio_request_duration_seconds', 'histogram', 'Request duration by view.')
+    for view, totals in sorted(views.items()):
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), totals['buckets']):
+            cumulative += count
+            lines.append(f'portfolio_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+        lines.append(f'portfolio_request_duration_seconds_sum{{view="{view}"}} {totals["seconds"]:.6f}')
+        lines.append(f'portfolio_request_duration_seconds_count{{view="{view}"}} {totals["requests"]}')
+
+    family('portfolio_request_duration_quantile_seconds', 'gauge',
+           'p50/p95/p99 request duration by view, interpolated from the histogram.')
+    for view, totals in sorted(views.items()):
+        for q in QUANTILES:
+            value = quantile(totals['buckets'], q)
+            if value is not None:
+                lines.append(f'portfolio_request_duration_quantile_seconds{{view="{view}",quantile="{q}"}} '
+                             f'{value:.6f}')
+
+    for name, key, help_text in (
+        ('portfolio_db_queries_total', 'db_queries', 'SQL statements executed by view.'),
+        ('portfolio_db_seconds_total', 'db_seconds', 'Time spent executing SQL by view.'),
+        ('portfolio_upstream_calls_total', 'upstream_calls', 'Market data provider calls by view.'),
+        ('portfolio_upstream_seconds_total', 'upstream_seconds', 'Time spent in market data providers by view.'),
+        ('portfolio_render_seconds_total', 'render_seconds', 'Time spent rendering templates by view.'),
+    ):
+        family(name, 'counter', help_text)
+        for view, totals in sorted(views.items()):
+            value = totals[key]
+            lines.append(f'{name}{{view="{view}"}} {value:.6f}' if isinstance(value, float)
+                         else f'{name}{{view="{view}"}} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,102 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+from .activity import activity
+
+
+class SessionActivityMiddleware:
+    """
+    Keep ``UserSession.last_activity`` fresh without a write per request.
+
+    Must come after ``AuthenticationMiddleware``. Activity is recorded in the
+    cache and written back in bulk by ``activity.flush()`` once per
+    ``SESSION_ACTIVITY_FLUSH_SECONDS``, after the response has been built.
+    Works in both sync and async stacks so async views stay on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.track(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(self.track)(request)
+        return response
+
+    def track(self, request):
+        session_key = getattr(request, 'session', None) and request.session.session_key
+        if session_key and request.user.is_authenticated:
+            activity.record(session_key)
+        if activity.due():
+            activity.flush()
+            activity.sweep()
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request and break it down into SQL, market data and rendering.
+
+    Put it first in ``MIDDLEWARE`` so the total covers the whole stack. Adds a
+    ``Server-Timing`` header and records the request in the per-view
+    histograms served at ``/metrics`` (see ``metrics.py``). Removed from the
+    stack when ``METRICS_ENABLED`` is off.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # connections opened before the first request missed connection_created
+        for conn in connections.all(initialized_only=True):
+            metrics.install_query_timer(conn)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self.record(request, response, timings)
+        if metrics.registry.due():
+            await sync_to_async(metrics.registry.flush)()
+        return response
+
+    def record(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        response['Server-Timing'] = timings.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        metrics.registry.observe(match.view_name if match else 'unmatched', timings, total)
+        if not iscoroutinefunction(self) and metrics.registry.due():
+            metrics.registry.flush()
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0004_alter_portfolio_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Quote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('open_price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('timestamp', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='quote', to='trading_portfolio.asset')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PriceBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 Minute'), ('1d', '1 Day')], default='1m', max_length=4)),
+                ('timestamp', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('volume', models.BigIntegerField(default=0)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bars', to='trading_portfolio.asset')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('asset', 'interval', 'timestamp'), name='unique_price_bar')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0005_price_bars_and_quotes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['portfolio', 'timestamp', 'id'], name='transaction_history_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0006_transaction_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('opened_at', models.DateTimeField()),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='trading_portfolio.asset')),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='trading_portfolio.portfolio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['portfolio', 'asset', 'opened_at', 'id'], name='lot_fifo_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PositionLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('fifo', 'FIFO'), ('average', 'Average cost')], default='fifo', max_length=8)),
+                ('quantity', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('avg_cost', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('realized_pnl', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='trading_portfolio.asset')),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='trading_portfolio.portfolio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('portfolio', 'asset'), name='unique_position_ledger')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0007_cost_basis_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('cash', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('market_value', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('equity', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('holdings', models.JSONField(default=dict)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='trading_portfolio.portfolio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('portfolio', 'date'), name='unique_portfolio_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:41
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, Min, OuterRef
+
+
+def merge_duplicate_assets(apps, schema_editor):
+    """Keep the oldest asset per symbol and point every reference to it."""
+    Asset = apps.get_model('trading_portfolio', 'Asset')
+    Transaction = apps.get_model('trading_portfolio', 'Transaction')
+    PortfolioPosition = apps.get_model('trading_portfolio', 'PortfolioPosition')
+    PriceBar = apps.get_model('trading_portfolio', 'PriceBar')
+    Quote = apps.get_model('trading_portfolio', 'Quote')
+    PositionLedger = apps.get_model('trading_portfolio', 'PositionLedger')
+    Lot = apps.get_model('trading_portfolio', 'Lot')
+
+    duplicates = (Asset.objects.values('symbol').annotate(rows=Count('id'), keep=Min('id'))
+                  .filter(rows__gt=1).values_list('symbol', 'keep'))
+    for symbol, keep in duplicates:
+        extra = list(Asset.objects.filter(symbol=symbol).exclude(id=keep).values_list('id', flat=True))
+
+        # positions are not unique per (portfolio, asset) yet, they can simply move
+        for model in (Transaction, PortfolioPosition, Lot):
+            model.objects.filter(asset_id__in=extra).update(asset_id=keep)
+
+        # rows that would collide with the kept asset's are dropped, the rest move
+        PriceBar.objects.filter(asset_id__in=extra).filter(Exists(PriceBar.objects.filter(
+            asset_id=keep, interval=OuterRef('interval'), timestamp=OuterRef('timestamp')))).delete()
+        PriceBar.objects.filter(asset_id__in=extra).update(asset_id=keep)
+        if Quote.objects.filter(asset_id=keep).exists():
+            Quote.objects.filter(asset_id__in=extra).delete()
+        else:
+            moved = Quote.objects.filter(asset_id__in=extra).order_by('-timestamp').first()
+            Quote.objects.filter(asset_id__in=extra).exclude(pk=getattr(moved, 'pk', None)).delete()
+            Quote.objects.filter(asset_id__in=extra).update(asset_id=keep)
+        # ledgers of merged positions are stale either way: run rebuild_ledger afterwards
+        PositionLedger.objects.filter(asset_id__in=extra).filter(Exists(PositionLedger.objects.filter(
+            asset_id=keep, portfolio_id=OuterRef('portfolio_id')))).delete()
+        PositionLedger.objects.filter(asset_id__in=extra).update(asset_id=keep)
+
+        Asset.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+    # the data step runs in its own transaction before the index is built
+    atomic = False
+
+    dependencies = [
+        ('trading_portfolio', '0008_portfolio_snapshots'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_assets, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='asset',
+            name='symbol',
+            field=models.CharField(max_length=120, unique=True),
+        ),
+    ]
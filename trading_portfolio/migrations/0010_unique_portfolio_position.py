@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:44
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_positions(apps, schema_editor):
+    """Fold duplicate (portfolio, asset) rows into the oldest one, summing their quantities."""
+    PortfolioPosition = apps.get_model('trading_portfolio', 'PortfolioPosition')
+
+    duplicates = (PortfolioPosition.objects.values('portfolio_id', 'asset_id')
+                  .annotate(rows=Count('id'), keep=Min('id'), total=Sum('quantity')).filter(rows__gt=1))
+    for row in duplicates:
+        PortfolioPosition.objects.filter(portfolio_id=row['portfolio_id'], asset_id=row['asset_id']) \
+            .exclude(id=row['keep']).delete()
+        if row['total']:
+            PortfolioPosition.objects.filter(id=row['keep']).update(quantity=row['total'])
+        else:
+            PortfolioPosition.objects.filter(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+    # the data step runs in its own transaction before the constraint is added
+    atomic = False
+
+    dependencies = [
+        ('trading_portfolio', '0009_unique_asset_symbol'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_positions, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='portfolioposition',
+            constraint=models.UniqueConstraint(fields=('portfolio', 'asset'), name='unique_portfolio_position'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0012_watchlist'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp', 'id'], name='transaction_timestamp_idx'),
+        ),
+    ]
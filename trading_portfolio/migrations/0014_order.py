@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0013_transaction_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('BUY', 'Buy'), ('SELL', 'Sell')], max_length=4)),
+                ('order_type', models.CharField(choices=[('limit', 'Limit'), ('stop', 'Stop')], max_length=5)),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('filled', 'Filled'), ('cancelled', 'Cancelled'), ('rejected', 'Rejected')], default='open', max_length=9)),
+                ('reason', models.CharField(blank=True, max_length=120)),
+                ('fill_price', models.DecimalField(blank=True, decimal_places=8, max_digits=20, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='trading_portfolio.asset')),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='trading_portfolio.portfolio')),
+                ('trade', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order', to='trading_portfolio.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='order_status_idx'), models.Index(fields=['updated_at'], name='order_updated_idx'), models.Index(fields=['portfolio', 'status', 'id'], name='order_portfolio_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_portfolio', '0014_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['is_active', 'last_activity'], name='user_session_idle_idx'),
+        ),
+    ]
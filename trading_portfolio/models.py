@@ -29,21 +29,25 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s Profile"
 
 
-# Auto-create profile when user is created
+# Auto-create profile when user is created (bulk imports create it themselves, see provisioning.py)
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
         UserProfile.objects.create(user=instance)
 
 
+# save profile changes made through user.profile along with the user. Partial saves (the last_login update
+# at every login), new users and profiles never loaded on this instance have nothing to save
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if created or raw or update_fields is not None or not User.profile.is_cached(instance):
+        return
     instance.profile.save()
 
 
-# create Usersession model
+# create Usersession model, one row per login session (see activity.py)
 class UserSession(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_sessions')
     session_key = models.CharField(max_length=40, unique=True)
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField()
@@ -53,14 +57,28 @@ class UserSession(models.Model):
 
     class Meta:
         db_table = 'user_sessions'
+        indexes = [
+            # the idle sweep in activity.py
+            models.Index(fields=['is_active', 'last_activity'], name='user_session_idle_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.session_key[:10]}..."
 
 
+# symbols on the user's dashboard ticker table, in display order (see watchlists.py)
+class Watchlist(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='watchlist')
+    symbols = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s Watchlist"
+
+
 # create assets model
 class Asset(models.Model):
-    symbol = models.CharField(max_length=120)
+    symbol = models.CharField(max_length=120, unique=True)
     name = models.CharField(max_length=120)
     asset_type = models.CharField(max_length=120, choices=[
         ('stock', 'Stock'),
@@ -88,7 +106,16 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=4, choices=[('BUY', 'Buy'), ('SELL', 'Sell')])
     quantity = models.DecimalField(max_digits=20, decimal_places=8)
     price = models.DecimalField(max_digits=20, decimal_places=8)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # default instead of auto_now_add so imports and backfills can keep historical times
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of a portfolio's history, newest first
+            models.Index(fields=['portfolio', 'timestamp', 'id'], name='transaction_history_idx'),
+            # the admin's date hierarchy (min/max, years) and newest-first changelist over all portfolios
+            models.Index(fields=['timestamp', 'id'], name='transaction_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type} {self.quantity} {self.asset.symbol} @ {self.price}"
@@ -99,6 +126,149 @@ class PortfolioPosition(models.Model):
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=20, decimal_places=8)
 
+    class Meta:
+        constraints = [
+            # position writes are upserts on this key, see positions.py
+            models.UniqueConstraint(fields=['portfolio', 'asset'], name='unique_portfolio_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.portfolio.user.username} holds {self.quantity} of {self.asset.symbol}"
+
+# market data written by the ingest_market_data worker
+BAR_INTERVALS = [
+    ('1m', '1 Minute'),
+    ('1d', '1 Day'),
+]
+
+
+class PriceBar(models.Model):
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='bars')
+    interval = models.CharField(max_length=4, choices=BAR_INTERVALS, default='1m')
+    timestamp = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['asset', 'interval', 'timestamp'], name='unique_price_bar'),
+        ]
+
+    def __str__(self):
+        return f"{self.asset.symbol} {self.interval} {self.timestamp:%Y-%m-%d %H:%M} C={self.close}"
+
+
+class Quote(models.Model):
+    asset = models.OneToOneField(Asset, on_delete=models.CASCADE, related_name='quote')
+    last_price = models.DecimalField(max_digits=20, decimal_places=8)
+    open_price = models.DecimalField(max_digits=20, decimal_places=8)
+    timestamp = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.asset.symbol} @ {self.last_price}"
+
+
+# resting orders, matched against the ingested quotes by the in-memory book in orders.py
+ORDER_TYPES = [
+    ('limit', 'Limit'),
+    ('stop', 'Stop'),
+]
+
+ORDER_STATUSES = [
+    ('open', 'Open'),
+    ('filled', 'Filled'),
+    ('cancelled', 'Cancelled'),
+    ('rejected', 'Rejected'),
+]
+
+
+class Order(models.Model):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='orders')
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
+    transaction_type = models.CharField(max_length=4, choices=[('BUY', 'Buy'), ('SELL', 'Sell')])
+    order_type = models.CharField(max_length=5, choices=ORDER_TYPES)
+    quantity = models.DecimalField(max_digits=20, decimal_places=8)
+    # limit price, or the trigger price of a stop
+    price = models.DecimalField(max_digits=20, decimal_places=8)
+    status = models.CharField(max_length=9, choices=ORDER_STATUSES, default='open')
+    reason = models.CharField(max_length=120, blank=True)
+    fill_price = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
+    trade = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='order')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the matcher's rebuild of the open book and its incremental sync of changed rows
+            models.Index(fields=['status', 'id'], name='order_status_idx'),
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+            # a portfolio's open orders, newest first
+            models.Index(fields=['portfolio', 'status', 'id'], name='order_portfolio_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.order_type} {self.transaction_type} {self.quantity} {self.asset.symbol} @ {self.price}"
+
+
+# cost basis ledger, maintained by ledger.py inside the trade path
+COST_METHODS = [
+    ('fifo', 'FIFO'),
+    ('average', 'Average cost'),
+]
+
+
+class PositionLedger(models.Model):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='ledger')
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
+    method = models.CharField(max_length=8, choices=COST_METHODS, default='fifo')
+    quantity = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    avg_cost = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    realized_pnl = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'asset'], name='unique_position_ledger'),
+        ]
+
+    def __str__(self):
+        return f"{self.asset.symbol}: {self.quantity} @ {self.avg_cost} (realised {self.realized_pnl})"
+
+
+# open FIFO lots; fully consumed lots are deleted
+class Lot(models.Model):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='lots')
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=20, decimal_places=8)
+    price = models.DecimalField(max_digits=20, decimal_places=8)
+    opened_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['portfolio', 'asset', 'opened_at', 'id'], name='lot_fifo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} {self.asset.symbol} @ {self.price}"
+
+
+# end-of-day equity per portfolio, written by snapshot_portfolios / backfill_snapshots
+class PortfolioSnapshot(models.Model):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='snapshots')
+    date = models.DateField()
+    cash = models.DecimalField(max_digits=20, decimal_places=2)
+    market_value = models.DecimalField(max_digits=20, decimal_places=2)
+    equity = models.DecimalField(max_digits=20, decimal_places=2)
+    holdings = models.JSONField(default=dict)  # {symbol: quantity}
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'date'], name='unique_portfolio_snapshot'),
+        ]
 
     def __str__(self):
-        return f"{self.portfolio.user.username} holds {self.quantity} of {self.asset.symbol}"
\ No newline at end of file
+        return f"{self.portfolio} {self.date}: {self.equity}"
@@ -0,0 +1,271 @@
+"""
+Resting limit and stop orders.
+
+``place_order`` validates an order like ``execute_trade`` and stores it as an
+open ``Order``. Nothing is reserved: the balance or holdings are checked when
+it fills. ``OrderBook`` keeps the open orders of every asset in memory, in two
+heaps per asset keyed by price:
+
+- ``falling``: BUY limits and SELL stops, triggered once the price is at or
+  below theirs (highest price first, then oldest);
+- ``rising``: SELL limits and BUY stops, triggered once the price is at or
+  above theirs (lowest price first, then oldest).
+
+Adding an order and taking each triggered one costs O(log n), and a quote
+that triggers nothing only looks at the top of both heaps. A cancelled order
+leaves the index at once and its heap entry when it reaches the top, or when
+dead entries outnumber live ones and the asset's heaps are rebuilt.
+
+The book lives in the matching process: ``ingest_market_data`` calls
+``match_quotes`` after each cycle. Web workers only write ``Order`` rows.
+``OrderBook.sync`` loads every open order on its first call, so a restart
+rebuilds the book from the table; later calls apply the rows changed since
+(``updated_at``). Each triggered order is filled in its own transaction at
+the quote price through ``trading.fill``, the same path ``trade_asset``
+uses, after its row is locked and checked to still be open. A rejected fill
+(not enough balance or shares) marks the order rejected with the reason.
+Only quotes written in the last ``QUOTE_FRESH_POLLS`` polling intervals
+(``MARKET_DATA_POLL_INTERVAL``) are matched. After a restart the book
+therefore never fills at the price of a symbol that is no longer ingested.
+"""
+import heapq
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ORDER_STATUSES, ORDER_TYPES, Order, Portfolio, Quote
+from .registry import asset_registry
+from .trading import TradeError, fill, validate_order
+
+logger = logging.getLogger(__name__)
+
+# order rows changed this long before the last one seen are read again: web workers' clocks differ and
+# their transactions commit late
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# quotes older than this many ingestion polls are not matched
+QUOTE_FRESH_POLLS = 2
+
+
+def falls(transaction_type, order_type):
+    """True for orders triggered by the price falling to theirs (BUY limit, SELL stop)."""
+    return (transaction_type == 'BUY') == (order_type == 'limit')
+
+
+class AssetBook:
+    """One asset's open orders: heaps of ``(-price, id)`` and ``(price, id)``."""
+
+    __slots__ = ('falling', 'rising', 'live', 'dead')
+
+    def __init__(self):
+        self.falling = []
+        self.rising = []
+        self.live = 0
+        self.dead = 0
+
+
+class OrderBook:
+    """Per-process index of open orders by asset and trigger price."""
+
+    def __init__(self):
+        self.orders = {}  # order id -> (asset id, falls, price)
+        self.books = {}
+        self.synced_at = None
+        self.quoted_at = None
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, order_id, asset_id, falling, price):
+        if order_id in self.orders:
+            return
+        self.orders[order_id] = (asset_id, falling, price)
+        book = self.books.get(asset_id) or self.books.setdefault(asset_id, AssetBook())
+        if falling:
+            heapq.heappush(book.falling, (-price, order_id))
+        else:
+            heapq.heappush(book.rising, (price, order_id))
+        book.live += 1
+
+    def remove(self, order_id):
+        entry = self.orders.pop(order_id, None)
+        if entry is None:
+            return False
+        asset_id = entry[0]
+        book = self.books[asset_id]
+        book.live -= 1
+        book.dead += 1
+        if not book.live:
+            del self.books[asset_id]
+        elif book.dead > book.live:
+            self.compact(book)
+        return True
+
+    def compact(self, book):
+        book.falling = [item for item in book.falling if item[1] in self.orders]
+        book.rising = [item for item in book.rising if item[1] in self.orders]
+        heapq.heapify(book.falling)
+        heapq.heapify(book.rising)
+        book.dead = 0
+
+    def load(self, rows):
+        """Replace the book with ``rows`` of ``(order id, asset id, falls, price)`` in O(n)."""
+        self.orders.clear()
+        self.books.clear()
+        for order_id, asset_id, falling, price in rows:
+            self.orders[order_id] = (asset_id, falling, price)
+            book = self.books.get(asset_id) or self.books.setdefault(asset_id, AssetBook())
+            if falling:
+                book.falling.append((-price, order_id))
+            else:
+                book.rising.append((price, order_id))
+            book.live += 1
+        for book in self.books.values():
+            heapq.heapify(book.falling)
+            heapq.heapify(book.rising)
+
+    def match(self, asset_id, price):
+        """Remove and return the ids of the orders on ``asset_id`` that ``price`` triggers, in priority order."""
+        book = self.books.get(asset_id)
+        if book is None:
+            return []
+        triggered = []
+        for heap, key in ((book.falling, -price), (book.rising, price)):
+            while heap and heap[0][0] <= key:
+                order_id = heapq.heappop(heap)[1]
+                if self.orders.pop(order_id, None) is None:
+                    book.dead -= 1
+                else:
+                    book.live -= 1
+                    triggered.append(order_id)
+        if not book.live:
+            del self.books[asset_id]
+        return triggered
+
+    def sync(self):
+        """Load the open orders on the first call, then apply the orders changed since; return rows read."""
+        started = timezone.now()
+        rows = Order.objects.order_by().values_list('id', 'asset_id', 'transaction_type', 'order_type', 'price',
+                                                    'status', 'updated_at')
+        if self.synced_at is None:
+            rows = list(rows.filter(status='open').iterator(chunk_size=5000))
+            self.load((order_id, asset_id, falls(transaction_type, order_type), price)
+                      for order_id, asset_id, transaction_type, order_type, price, _, _ in rows)
+            self.synced_at = started
+            return len(rows)
+
+        rows = list(rows.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP))
+        for order_id, asset_id, transaction_type, order_type, price, status, updated_at in rows:
+            if status == 'open':
+                self.add(order_id, asset_id, falls(transaction_type, order_type), price)
+            else:
+                self.remove(order_id)
+            self.synced_at = max(self.synced_at, updated_at)
+        return len(rows)
+
+    def reset(self):
+        """Rebuild from the table on the next ``sync``."""
+        self.synced_at = None
+
+
+order_book = OrderBook()
+
+
+def place_order(user, symbol, transaction_type, order_type, quantity, price):
+    """Store an open limit or stop order for ``user`` and return it, raising ``TradeError`` on bad input."""
+    symbol, transaction_type, quantity, price = validate_order(symbol, transaction_type, quantity, price)
+    if order_type not in dict(ORDER_TYPES):
+        raise TradeError("Invalid order type!", 'invalid')
+    # outside the transaction so the registry can cache it
+    asset = asset_registry.get(symbol)
+    limit = settings.ORDERS_MAX_OPEN
+    with transaction.atomic():
+        # the portfolio row lock serialises concurrent placements, so the cap holds (fills do not take it)
+        portfolio_id = (Portfolio.objects.select_for_update().filter(user_id=user.pk)
+                        .values_list('id', flat=True).first())
+        if portfolio_id is None:
+            raise TradeError("No trading account!", 'no_account')
+        if Order.objects.filter(portfolio_id=portfolio_id, status='open').count() >= limit:
+            raise TradeError(f"At most {limit} open orders!", 'too_many_orders')
+        return Order.objects.create(portfolio_id=portfolio_id, asset_id=asset.id,
+                                    transaction_type=transaction_type, order_type=order_type, quantity=quantity,
+                                    price=price)
+
+
+def cancel_order(user, order_id):
+    """Cancel one of ``user``'s open orders; an order being filled is locked until the fill commits."""
+    cancelled = (Order.objects.filter(pk=order_id, portfolio__user_id=user.pk, status='open')
+                 .update(status='cancelled', updated_at=timezone.now()))
+    if not cancelled:
+        raise TradeError("No open order with this id!", 'not_found')
+
+
+def list_orders(user, status='open', limit=100):
+    """``user``'s newest orders with ``status`` (any status when None)."""
+    if status is not None and status not in dict(ORDER_STATUSES):
+        raise TradeError("Invalid status!", 'invalid')
+    orders = Order.objects.filter(portfolio__user_id=user.pk).order_by('-id')
+    if status is not None:
+        orders = orders.filter(status=status)
+    return list(orders[:limit])
+
+
+def serialize_orders(orders):
+    symbols = asset_registry.symbols({order.asset_id for order in orders})
+    return [{
+        'id': order.pk,
+        'symbol': symbols.get(order.asset_id),
+        'transaction_type': order.transaction_type,
+        'order_type': order.order_type,
+        'quantity': str(order.quantity),
+        'price': str(order.price),
+        'status': order.status,
+        'reason': order.reason,
+        'fill_price': None if order.fill_price is None else str(order.fill_price),
+        'created_at': order.created_at.isoformat(),
+    } for order in orders]
+
+
+def execute(order_id, price):
+    """Fill a triggered order at ``price``; return ``'filled'``, ``'rejected'`` or None when it is no longer open."""
+    with transaction.atomic():
+        row = (Order.objects.select_for_update(of=('self',)).filter(pk=order_id, status='open')
+               .values_list('portfolio__user_id', 'asset_id', 'transaction_type', 'quantity').first())
+        if row is None:
+            return None
+        user_id, asset_id, transaction_type, quantity = row
+        symbol = asset_registry.symbols([asset_id])[asset_id]
+        now = timezone.now()
+        try:
+            result = fill(user_id, symbol, transaction_type, quantity, price)
+        except TradeError as e:
+            # fill() rolled back to its savepoint, only the order changes
+            Order.objects.filter(pk=order_id).update(status='rejected', reason=e.message, updated_at=now)
+            return 'rejected'
+        Order.objects.filter(pk=order_id).update(status='filled', fill_price=price, trade=result.transaction,
+                                                 updated_at=now)
+        return 'filled'
+
+
+def match_quotes(book=order_book):
+    """Sync ``book``, match it against the quotes stored since the last call and fill what they trigger."""
+    counts = {'filled': 0, 'rejected': 0, 'gone': 0, 'failed': 0}
+    book.sync()
+    since = timezone.now() - timedelta(seconds=QUOTE_FRESH_POLLS * settings.MARKET_DATA_POLL_INTERVAL)
+    if book.quoted_at is not None:
+        since = max(since, book.quoted_at)
+    quotes = Quote.objects.order_by().filter(updated_at__gt=since).values_list('asset_id', 'last_price', 'updated_at')
+    for asset_id, price, updated_at in quotes:
+        book.quoted_at = max(book.quoted_at or updated_at, updated_at)
+        for order_id in book.match(asset_id, price):
+            try:
+                counts[execute(order_id, price) or 'gone'] += 1
+            except Exception:
+                # the order left the book but is still open in the table: reload the book next time
+                counts['failed'] += 1
+                book.reset()
+                logger.exception("Error filling order %s", order_id)
+    return counts
@@ -0,0 +1,77 @@
+"""
+Position writes.
+
+``PortfolioPosition`` is unique per (portfolio, asset), so a buy is a single
+upsert that inserts the row or increments it in place (``ON CONFLICT ... DO
+UPDATE`` on PostgreSQL and SQLite, ``ON DUPLICATE KEY UPDATE`` on MySQL) and
+returns the new quantity where the backend supports ``RETURNING``. Batches
+write absolute quantities with one ``bulk_create(update_conflicts=True)``.
+"""
+from decimal import Decimal
+
+from django.db import connection
+
+from .models import PortfolioPosition
+
+UPSERT_SQL = {
+    'mysql': "INSERT INTO {table} ({portfolio}, {asset}, {quantity}) VALUES (%s, %s, %s) "
+             "ON DUPLICATE KEY UPDATE {quantity} = {quantity} + VALUES({quantity})",
+    'default': "INSERT INTO {table} ({portfolio}, {asset}, {quantity}) VALUES (%s, %s, %s) "
+               "ON CONFLICT ({portfolio}, {asset}) DO UPDATE SET {quantity} = {table}.{quantity} + EXCLUDED.{quantity}",
+}
+
+
+def can_return():
+    # MariaDB's INSERT ... RETURNING does not report the updated row of an upsert
+    return connection.vendor != 'mysql' and connection.features.can_return_columns_from_insert
+
+
+def upsert_sql():
+    opts = PortfolioPosition._meta
+    quote = connection.ops.quote_name
+    sql = UPSERT_SQL.get(connection.vendor, UPSERT_SQL['default']).format(
+        table=quote(opts.db_table),
+        portfolio=quote(opts.get_field('portfolio').column),
+        asset=quote(opts.get_field('asset').column),
+        quantity=quote(opts.get_field('quantity').column),
+    )
+    if can_return():
+        sql += " RETURNING %s" % quote(opts.get_field('quantity').column)
+    return sql
+
+
+def as_decimal(value):
+    # SQLite hands back int/float, PostgreSQL and MySQL a Decimal
+    return value if isinstance(value, Decimal) else Decimal(str(round(float(value), 8)))
+
+
+def increment_position(portfolio_id, asset_id, quantity):
+    """Add ``quantity`` to the position (creating it) in one statement and return the new quantity."""
+    with connection.cursor() as cursor:
+        quantity = PortfolioPosition._meta.get_field('quantity').get_db_prep_save(quantity, connection)
+        cursor.execute(upsert_sql(), [portfolio_id, asset_id, quantity])
+        if can_return():
+            return as_decimal(cursor.fetchone()[0])
+    # no RETURNING (MySQL): the upsert holds the row lock, read it back
+    return (PortfolioPosition.objects.filter(portfolio_id=portfolio_id, asset_id=asset_id)
+            .values_list('quantity', flat=True).get())
+
+
+def write_positions(portfolio_id, positions, holdings):
+    """Persist ``holdings`` ({asset_id: quantity}) against the locked ``positions`` rows."""
+    changed, emptied = [], []
+    for asset_id, quantity in holdings.items():
+        position = positions.get(asset_id)
+        if quantity == 0:
+            if position is not None:
+                emptied.append(position.pk)
+        elif position is None or quantity != position.quantity:
+            changed.append(PortfolioPosition(portfolio_id=portfolio_id, asset_id=asset_id, quantity=quantity))
+
+    if changed:
+        PortfolioPosition.objects.bulk_create(
+            changed, batch_size=500, update_conflicts=True,
+            unique_fields=['portfolio', 'asset'], update_fields=['quantity'],
+        )
+    if emptied:
+        PortfolioPosition.objects.filter(pk__in=emptied).delete()
@@ -0,0 +1,265 @@
+"""
+Market data providers.
+
+Every provider returns OHLCV bars as one pandas DataFrame per symbol with a
+UTC ``DatetimeIndex`` and ``open``/``high``/``low``/``close``/``volume``
+columns. ``MARKET_DATA_PROVIDER`` picks the provider used by the views and
+``MARKET_DATA_INGEST_PROVIDER`` the one polled by ``ingest_market_data``;
+both accept an alias from ``PROVIDERS`` or a dotted path to a class.
+
+pandas and yfinance are imported inside the methods that use them, so a
+worker that never serves market data never loads them (see ``warmup.py``).
+"""
+import os
+import time
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .metrics import timed
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+INTERVALS = ('1m', '2m', '5m', '15m', '30m', '60m', '1h', '1d', '1wk')
+
+PERIODS = {
+    '1d': timedelta(days=1),
+    '5d': timedelta(days=5),
+    '1mo': timedelta(days=31),
+    '3mo': timedelta(days=92),
+    '6mo': timedelta(days=183),
+    '1y': timedelta(days=366),
+    '2y': timedelta(days=731),
+    '5y': timedelta(days=1827),
+}
+
+
+INTERVAL_STEPS = {
+    '1m': timedelta(minutes=1),
+    '2m': timedelta(minutes=2),
+    '5m': timedelta(minutes=5),
+    '15m': timedelta(minutes=15),
+    '30m': timedelta(minutes=30),
+    '60m': timedelta(hours=1),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+    '1wk': timedelta(weeks=1),
+}
+
+
+def period_to_timedelta(period):
+    try:
+        return PERIODS[period]
+    except KeyError:
+        raise ValueError(f"Unsupported period {period!r}")
+
+
+def normalise_bars(frame):
+    """
+    Lower-case the columns, drop rows without a close and index by UTC
+    timestamp. A missing open, high or low is filled from the bar's close (and
+    open), a missing volume with 0, so no column holds NaN.
+    """
+    import pandas as pd
+
+    frame = frame.rename(columns=str.lower)
+    frame = frame.reindex(columns=BAR_COLUMNS).dropna(subset=['close'])
+    index = pd.DatetimeIndex(frame.index)
+    frame.index = index.tz_localize('UTC') if index.tz is None else index.tz_convert('UTC')
+    frame['open'] = frame['open'].fillna(frame['close'])
+    frame['high'] = frame['high'].fillna(frame[['open', 'close']].max(axis=1))
+    frame['low'] = frame['low'].fillna(frame[['open', 'close']].min(axis=1))
+    frame['volume'] = frame['volume'].fillna(0)
+    return frame.sort_index()
+
+
+class MarketDataProvider:
+    """Base class: subclasses implement ``get_bars``."""
+
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        raise NotImplementedError
+
+    def get_quotes(self, symbols):
+        """Latest quote per symbol, built from the last 1m bar like the dashboard always did."""
+        bars = self.get_bars(symbols, period='1d', interval='1m')
+        quotes = {}
+        for symbol in symbols:
+            frame = bars.get(symbol)
+            if frame is None or frame.empty:
+                continue
+            last = frame.iloc[-1]
+            quotes[symbol] = {
+                'last_price': float(last['close']),
+                'open_price': float(last['open']),
+                'timestamp': frame.index[-1].to_pydatetime(),
+            }
+        return quotes
+
+
+class YFinanceProvider(MarketDataProvider):
+
+    @timed('upstream')
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        import pandas as pd
+        import yfinance as yf
+
+        symbols = list(symbols)
+        data = yf.download(tickers=symbols, period=period, interval=interval, group_by='ticker',
+                           auto_adjust=True, progress=False)
+        bars = {}
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                frame = data[symbol]
+            else:
+                frame = data
+            bars[symbol] = normalise_bars(frame)
+        return bars
+
+
+class FileProvider(MarketDataProvider):
+    """
+    Offline provider reading ``<SYMBOL>.csv`` (or ``<SYMBOL>_<interval>.csv``) files with
+    ``timestamp,open,high,low,close,volume`` columns. The period is measured back from
+    the last row of each file so the data never goes stale.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.MARKET_DATA_DIR
+
+    def _path(self, symbol, interval):
+        for name in (f'{symbol}_{interval}.csv', f'{symbol}.csv'):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    @timed('upstream')
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        import pandas as pd
+
+        span = period_to_timedelta(period)
+        bars = {}
+        for symbol in symbols:
+            path = self._path(symbol, interval)
+            if path is None:
+                continue
+            frame = normalise_bars(pd.read_csv(path, index_col='timestamp', parse_dates=True))
+            if not frame.empty:
+                frame = frame[frame.index > frame.index[-1] - span]
+            bars[symbol] = frame
+        return bars
+
+
+class DatabaseProvider(MarketDataProvider):
+    """Reads what ``ingest_market_data`` stored, so requests never wait on the network."""
+
+    # not timed as upstream: its queries are already counted as db time
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        import pandas as pd
+
+        from .models import PriceBar
+        from .registry import asset_registry
+
+        since = timezone.now() - period_to_timedelta(period)
+        by_id = {asset.id: symbol for symbol, asset in asset_registry.resolve(symbols, create=False).items()}
+        rows = (PriceBar.objects
+                .filter(asset_id__in=list(by_id), interval=interval, timestamp__gt=since)
+                .order_by('timestamp')
+                .values_list('asset_id', 'timestamp', *BAR_COLUMNS))
+        frame = pd.DataFrame.from_records(list(rows), columns=['asset_id', 'timestamp', *BAR_COLUMNS])
+        bars = {}
+        for asset_id, group in frame.groupby('asset_id'):
+            group = group.set_index('timestamp')[BAR_COLUMNS].astype('float64')
+            bars[by_id[asset_id]] = normalise_bars(group)
+        return bars
+
+    def get_quotes(self, symbols):
+        from .models import Quote
+        from .registry import asset_registry
+
+        by_id = {asset.id: symbol for symbol, asset in asset_registry.resolve(symbols, create=False).items()}
+        quotes = {}
+        for quote in Quote.objects.filter(asset_id__in=list(by_id)):
+            quotes[by_id[quote.asset_id]] = {
+                'last_price': float(quote.last_price),
+                'open_price': float(quote.open_price),
+                'timestamp': quote.timestamp,
+            }
+        return quotes
+
+
+class FakeProvider(MarketDataProvider):
+    """
+    Deterministic synthetic prices for tests and benchmarks, no network or files.
+
+    Every symbol gets a base price and phase from its CRC32 and the close at a
+    timestamp is a sum of sine waves of that timestamp, so the same symbol and
+    bar always have the same values in every process and run. Bars end at the
+    current interval and are capped at ``FAKE_MAX_BARS``.
+    ``MARKET_DATA_FAKE_LATENCY_MS`` adds a sleep per call to stand in for a
+    network round trip.
+    """
+
+    FAKE_MAX_BARS = 5000
+
+    def __init__(self, latency_ms=None):
+        if latency_ms is None:
+            latency_ms = getattr(settings, 'MARKET_DATA_FAKE_LATENCY_MS', 0)
+        self.latency = latency_ms / 1000
+
+    @staticmethod
+    def closes(symbol, minutes):
+        import numpy as np
+
+        seed = zlib.crc32(symbol.upper().encode())
+        base, phase = 20 + seed % 480, (seed >> 9) % 1000
+        return base * (1 + 0.08 * np.sin(minutes / 2880 + phase) + 0.02 * np.sin(minutes / 97 + 3 * phase)
+                       + 0.005 * np.sin(minutes / 7.3 + 7 * phase))
+
+    @timed('upstream')
+    def get_bars(self, symbols, period='1d', interval='1m'):
+        import numpy as np
+        import pandas as pd
+
+        if self.latency:
+            time.sleep(self.latency)
+        step = INTERVAL_STEPS[interval]
+        count = min(self.FAKE_MAX_BARS, max(1, period_to_timedelta(period) // step))
+        end = pd.Timestamp.now(tz='UTC').floor(step)
+        index = pd.date_range(end=end, periods=count, freq=step, name='timestamp')
+        minutes = index.asi8 // 60_000_000_000
+        step_minutes = step // timedelta(minutes=1)
+
+        bars = {}
+        for symbol in symbols:
+            volume = 1000 + (minutes % 97) * 37 + zlib.crc32(symbol.upper().encode()) % 5000
+            close = self.closes(symbol, minutes)
+            open_ = self.closes(symbol, minutes - step_minutes)
+            bars[symbol] = pd.DataFrame({
+                'open': open_.round(4),
+                'high': (np.maximum(open_, close) * 1.001).round(4),
+                'low': (np.minimum(open_, close) * 0.999).round(4),
+                'close': close.round(4),
+                'volume': volume.astype('float64'),
+            }, index=index, columns=BAR_COLUMNS)
+        return bars
+
+
+PROVIDERS = {
+    'yfinance': YFinanceProvider,
+    'file': FileProvider,
+    'database': DatabaseProvider,
+    'fake': FakeProvider,
+}
+
+
+def get_provider(name=None):
+    """Instantiate the provider named by ``name`` or by the ``MARKET_DATA_PROVIDER`` setting."""
+    name = name or settings.MARKET_DATA_PROVIDER
+    provider_class = PROVIDERS.get(name) or import_string(name)
+    return provider_class()
@@ -0,0 +1,119 @@
+"""
+Bulk account provisioning: users with their profile and portfolio, written
+with ``bulk_create`` in chunks.
+
+Creating users one by one costs a user insert, a profile insert and save and a
+portfolio insert through the ``post_save`` receivers. ``provision`` writes
+each chunk with one existence check and one insert per table and sends no
+signals. Rows are dicts with ``username`` and optionally ``email``,
+``first_name``, ``last_name``, ``account_balance`` and either ``password``
+(hashed here, which dominates the run time for large files) or
+``password_hash`` (already in a Django hasher format). Rows without either get
+the shared ``password`` argument, hashed once, or an unusable password.
+Existing usernames and repeats within the input are skipped, and invalid rows
+are reported and skipped. The ``provision_accounts`` command reads the rows
+from CSV or JSON.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Portfolio, UserProfile
+
+CHUNK = 1000
+
+
+def read_accounts(path, format=None):
+    """Rows from a CSV file with a header or a JSON list of objects (by extension unless ``format`` is given)."""
+    format = format or ('json' if path.endswith('.json') else 'csv')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if format == 'json':
+            return json.load(f)
+        return list(csv.DictReader(f))
+
+
+def build_user(row, shared_hash, now):
+    username = (row.get('username') or '').strip()
+    User.username_validator(username)
+    if len(username) > User._meta.get_field('username').max_length:
+        raise ValidationError("Username too long")
+
+    if row.get('password_hash'):
+        identify_hasher(row['password_hash'])
+        password = row['password_hash']
+    elif row.get('password'):
+        password = make_password(row['password'])
+    else:
+        password = shared_hash
+
+    try:
+        balance = Decimal(row['account_balance']) if row.get('account_balance') not in (None, '') else None
+    except InvalidOperation:
+        raise ValidationError("Invalid account_balance")
+
+    user = User(username=username, email=User.objects.normalize_email(row.get('email') or ''),
+                first_name=row.get('first_name') or '', last_name=row.get('last_name') or '',
+                password=password, date_joined=now)
+    return user, balance
+
+
+def provision(rows, password=None, chunk=CHUNK):
+    """Create the accounts and return ``{'created', 'skipped', 'errors': [(line, message)]}``."""
+    shared_hash = make_password(password)
+    now = timezone.now()
+    result = {'created': 0, 'skipped': 0, 'errors': []}
+    seen = set()
+    batch = []
+
+    def flush():
+        created = write_chunk(batch)
+        result['created'] += created
+        result['skipped'] += len(batch) - created
+        batch.clear()
+
+    for line, row in enumerate(rows, start=1):
+        try:
+            user, balance = build_user(row, shared_hash, now)
+        except (ValidationError, ValueError) as e:
+            message = e.messages[0] if isinstance(e, ValidationError) else str(e)
+            result['errors'].append((line, message))
+            continue
+        if user.username in seen:
+            result['skipped'] += 1
+            continue
+        seen.add(user.username)
+        batch.append((user, balance))
+        if len(batch) == chunk:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+@transaction.atomic
+def write_chunk(batch):
+    """Insert the users of ``batch`` that do not exist yet, with a profile and a portfolio each."""
+    existing = set(User.objects.filter(username__in=[user.username for user, _ in batch])
+                   .values_list('username', flat=True))
+    batch = [(user, balance) for user, balance in batch if user.username not in existing]
+    if not batch:
+        return 0
+    users = User.objects.bulk_create([user for user, _ in batch])
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # MySQL does not return the primary keys of bulk inserts
+        ids = dict(User.objects.filter(username__in=[user.username for user in users])
+                   .values_list('username', 'id'))
+        for user in users:
+            user.pk = ids[user.username]
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, **({'account_balance': balance} if balance is not None else {}))
+        for user, balance in batch
+    ])
+    Portfolio.objects.bulk_create([Portfolio(user=user) for user in users])
+    return len(users)
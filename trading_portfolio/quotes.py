@@ -0,0 +1,323 @@
+"""
+Shared quote cache for the ticker tables and watchlists.
+
+Rows are cached per symbol in the Django cache backend so every gunicorn
+worker and every watchlist containing a symbol share it. A row is fresh for
+``QUOTE_CACHE_TTL`` seconds and can then be served stale for another
+``QUOTE_CACHE_STALE_TTL`` seconds while a single refresh runs in the
+background. Refresh locks are taken per symbol with ``cache.add``, and the
+misses of concurrent requests in a worker are merged by ``QuoteBatcher`` into
+one provider call. Upstream calls therefore follow the number of distinct
+symbols, not the number of users.
+
+The single-flight guarantee (one worker talks to the provider about a symbol
+at a time) needs a cache whose ``add()`` is atomic: Redis (``REDIS_URL``).
+The default file cache's ``add()`` checks and then sets, so two workers can
+take the same lock and refresh the same symbol. Hit and miss counters are
+kept per process and added to the shared cache at most every
+``STATS_FLUSH_SECONDS`` (or when ``stats()`` is read), so a request pays no
+extra round trips for them. On the file cache ``incr()`` is also check-then-set,
+so concurrent flushes can lose counts.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .providers import get_provider
+
+logger = logging.getLogger(__name__)
+
+# symbols shown in the dashboard ticker table
+FINANCIAL_TABLE_SYMBOLS = ['AAPL', 'MSFT', 'TSLA', 'GOOG', 'AMZN', 'RGTI', 'UBER', 'JEPQ', 'LCID']
+
+# per request to /quotes/ and /quotes/stream/
+MAX_SYMBOLS = 50
+
+STAT_NAMES = ('hit', 'stale', 'miss', 'refresh', 'error')
+
+KEY_PREFIX = 'quotes'
+
+STATS_FLUSH_SECONDS = 10
+
+
+def parse_symbols(value):
+    """``'aapl, msft'`` -> ``['AAPL', 'MSFT']``, the dashboard table if empty, None if too many."""
+    symbols = [s.strip().upper() for s in value.split(',') if s.strip()]
+    if len(symbols) > MAX_SYMBOLS or any(len(s) > 20 for s in symbols):
+        return None
+    return symbols or FINANCIAL_TABLE_SYMBOLS
+
+
+def empty_quote(symbol):
+    return {
+        'symbol': symbol,
+        'last_price': 'N/A',
+        'open_price': 'N/A',
+        'change_percent': 'N/A'
+    }
+
+
+def fetch_quotes(symbols):
+    """Fetch the latest quotes for ``symbols`` in one provider call and build the ticker table rows."""
+    quotes = get_provider().get_quotes(symbols)
+
+    result = []
+    for symbol in symbols:
+        quote = quotes.get(symbol)
+        if quote is None or not quote['open_price']:
+            result.append(empty_quote(symbol))
+            continue
+        last_price = quote['last_price']
+        open_price = quote['open_price']
+        percent_change = ((last_price - open_price) / open_price) * 100
+
+        result.append({
+            'symbol': symbol,
+            'last_price': round(last_price, 2),
+            'open_price': round(open_price, 2),
+            'change_percent': round(percent_change, 2)
+        })
+    return result
+
+
+class QuoteBatcher:
+    """
+    Coalesce concurrent fetches in this process into one provider call.
+
+    The first caller opens a batch and waits ``QUOTE_BATCH_WINDOW_MS``; every
+    fetch that arrives meanwhile adds its symbols to it. The leader then fetches
+    the union once and each caller takes its own rows from the result.
+    """
+
+    def __init__(self, fetch=fetch_quotes):
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._open = None
+        self.counters = {'requests': 0, 'batches': 0, 'symbols': 0}
+
+    # settings are read on every call so override_settings works in tests
+    @property
+    def window(self):
+        return getattr(settings, 'QUOTE_BATCH_WINDOW_MS', 20) / 1000
+
+    def __call__(self, symbols):
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = {'symbols': {}, 'rows': None, 'error': None, 'done': threading.Event()}
+            batch['symbols'].update(dict.fromkeys(symbols))
+            self.counters['requests'] += 1
+
+        if leader:
+            if self.window:
+                time.sleep(self.window)
+            with self._lock:
+                self._open = None
+                self.counters['batches'] += 1
+                self.counters['symbols'] += len(batch['symbols'])
+            try:
+                batch['rows'] = {row['symbol']: row for row in self.fetch(list(batch['symbols']))}
+            except Exception as e:
+                batch['error'] = e
+            finally:
+                batch['done'].set()
+        else:
+            batch['done'].wait()
+
+        if batch['error'] is not None:
+            raise batch['error']
+        return [batch['rows'].get(symbol) or empty_quote(symbol) for symbol in symbols]
+
+    def stats(self):
+        return dict(self.counters)
+
+
+class QuoteCache:
+    """Per-symbol TTL quote cache with stale-while-revalidate and single-flight refreshes."""
+
+    def __init__(self, fetch=fetch_quotes, cache_alias='default'):
+        self.fetch = fetch
+        self.cache_alias = cache_alias
+        self._counts = dict.fromkeys(STAT_NAMES, 0)
+        self._counts_lock = threading.Lock()
+        self._counts_flushed_at = time.monotonic()
+
+    # settings are read on every call so override_settings works in tests
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'QUOTE_CACHE_TTL', 30)
+
+    @property
+    def stale_ttl(self):
+        return getattr(settings, 'QUOTE_CACHE_STALE_TTL', 300)
+
+    @property
+    def lock_timeout(self):
+        return getattr(settings, 'QUOTE_CACHE_LOCK_TIMEOUT', 30)
+
+    @property
+    def background_refresh(self):
+        return getattr(settings, 'QUOTE_CACHE_BACKGROUND_REFRESH', True)
+
+    def _key(self, kind, symbol):
+        digest = hashlib.sha1(symbol.encode()).hexdigest()
+        return f'{KEY_PREFIX}:{kind}:{digest}'
+
+    def _incr(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+            due = time.monotonic() - self._counts_flushed_at >= STATS_FLUSH_SECONDS
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Add this process's counters to the shared ones."""
+        with self._counts_lock:
+            counts, self._counts = self._counts, dict.fromkeys(STAT_NAMES, 0)
+            self._counts_flushed_at = time.monotonic()
+        for name, count in counts.items():
+            if not count:
+                continue
+            key = f'{KEY_PREFIX}:stats:{name}'
+            if self.cache.add(key, count, timeout=None):
+                continue
+            try:
+                self.cache.incr(key, count)
+            except ValueError:
+                # evicted between add() and incr()
+                self.cache.set(key, count, timeout=None)
+
+    def stats(self):
+        self.flush_stats()
+        keys = {f'{KEY_PREFIX}:stats:{name}': name for name in STAT_NAMES}
+        values = self.cache.get_many(keys.keys())
+        counters = {name: values.get(key, 0) for key, name in keys.items()}
+        served = counters['hit'] + counters['stale'] + counters['miss']
+        counters['hit_ratio'] = round((counters['hit'] + counters['stale']) / served, 4) if served else None
+        return counters
+
+    def reset_stats(self):
+        with self._counts_lock:
+            self._counts = dict.fromkeys(STAT_NAMES, 0)
+        self.cache.delete_many([f'{KEY_PREFIX}:stats:{name}' for name in STAT_NAMES])
+
+    def _entries(self, symbols):
+        keys = {self._key('snapshot', symbol): symbol for symbol in symbols}
+        return {keys[key]: entry for key, entry in self.cache.get_many(keys).items()}
+
+    def get(self, symbols):
+        """
+        Return ticker rows for ``symbols``, refreshing each symbol from the provider at most once per TTL.
+
+        A request counts as a miss if any symbol is missing, stale if any is past its TTL, else a hit.
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        entries = self._entries(symbols)
+        now = time.time()
+        rows = {symbol: entry['quote'] for symbol, entry in entries.items()}
+        missing = [symbol for symbol in symbols if symbol not in entries]
+        stale = [symbol for symbol in symbols if symbol in entries and now - entries[symbol]['fetched_at'] > self.ttl]
+
+        if missing:
+            self._incr('miss')
+            rows.update(self._load(missing))
+        else:
+            self._incr('stale' if stale else 'hit')
+        if stale:
+            # serve the last good rows and let one worker revalidate them
+            self._revalidate(stale)
+        return [rows[symbol] for symbol in symbols]
+
+    def refresh(self, symbols):
+        """Fetch and store the symbols nobody else is refreshing; return their rows or None."""
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        token, locked = self._acquire(symbols)
+        if not locked:
+            return None
+        return self._refresh_locked(locked, token)
+
+    def _acquire(self, symbols):
+        """Lock every symbol not being refreshed elsewhere; return ``(token, locked symbols)``."""
+        token = uuid.uuid4().hex
+        locked = [symbol for symbol in symbols
+                  if self.cache.add(self._key('lock', symbol), token, timeout=self.lock_timeout)]
+        return token, locked
+
+    def _release(self, symbols, token):
+        keys = [self._key('lock', symbol) for symbol in symbols]
+        self.cache.delete_many([key for key, value in self.cache.get_many(keys).items() if value == token])
+
+    def _refresh_locked(self, symbols, token):
+        try:
+            quotes = self.fetch(symbols)
+        except Exception:
+            self._incr('error')
+            logger.exception("Error fetching quotes for %s", symbols)
+            return None
+        else:
+            if all(q['last_price'] == 'N/A' for q in quotes):
+                # a failed upstream call, keep whatever is cached
+                self._incr('error')
+                return None
+            # placeholders are cached for symbols without a row (so unknown symbols cost one call per TTL)
+            # but never replace a good row
+            empty = [q['symbol'] for q in quotes if q['last_price'] == 'N/A']
+            known = {symbol for symbol, entry in (self._entries(empty) if empty else {}).items()
+                     if entry['quote']['last_price'] != 'N/A'}
+            fetched_at = time.time()
+            self.cache.set_many({
+                self._key('snapshot', q['symbol']): {'fetched_at': fetched_at, 'quote': q}
+                for q in quotes if q['symbol'] not in known
+            }, timeout=self.ttl + self.stale_ttl)
+            self._incr('refresh')
+            return quotes
+        finally:
+            self._release(symbols, token)
+
+    def _revalidate(self, symbols):
+        token, locked = self._acquire(symbols)
+        if not locked:
+            return
+        if self.background_refresh:
+            threading.Thread(target=self._refresh_locked, args=(locked, token), daemon=True).start()
+        else:
+            self._refresh_locked(locked, token)
+
+    def _load(self, symbols):
+        token, locked = self._acquire(symbols)
+        # a refresh may have stored some of them between our read and taking the locks
+        rows = {symbol: entry['quote'] for symbol, entry in self._entries(locked).items()} if locked else {}
+        if rows:
+            self._release(list(rows), token)
+            locked = [symbol for symbol in locked if symbol not in rows]
+        if locked:
+            rows.update((q['symbol'], q) for q in self._refresh_locked(locked, token) or ())
+
+        # other workers hold the remaining locks: wait for their rows instead of fetching again
+        waiting = [symbol for symbol in symbols if symbol not in rows]
+        deadline = time.monotonic() + getattr(settings, 'QUOTE_CACHE_WAIT', 5)
+        while waiting and time.monotonic() < deadline:
+            rows.update((symbol, entry['quote']) for symbol, entry in self._entries(waiting).items())
+            waiting = [symbol for symbol in waiting if symbol not in rows]
+            if not waiting or not self.cache.get_many([self._key('lock', symbol) for symbol in waiting]):
+                break
+            time.sleep(0.05)
+        return {symbol: rows.get(symbol) or empty_quote(symbol) for symbol in symbols}
+
+
+quote_batcher = QuoteBatcher()
+quote_cache = QuoteCache(fetch=quote_batcher)
+
+
+def get_quotes(symbols=FINANCIAL_TABLE_SYMBOLS):
+    return quote_cache.get(symbols)
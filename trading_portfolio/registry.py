@@ -0,0 +1,137 @@
+"""
+Symbol registry: resolves ticker symbols to assets for the trade, valuation,
+snapshot, ingestion and chart paths.
+
+``Asset.symbol`` is unique, so a symbol maps to exactly one ``AssetRef``
+(id, symbol, type). Resolved refs are kept in a per-process LRU bounded by
+``ASSET_CACHE_MAX_ENTRIES``; in the common case resolving a symbol (or an
+asset id back to its symbol) is a dict lookup. Missing assets are created
+with one ``bulk_create(ignore_conflicts=True)``, which the unique index makes
+safe under concurrency.
+
+Entries are dropped by the ``post_save``/``post_delete`` receivers below.
+Queryset ``update()``/``delete()`` and other processes do not send them: call
+``asset_registry.clear()`` after bulk edits to assets. Rows read inside a
+``transaction.atomic()`` block are only cached once it commits, so a rolled
+back insert never leaves a dangling id behind; resolve symbols before opening
+the block to get the dict lookup.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Asset
+
+AssetRef = namedtuple('AssetRef', ['id', 'symbol', 'asset_type'])
+
+
+class AssetRegistry:
+    """Thread-safe LRU of ``symbol -> AssetRef`` with a reverse ``id -> symbol`` index."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._by_symbol = OrderedDict()
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_symbol)
+
+    def _cached(self, symbols):
+        with self._lock:
+            found = {}
+            for symbol in symbols:
+                ref = self._by_symbol.get(symbol)
+                if ref is not None:
+                    self._by_symbol.move_to_end(symbol)
+                    found[symbol] = ref
+            self.hits += len(found)
+            self.misses += len(symbols) - len(found)
+            return found
+
+    def _store(self, refs):
+        with self._lock:
+            for ref in refs:
+                previous = self._by_symbol.pop(ref.symbol, None)
+                if previous is not None:
+                    self._by_id.pop(previous.id, None)
+                self._by_symbol[ref.symbol] = ref
+                self._by_id[ref.id] = ref.symbol
+            while len(self._by_symbol) > self.max_entries:
+                _, evicted = self._by_symbol.popitem(last=False)
+                self._by_id.pop(evicted.id, None)
+
+    def _load(self, **lookup):
+        refs = [AssetRef(*row) for row in
+                Asset.objects.filter(**lookup).values_list('id', 'symbol', 'asset_type')]
+        if connection.in_atomic_block:
+            transaction.on_commit(partial(self._store, refs))
+        else:
+            self._store(refs)
+        return refs
+
+    def resolve(self, symbols, create=True):
+        """Return ``{symbol: AssetRef}``; unknown symbols are created as stocks unless ``create`` is False."""
+        symbols = list(dict.fromkeys(symbols))
+        refs = self._cached(symbols)
+        missing = [symbol for symbol in symbols if symbol not in refs]
+        if missing:
+            refs.update((ref.symbol, ref) for ref in self._load(symbol__in=missing))
+            missing = [symbol for symbol in missing if symbol not in refs]
+        if missing and create:
+            Asset.objects.bulk_create([Asset(symbol=symbol, name=symbol, asset_type='stock') for symbol in missing],
+                                      ignore_conflicts=True)
+            refs.update((ref.symbol, ref) for ref in self._load(symbol__in=missing))
+        return refs
+
+    def get(self, symbol, create=True):
+        """The ``AssetRef`` for one symbol, or None when it is unknown and ``create`` is False."""
+        return self.resolve([symbol], create=create).get(symbol)
+
+    def symbols(self, asset_ids):
+        """Return ``{asset_id: symbol}`` for ``asset_ids``."""
+        with self._lock:
+            found = {asset_id: self._by_id[asset_id] for asset_id in asset_ids if asset_id in self._by_id}
+        missing = [asset_id for asset_id in asset_ids if asset_id not in found]
+        if missing:
+            found.update((ref.id, ref.symbol) for ref in self._load(id__in=missing))
+        return found
+
+    def invalidate(self, asset_id=None, symbol=None):
+        with self._lock:
+            symbol = self._by_id.pop(asset_id, None) if symbol is None else symbol
+            ref = self._by_symbol.pop(symbol, None)
+            if ref is not None:
+                self._by_id.pop(ref.id, None)
+
+    def clear(self):
+        with self._lock:
+            self._by_symbol.clear()
+            self._by_id.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+        }
+
+
+asset_registry = AssetRegistry(max_entries=getattr(settings, 'ASSET_CACHE_MAX_ENTRIES', 10000))
+
+
+# a saved asset may have a new symbol or type: drop it under its old id and its current symbol
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def invalidate_asset(sender, instance, **kwargs):
+    asset_registry.invalidate(asset_id=instance.pk)
+    asset_registry.invalidate(symbol=instance.symbol)
@@ -0,0 +1,213 @@
+"""
+Portfolio risk analytics on daily returns.
+
+``load_closes`` reads the stored daily bars (``PriceBar`` rows with interval
+``1d``, see ``ingest_market_data --bar-interval 1d``) of a set of assets in
+one query and scatters them into a (day x asset) close matrix with index
+arrays, forward-filled over missing days. ``analyse`` builds that matrix once
+for the union of the holdings of every requested portfolio plus the
+benchmark. It then builds a (portfolio x asset) weight matrix from the current
+positions valued at the latest close, with cash as a zero-return asset, so the
+daily returns of a whole chunk of portfolios are one matrix product. Volatility,
+beta, historical and parametric VaR and max drawdown are column reductions
+over that (day x portfolio) matrix.
+
+The figures are ex-ante: today's holdings applied to the last
+``RISK_LOOKBACK_DAYS`` of returns. Holdings without stored bars are left out
+and listed under ``missing``. ``portfolio_risk`` caches one portfolio's
+report per day; trades drop it when they commit (see trading.py).
+"""
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils.timezone import localdate, make_aware
+
+from .models import Portfolio, PortfolioPosition, PriceBar
+from .registry import asset_registry
+
+TRADING_DAYS = 252
+CHUNK = 2000
+CACHE_SECONDS = 24 * 3600
+
+
+def defaults():
+    return (getattr(settings, 'RISK_BENCHMARK', 'SPY'), getattr(settings, 'RISK_LOOKBACK_DAYS', TRADING_DAYS),
+            getattr(settings, 'RISK_CONFIDENCE', 0.95))
+
+
+def cache_key(portfolio_id, day=None):
+    return f'risk:{portfolio_id}:{(day or localdate()).isoformat()}'
+
+
+def load_closes(asset_ids, lookback, end=None):
+    """``(days, asset_ids, closes)``: the last ``lookback + 1`` days of daily closes as a (day x asset) matrix."""
+    end = end or localdate()
+    # calendar days covering the trading days, with room for holidays; a range on the bar index's timestamp
+    since = end - timedelta(days=lookback * 7 // 5 + 10)
+    rows = list(PriceBar.objects.filter(asset_id__in=list(asset_ids), interval='1d',
+                                        timestamp__gte=make_aware(datetime.combine(since, time.min)),
+                                        timestamp__lt=make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+                .values_list('asset_id', 'timestamp', Cast('close', FloatField())))
+    if not rows:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64), np.empty((0, 0))
+    asset_of, stamps, close = zip(*rows)
+    day = np.array([stamp.replace(tzinfo=None) for stamp in stamps], dtype='datetime64[D]')
+    days, row = np.unique(day, return_inverse=True)
+    assets, column = np.unique(np.array(asset_of, dtype=np.int64), return_inverse=True)
+    closes = np.full((len(days), len(assets)), np.nan)
+    closes[row, column] = close
+
+    # forward fill: index of the last row with a value, per column
+    filled = np.where(np.isnan(closes), 0, np.arange(len(days))[:, None])
+    np.maximum.accumulate(filled, axis=0, out=filled)
+    closes = closes[filled, np.arange(len(assets))]
+    return days[-(lookback + 1):], assets, closes[-(lookback + 1):]
+
+
+def returns(closes):
+    """Simple daily returns; zero before an asset's first bar."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = closes[1:] / closes[:-1] - 1
+    return np.nan_to_num(daily, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def correlation(daily):
+    if daily.shape[1] < 2 or len(daily) < 3:
+        return np.full((daily.shape[1], daily.shape[1]), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.corrcoef(daily, rowvar=False)
+
+
+def rounded(value, places=6):
+    return None if value is None or not np.isfinite(value) else round(float(value), places)
+
+
+def column_metrics(portfolio_returns, benchmark_returns, confidence):
+    """Per column of a (day x portfolio) returns matrix: volatility, beta, VaR and max drawdown as fractions."""
+    observations = len(portfolio_returns)
+    mean = portfolio_returns.mean(axis=0)
+    std = portfolio_returns.std(axis=0, ddof=1)
+    if benchmark_returns is not None and benchmark_returns.var(ddof=1) > 0:
+        centred = benchmark_returns - benchmark_returns.mean()
+        beta = centred @ (portfolio_returns - mean) / (observations - 1) / benchmark_returns.var(ddof=1)
+    else:
+        beta = np.full(portfolio_returns.shape[1], np.nan)
+    historical = -np.quantile(portfolio_returns, 1 - confidence, axis=0)
+    parametric = -(mean + NormalDist().inv_cdf(1 - confidence) * std)
+    wealth = np.cumprod(1 + portfolio_returns, axis=0)
+    drawdown = 1 - (wealth / np.maximum.accumulate(wealth, axis=0)).min(axis=0)
+    return {
+        'volatility': std * np.sqrt(TRADING_DAYS),
+        'beta': beta,
+        'var_historical': historical,
+        'var_parametric': parametric,
+        'max_drawdown': drawdown,
+    }
+
+
+def analyse(portfolio_ids=None, benchmark=None, lookback=None, confidence=None, chunk_size=CHUNK,
+            correlations=True):
+    """Yield one risk report per portfolio (every portfolio when ``portfolio_ids`` is None)."""
+    default_benchmark, default_lookback, default_confidence = defaults()
+    benchmark = (benchmark or default_benchmark).upper()
+    lookback = lookback or default_lookback
+    confidence = confidence or default_confidence
+    today = localdate()
+
+    portfolios = Portfolio.objects.order_by('id')
+    positions = PortfolioPosition.objects.order_by('portfolio_id')
+    if portfolio_ids is not None:
+        portfolios = portfolios.filter(id__in=portfolio_ids)
+        positions = positions.filter(portfolio_id__in=portfolio_ids)
+    cash_rows = list(portfolios.values_list('id', Cast('user__profile__account_balance', FloatField())))
+    ids = np.array([row[0] for row in cash_rows], dtype=np.int64)
+    cash = np.array([row[1] or 0.0 for row in cash_rows], dtype=np.float64)
+    table = np.array(list(positions.values_list('portfolio_id', 'asset_id', Cast('quantity', FloatField()))),
+                     dtype=np.float64).reshape(-1, 3)
+    position_asset, quantity = table[:, 1].astype(np.int64), table[:, 2]
+    # positions are sorted by portfolio: portfolio row i owns positions bounds[i]:bounds[i + 1]
+    slot = np.searchsorted(ids, table[:, 0].astype(np.int64))
+    bounds = np.searchsorted(slot, np.arange(len(ids) + 1))
+
+    held = np.unique(position_asset).tolist()
+    held_symbols = asset_registry.symbols(held)
+    benchmark_ref = asset_registry.resolve([benchmark], create=False).get(benchmark)
+    days, assets, closes = load_closes(held + ([benchmark_ref.id] if benchmark_ref else []), lookback, today)
+    daily = returns(closes)
+    symbols = asset_registry.symbols(assets.tolist())
+
+    benchmark_returns = None
+    if benchmark_ref is not None and benchmark_ref.id in symbols:
+        benchmark_returns = daily[:, int(np.searchsorted(assets, benchmark_ref.id))]
+
+    # position -> asset column, priced when the asset has a close in the window
+    column = np.minimum(np.searchsorted(assets, position_asset), max(len(assets) - 1, 0))
+    priced = np.zeros(len(position_asset), dtype=bool)
+    value = np.zeros(len(position_asset))
+    if len(assets):
+        last = closes[-1][column]
+        priced = (assets[column] == position_asset) & ~np.isnan(last)
+        value[priced] = quantity[priced] * last[priced]
+    invested = np.bincount(slot, weights=value, minlength=len(ids))
+    equity = cash + invested
+
+    base = {'as_of': str(days[-1]) if len(days) else None, 'observations': len(daily),
+            'benchmark': benchmark if benchmark_returns is not None else None, 'confidence': confidence}
+    for start in range(0, len(ids), chunk_size):
+        stop = min(start + chunk_size, len(ids))
+        first, end = bounds[start], bounds[stop]
+        inside = np.flatnonzero(priced[first:end]) + first
+        weights = np.zeros((stop - start, len(assets)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.add.at(weights, (slot[inside] - start, column[inside]), value[inside] / equity[slot[inside]])
+        weights = np.nan_to_num(weights, nan=0.0, posinf=0.0, neginf=0.0)
+        if len(daily) >= 2:
+            metrics = column_metrics(daily @ weights.T, benchmark_returns, confidence)
+        else:
+            metrics = {name: np.full(len(weights), np.nan) for name in
+                       ('volatility', 'beta', 'var_historical', 'var_parametric', 'max_drawdown')}
+
+        for offset, portfolio_id in enumerate(ids[start:stop].tolist()):
+            row = start + offset
+            mine = slice(bounds[row], bounds[row + 1])
+            report = {
+                'portfolio_id': portfolio_id, **base,
+                'equity': round(float(equity[row]), 2),
+                'invested': round(float(invested[row]), 2),
+                'volatility': rounded(metrics['volatility'][offset]),
+                'beta': rounded(metrics['beta'][offset]),
+                'var_historical': rounded(metrics['var_historical'][offset]),
+                'var_parametric': rounded(metrics['var_parametric'][offset]),
+                'var_historical_amount': rounded(metrics['var_historical'][offset] * equity[row], 2),
+                'var_parametric_amount': rounded(metrics['var_parametric'][offset] * equity[row], 2),
+                'max_drawdown': rounded(metrics['max_drawdown'][offset]),
+                'missing': sorted(held_symbols[a] for a in position_asset[mine][~priced[mine]].tolist()),
+            }
+            if correlations:
+                columns = np.array(sorted(np.unique(column[mine][priced[mine]]).tolist(),
+                                          key=lambda c: symbols[int(assets[c])]), dtype=np.int64)
+                report['correlation'] = {
+                    'symbols': [symbols[a] for a in assets[columns].tolist()],
+                    'matrix': [[rounded(v, 4) for v in line] for line in correlation(daily[:, columns]).tolist()],
+                }
+            yield report
+
+
+def portfolio_risk(portfolio_id):
+    """One portfolio's risk report, computed at most once per day between trades."""
+    key = cache_key(portfolio_id)
+    report = cache.get(key)
+    if report is None:
+        report = next(analyse([portfolio_id]), None)
+        if report is not None:
+            cache.set(key, report, timeout=CACHE_SECONDS)
+    return report
+
+
+def invalidate(portfolio_id):
+    cache.delete(cache_key(portfolio_id))
@@ -0,0 +1,302 @@
+"""
+Symbol search: an in-memory prefix index for the autocomplete endpoint.
+
+Every instrument contributes its symbol and the words of its name (minus
+filler like "Inc" or "Class") as tokens. The tokens are kept in one sorted
+list with a parallel list of owning symbols, so the tokens starting with a
+prefix are the contiguous range two ``bisect`` calls return. Ranges larger
+than ``MEMO_THRESHOLD`` (one or two letter prefixes over a full listing) are
+ranked once and memoised until an instrument under that prefix changes.
+Results are ranked as an exact symbol, then symbol prefixes, then exact name
+words, then name word prefixes. Within each class, assets that exist in the
+database come first, then shorter symbols.
+
+The index is built per worker on first use from ``Asset`` plus the listing
+file ``SYMBOL_LISTING_FILE`` (CSV or pipe separated, with a symbol and a name
+column, like the NASDAQ/NYSE symbol directories). Saving or deleting an
+``Asset`` updates this worker's index in place and bumps a version in the
+shared cache. Every ``SYMBOL_INDEX_SYNC_SECONDS`` the other workers compare
+that version and the table's max id and row count, then load only the new
+rows (or diff the table after renames and deletes).
+"""
+import bisect
+import csv
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Asset
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'symbol_index:version'
+
+# name words too common to search by
+STOPWORDS = frozenset({
+    'A', 'AG', 'AND', 'CLASS', 'CO', 'COMMON', 'CORP', 'CORPORATION', 'DEPOSITARY', 'INC', 'INCORPORATED',
+    'LIMITED', 'LTD', 'NV', 'OF', 'ORDINARY', 'PLC', 'SA', 'SE', 'SHARE', 'SHARES', 'STOCK', 'THE',
+})
+WORD = re.compile(r'[A-Z0-9]+')
+
+MEMO_THRESHOLD = 256
+MAX_RESULTS = 50
+
+
+def tokens_for(symbol, name):
+    words = dict.fromkeys(sys.intern(word) for word in WORD.findall(name.upper())
+                          if word not in STOPWORDS and word != symbol)
+    return [symbol, *words]
+
+
+def read_listing(path):
+    """
+    ``{symbol: (name, asset_type)}`` from a listing file. A missing or empty
+    file, or one without symbol and name columns, is an empty listing.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.readline(), delimiters=',|\t;')
+        except csv.Error:
+            # empty, or a single column: the header check below rejects it
+            dialect = csv.excel
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        header = [column.strip().lower() for column in next(reader, [])]
+        symbol_column = next((i for i, column in enumerate(header) if column in ('symbol', 'ticker', 'act symbol')),
+                             None)
+        name_column = next((i for i, column in enumerate(header) if 'name' in column), None)
+        if symbol_column is None or name_column is None:
+            logger.warning("Symbol listing %s has no symbol and name columns, ignoring it", path)
+            return {}
+        type_column = header.index('asset_type') if 'asset_type' in header else None
+        etf_column = header.index('etf') if 'etf' in header else None
+
+        listing = {}
+        for row in reader:
+            if len(row) <= max(symbol_column, name_column) or row[0].startswith('File Creation Time'):
+                continue
+            symbol = row[symbol_column].strip().upper()
+            if not symbol:
+                continue
+            if type_column is not None:
+                asset_type = row[type_column].strip().lower() or 'stock'
+            else:
+                asset_type = 'etf' if etf_column is not None and row[etf_column].strip() == 'Y' else 'stock'
+            listing[symbol] = (row[name_column].strip(), sys.intern(asset_type))
+        return listing
+
+
+class SymbolIndex:
+    """Sorted token/owner arrays searched with ``bisect``; thread-safe, updated in place."""
+
+    def __init__(self, listing_path=None):
+        self.listing_path = listing_path
+        self._tokens = []
+        self._owners = []
+        # symbol -> (name, asset_type, in the database, in the listing)
+        self._info = {}
+        self._asset_ids = {}
+        self._top = {}
+        self._lock = threading.RLock()
+        self._synced = None
+        self._checked_at = 0.0
+        self.built = False
+
+    # settings are read on every call so override_settings works in tests
+    @property
+    def cache(self):
+        return caches['default']
+
+    @property
+    def sync_interval(self):
+        return getattr(settings, 'SYMBOL_INDEX_SYNC_SECONDS', 30)
+
+    def __len__(self):
+        return len(self._info)
+
+    def _forget(self, tokens):
+        # drop memoised rankings of every prefix of the changed tokens
+        for token in tokens:
+            for end in range(1, len(token) + 1):
+                self._top.pop(token[:end], None)
+
+    def _insert(self, symbol, name, asset_type, in_db, listed):
+        if symbol in self._info:
+            self._delete(symbol)
+        self._info[symbol] = (name, asset_type, in_db, listed)
+        tokens = tokens_for(symbol, name)
+        for token in tokens:
+            position = bisect.bisect_right(self._tokens, token)
+            self._tokens.insert(position, token)
+            self._owners.insert(position, symbol)
+        self._forget(tokens)
+
+    def _delete(self, symbol):
+        info = self._info.pop(symbol, None)
+        if info is None:
+            return
+        tokens = tokens_for(symbol, info[0])
+        for token in tokens:
+            position = bisect.bisect_left(self._tokens, token)
+            while self._owners[position] != symbol:
+                position += 1
+            del self._tokens[position]
+            del self._owners[position]
+        self._forget(tokens)
+
+    def load(self, listing, assets):
+        """Replace the index with ``listing`` (``{symbol: (name, type)}``) and ``assets`` (id, symbol, name, type)."""
+        info = {symbol: (name, asset_type, False, True) for symbol, (name, asset_type) in listing.items()}
+        asset_ids = {}
+        for asset_id, symbol, name, asset_type in assets:
+            info[symbol] = (name or info.get(symbol, ('',))[0], sys.intern(asset_type), True, symbol in listing)
+            asset_ids[asset_id] = symbol
+        pairs = sorted((token, symbol) for symbol, (name, *_) in info.items() for token in tokens_for(symbol, name))
+        with self._lock:
+            self._info = info
+            self._asset_ids = asset_ids
+            self._tokens = [token for token, _ in pairs]
+            self._owners = [symbol for _, symbol in pairs]
+            self._top = {}
+            self.built = True
+
+    def build(self):
+        started = time.perf_counter()
+        listing = read_listing(self.listing_path or getattr(settings, 'SYMBOL_LISTING_FILE', ''))
+        signature = self._signature()
+        self.load(listing, Asset.objects.values_list('id', 'symbol', 'name', 'asset_type').iterator(5000))
+        self._synced = signature
+        self._checked_at = time.monotonic()
+        logger.info("Symbol index: %d instruments, %d tokens in %.2fs", len(self._info), len(self._tokens),
+                    time.perf_counter() - started)
+
+    def _signature(self):
+        table = Asset.objects.aggregate(max_id=Max('id'), rows=Count('id'))
+        return self.cache.get(VERSION_KEY), table['max_id'] or 0, table['rows']
+
+    def ensure_ready(self):
+        """Build on first use, then pick up other workers' asset changes every ``SYMBOL_INDEX_SYNC_SECONDS``."""
+        if not self.built:
+            with self._lock:
+                if not self.built:
+                    self.build()
+            return
+        if time.monotonic() - self._checked_at < self.sync_interval:
+            return
+        self._checked_at = time.monotonic()
+        self.sync()
+
+    def sync(self):
+        """Apply asset rows changed since the last build or sync."""
+        signature = self._signature()
+        if signature == self._synced:
+            return
+        version, max_id, rows = signature
+        old_version, old_max_id, old_rows = self._synced or (None, 0, 0)
+        if version == old_version and rows - old_rows == Asset.objects.filter(id__gt=old_max_id).count():
+            # only inserts since the last sync
+            changed = Asset.objects.filter(id__gt=old_max_id).values_list('id', 'symbol', 'name', 'asset_type')
+            removed = []
+        else:
+            changed = Asset.objects.values_list('id', 'symbol', 'name', 'asset_type')
+            current = set(changed.values_list('id', flat=True))
+            removed = [asset_id for asset_id in self._asset_ids if asset_id not in current]
+        with self._lock:
+            for asset_id in removed:
+                self.remove_asset(asset_id)
+            for asset_id, symbol, name, asset_type in changed.iterator(5000):
+                if self._info.get(symbol, (None, None))[:2] != (name, asset_type) or asset_id not in self._asset_ids:
+                    self.update_asset(asset_id, symbol, name, asset_type)
+        self._synced = signature
+
+    def update_asset(self, asset_id, symbol, name, asset_type):
+        with self._lock:
+            previous = self._asset_ids.get(asset_id)
+            if previous is not None and previous != symbol:
+                self.remove_asset(asset_id)
+            listed = self._info.get(symbol, (None, None, False, False))[3]
+            self._insert(symbol, name, asset_type, True, listed)
+            self._asset_ids[asset_id] = symbol
+
+    def remove_asset(self, asset_id):
+        with self._lock:
+            symbol = self._asset_ids.pop(asset_id, None)
+            info = self._info.get(symbol)
+            if info is None:
+                return
+            if info[3]:
+                # still in the listing, just no longer a known asset
+                self._info[symbol] = (*info[:2], False, True)
+                self._forget(tokens_for(symbol, info[0]))
+            else:
+                self._delete(symbol)
+
+    def _rank(self, prefix, lo, hi, words=()):
+        best = {}
+        for position in range(lo, hi):
+            token, symbol = self._tokens[position], self._owners[position]
+            match = (0 if token == prefix else 1) if token == symbol else (2 if token == prefix else 3)
+            if match < best.get(symbol, 4):
+                best[symbol] = match
+        if words:
+            best = {symbol: match for symbol, match in best.items()
+                    if all(any(token.startswith(word) for token in tokens_for(symbol, self._info[symbol][0]))
+                           for word in words)}
+        return sorted(best, key=lambda symbol: (best[symbol], not self._info[symbol][2], len(symbol), symbol))
+
+    def search(self, query, limit=10):
+        """Ranked ``[{'symbol', 'name', 'asset_type'}]`` for instruments matching every word of ``query``."""
+        self.ensure_ready()
+        words = WORD.findall(query.upper()) if ' ' in query.strip() else [query.strip().upper()]
+        words = [word for word in words if word]
+        if not words:
+            return []
+        lead = max(words, key=len)
+        others = list(words)
+        others.remove(lead)
+        limit = min(limit, MAX_RESULTS)
+
+        with self._lock:
+            lo = bisect.bisect_left(self._tokens, lead)
+            hi = bisect.bisect_left(self._tokens, lead + '\U0010ffff', lo)
+            if others or hi - lo <= MEMO_THRESHOLD:
+                ranked = self._rank(lead, lo, hi, others)[:limit]
+            else:
+                ranked = self._top.get(lead)
+                if ranked is None:
+                    ranked = self._top[lead] = self._rank(lead, lo, hi)[:MAX_RESULTS]
+                ranked = ranked[:limit]
+            return [{'symbol': symbol, 'name': self._info[symbol][0], 'asset_type': self._info[symbol][1]}
+                    for symbol in ranked]
+
+    def stats(self):
+        return {'instruments': len(self._info), 'tokens': len(self._tokens), 'memoised_prefixes': len(self._top)}
+
+
+symbol_index = SymbolIndex()
+
+
+@receiver(post_save, sender=Asset)
+def index_asset(sender, instance, **kwargs):
+    if symbol_index.built:
+        symbol_index.update_asset(instance.pk, instance.symbol, instance.name, instance.asset_type)
+    caches['default'].set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@receiver(post_delete, sender=Asset)
+def unindex_asset(sender, instance, **kwargs):
+    if symbol_index.built:
+        symbol_index.remove_asset(instance.pk)
+    caches['default'].set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
@@ -0,0 +1,107 @@
+"""
+Columnar OHLCV series for client-side charting.
+
+Long ranges are decimated on the server to a target point count so a year of
+minute bars does not ship hundreds of thousands of points:
+
+* ``ohlc`` aggregates consecutive bars into buckets (first open, max high,
+  min low, last close, summed volume) with ``np.*.reduceat``;
+* ``lttb`` keeps the bars picked by Largest-Triangle-Three-Buckets on the
+  close price, which preserves the visual shape of a line chart.
+"""
+import json
+
+import numpy as np
+
+from .charts import get_cached
+from .providers import get_provider
+
+METHODS = ('ohlc', 'lttb')
+
+
+def bucket_starts(n, target):
+    """Start index of each of ``target`` near-equal buckets over ``n`` points."""
+    return np.unique(np.arange(target) * n // target)
+
+
+def decimate_ohlc(t, o, hi, lo, c, v, target):
+    if len(t) <= target:
+        return t, o, hi, lo, c, v
+    starts = bucket_starts(len(t), target)
+    ends = np.append(starts[1:], len(t)) - 1
+    return (
+        t[starts],
+        o[starts],
+        np.maximum.reduceat(hi, starts),
+        np.minimum.reduceat(lo, starts),
+        c[ends],
+        np.add.reduceat(v, starts),
+    )
+
+
+def lttb_indices(x, y, target):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if n <= target or target < 3:
+        return np.arange(n)
+
+    # first and last points are always kept, the rest is split into target - 2 buckets
+    edges = 1 + bucket_starts(n - 2, target - 2)
+    edges = np.append(edges, n - 1)
+    selected = np.empty(len(edges) + 1, dtype=np.int64)
+    selected[0] = 0
+    previous = 0
+    for i in range(len(edges) - 1):
+        start, stop = edges[i], edges[i + 1]
+        # the average of the next bucket (or the last point) is the third triangle vertex
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    selected[len(edges)] = n - 1
+    return selected
+
+
+def build_series(symbol, period='1d', interval='1m', points=500, method='ohlc'):
+    """Return the columnar series for ``symbol`` as a dict of lists."""
+    frame = get_provider().get_bars([symbol], period=period, interval=interval).get(symbol)
+    if frame is None or frame.empty:
+        raise LookupError(f"No market data for {symbol}")
+
+    t = frame.index.as_unit('s').asi8
+    o, hi, lo, c, v = (frame[column].to_numpy(dtype='float64') for column in ('open', 'high', 'low', 'close', 'volume'))
+    total = len(t)
+
+    if method == 'lttb':
+        keep = lttb_indices(t.astype('float64'), c, points)
+        t, o, hi, lo, c, v = t[keep], o[keep], hi[keep], lo[keep], c[keep], v[keep]
+    else:
+        t, o, hi, lo, c, v = decimate_ohlc(t, o, hi, lo, c, v, points)
+
+    return {
+        'symbol': symbol,
+        'range': period,
+        'interval': interval,
+        'method': method,
+        'source_points': total,
+        't': t.tolist(),
+        'o': np.round(o, 4).tolist(),
+        'h': np.round(hi, 4).tolist(),
+        'l': np.round(lo, 4).tolist(),
+        'c': np.round(c, 4).tolist(),
+        'v': v.astype('int64').tolist(),
+    }
+
+
+def get_series(symbol, period='1d', interval='1m', points=500, method='ohlc'):
+    """Serialised series shared through the chart LRU, so repeat requests skip the data path."""
+    return get_cached(
+        ('series', symbol, period, interval, points, method),
+        lambda: json.dumps(build_series(symbol, period, interval, points, method), separators=(',', ':')).encode(),
+        'application/json',
+    )
@@ -0,0 +1,190 @@
+"""
+Daily portfolio equity snapshots.
+
+``take_snapshots`` values every portfolio once (see ``valuation.py``) and
+upserts one ``PortfolioSnapshot`` row per portfolio for the day; the equity
+curve endpoint then reads that table directly.
+
+``backfill`` rebuilds the history from ``Transaction`` rows and daily bars
+without a query per day: holdings are a cumulative sum of signed trade
+quantities over a (day x position) matrix, cash walks back from today's
+balance by the cumulative cash flows, and market value is holdings times
+the forward-filled close, summed per portfolio with ``np.add.reduceat``.
+pandas is only imported by the backfill path.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Case, F, FloatField, Q, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Portfolio, PortfolioSnapshot, Transaction
+from .providers import PERIODS, get_provider
+from .registry import asset_registry
+from .valuation import value_portfolios
+
+SNAPSHOT_FIELDS = ['cash', 'market_value', 'equity', 'holdings']
+
+
+def write_snapshots(snapshots):
+    PortfolioSnapshot.objects.bulk_create(
+        snapshots, batch_size=1000, update_conflicts=True,
+        unique_fields=['portfolio', 'date'], update_fields=SNAPSHOT_FIELDS,
+    )
+    return len(snapshots)
+
+
+def take_snapshots(date=None, portfolio_ids=None, prices=None):
+    """Write today's (or ``date``'s) snapshot for every portfolio from the current positions."""
+    date = date or timezone.now().date()
+    # cost basis is not part of a snapshot, skip the ledger read
+    valuation = value_portfolios(portfolio_ids, prices=prices, costs={})
+
+    holdings = {portfolio_id: {} for portfolio_id in valuation.portfolios.tolist()}
+    for portfolio_id, symbol, quantity in zip(valuation.portfolio_id.tolist(), valuation.symbol.tolist(),
+                                              valuation.quantity.tolist()):
+        holdings[portfolio_id][symbol] = quantity
+
+    return write_snapshots([
+        PortfolioSnapshot(portfolio_id=portfolio_id, date=date, cash=round(cash, 2),
+                          market_value=round(market_value, 2), equity=round(equity, 2),
+                          holdings=holdings[portfolio_id])
+        for portfolio_id, cash, market_value, equity in zip(
+            valuation.portfolios.tolist(), valuation.cash.tolist(),
+            valuation.total_market_value.tolist(), valuation.equity.tolist())
+    ])
+
+
+def bar_period(first_day, end):
+    """Smallest provider period reaching back to ``first_day`` (the longest one otherwise)."""
+    span = end - first_day + timedelta(days=7)
+    for period, length in PERIODS.items():
+        if length >= span:
+            return period
+    return list(PERIODS)[-1]
+
+
+def daily_closes(symbols, days, trades, provider=None):
+    """(day x asset) close prices over ``days``, falling back to trade prices where no bar exists."""
+    import pandas as pd
+
+    period = bar_period(days[0].date(), days[-1].date())
+    bars = get_provider(provider).get_bars(list(symbols.values()), period=period, interval='1d') if symbols else {}
+    closes = {}
+    for asset_id, symbol in symbols.items():
+        frame = bars.get(symbol)
+        if frame is not None and not frame.empty:
+            close = frame['close']
+            closes[asset_id] = close.groupby(close.index.tz_convert(None).normalize()).last()
+    prices = pd.DataFrame(closes, columns=list(symbols), dtype='float64')
+
+    traded = trades.pivot_table(index='day', columns='asset_id', values='price', aggfunc='last')
+    prices = prices.combine_first(traded)
+    return prices.reindex(prices.index.union(days)).ffill().reindex(days)
+
+
+def backfill(portfolio_ids=None, start=None, end=None, provider=None, chunk_size=200):
+    """Rebuild daily snapshots from the transaction history; returns the number of rows written."""
+    import pandas as pd
+
+    end = pd.Timestamp(end or timezone.now().date())
+    start = pd.Timestamp(start) if start else None
+    portfolios = Portfolio.objects.order_by('id')
+    if portfolio_ids is not None:
+        portfolios = portfolios.filter(id__in=portfolio_ids)
+    accounts = list(portfolios.values_list('id', Cast('user__profile__account_balance', FloatField())))
+
+    written = 0
+    for offset in range(0, len(accounts), chunk_size):
+        written += backfill_chunk(dict(accounts[offset:offset + chunk_size]), start, end, provider)
+    return written
+
+
+def backfill_chunk(balances, start, end, provider):
+    import pandas as pd
+
+    signed = Case(When(transaction_type='SELL', then=-F('quantity')), default=F('quantity'))
+    rows = (Transaction.objects.filter(portfolio_id__in=list(balances))
+            .values_list('portfolio_id', 'asset_id', Cast(signed, FloatField()), Cast('price', FloatField()),
+                         'timestamp'))
+    trades = pd.DataFrame.from_records(list(rows), columns=['portfolio_id', 'asset_id', 'signed', 'price',
+                                                            'timestamp'])
+    if trades.empty:
+        return 0
+    trades['day'] = pd.DatetimeIndex(pd.to_datetime(trades['timestamp'], utc=True)).tz_convert(None).normalize()
+    trades['flow'] = -trades['signed'] * trades['price']
+
+    first_trade = trades.groupby('portfolio_id')['day'].min()
+    first_day = max(first_trade.min(), start) if start is not None else first_trade.min()
+    if first_day > end:
+        return 0
+    days = pd.date_range(first_day, end, freq='D')
+
+    # trades before the window only matter through their running totals, trades after it are dropped
+    window = trades[trades['day'] <= end].assign(day=lambda frame: frame['day'].clip(lower=first_day))
+
+    # holdings: cumulative signed quantity per (portfolio, asset) column
+    quantity = (window.pivot_table(index='day', columns=['portfolio_id', 'asset_id'], values='signed', aggfunc='sum')
+                .reindex(days, fill_value=0).fillna(0).cumsum())
+    pairs = quantity.columns
+    portfolio_of = pairs.get_level_values(0).to_numpy()
+    asset_of = pairs.get_level_values(1).to_numpy()
+
+    symbols = asset_registry.symbols(np.unique(asset_of).tolist())
+    prices = daily_closes(symbols, days, trades, provider)
+    held = np.round(quantity.to_numpy(), 8)
+    value = np.nan_to_num(held * prices.reindex(columns=asset_of).to_numpy())
+
+    # columns are sorted by portfolio: sum each portfolio's block of columns
+    chunk_ids, starts = np.unique(portfolio_of, return_index=True)
+    market_value = np.add.reduceat(value, starts, axis=1)
+
+    # cash at the end of day d = today's balance - cash flows after d
+    flows = (window.pivot_table(index='day', columns='portfolio_id', values='flow', aggfunc='sum')
+             .reindex(index=days, columns=chunk_ids, fill_value=0).fillna(0).cumsum().to_numpy())
+    total_flow = trades.groupby('portfolio_id')['flow'].sum().reindex(chunk_ids).to_numpy()
+    balance = np.array([balances[p] or 0.0 for p in chunk_ids.tolist()])
+    cash = balance - (total_flow - flows)
+
+    # rounded once as arrays, not per row
+    equity = (cash + market_value).round(2).T.tolist()
+    cash = cash.round(2).T.tolist()
+    market_value = market_value.round(2).T.tolist()
+    changed = np.ones(len(days), dtype=bool)
+
+    snapshots = []
+    dates = [day.date() for day in days]
+    for column, portfolio_id in enumerate(chunk_ids.tolist()):
+        block = slice(starts[column], starts[column + 1] if column + 1 < len(starts) else len(pairs))
+        block_symbols = [symbols[a] for a in asset_of[block].tolist()]
+        block_held = held[:, block]
+        # holdings only change on trade days, the dict is shared otherwise
+        changed[1:] = (block_held[1:] != block_held[:-1]).any(axis=1)
+        first = days.searchsorted(max(first_trade[portfolio_id], first_day))
+        holdings = None
+        for row in range(first, len(days)):
+            if holdings is None or changed[row]:
+                holdings = {symbol: q for symbol, q in zip(block_symbols, block_held[row].tolist()) if q}
+            snapshots.append(PortfolioSnapshot(
+                portfolio_id=portfolio_id, date=dates[row], cash=cash[column][row],
+                market_value=market_value[column][row], equity=equity[column][row], holdings=holdings,
+            ))
+    return write_snapshots(snapshots)
+
+
+def equity_curve(portfolio_id, start=None, end=None):
+    """Columnar ``{t, cash, market_value, equity}`` for one portfolio, oldest first."""
+    query = Q(portfolio_id=portfolio_id)
+    if start:
+        query &= Q(date__gte=start)
+    if end:
+        query &= Q(date__lte=end)
+    rows = list(PortfolioSnapshot.objects.filter(query).order_by('date').values_list(
+        'date', Cast('cash', FloatField()), Cast('market_value', FloatField()), Cast('equity', FloatField())))
+    return {
+        't': [row[0].isoformat() for row in rows],
+        'cash': [row[1] for row in rows],
+        'market_value': [row[2] for row in rows],
+        'equity': [row[3] for row in rows],
+    }
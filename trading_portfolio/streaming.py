@@ -0,0 +1,261 @@
+"""
+Server-Sent Events quote stream with one upstream poller per symbol set.
+
+Subscribers to the same symbol list share a ``Channel``: a single task polls
+the feed every ``QUOTE_STREAM_INTERVAL`` seconds, keeps the last row per
+symbol and broadcasts only the rows that changed, encoded once per tick, to
+every subscriber. Upstream load therefore depends on the number of distinct
+symbol sets, not on the number of connected clients (and the default feed
+goes through the shared quote cache, so workers coalesce too). Each
+subscriber has a queue of ``QUOTE_STREAM_QUEUE_SIZE`` messages; a client
+that falls that far behind is dropped and reconnects to a fresh snapshot
+instead of being buffered without limit.
+
+Channels live on the event loop of the worker that serves the streams, so
+this needs the ASGI server (see ``portfolio/gunicorn_asgi.py``).
+``portfolio.asgi`` hands ``STREAM_PATH`` straight to ``stream_app``: the
+endpoint is public and long-lived, and skipping the Django middleware stack
+(a dozen hops through the sync thread per request) is what lets one worker
+accept thousands of subscribers quickly.
+"""
+import asyncio
+import json
+import logging
+import random
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .blocking import run_blocking
+from .quotes import MAX_SYMBOLS, parse_symbols, quote_cache
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/quotes/stream/'
+HEARTBEAT = b': keepalive\n\n'
+RETRY = b'retry: 3000\n\n'
+
+
+def encode(event, rows):
+    return f"event: {event}\ndata: {json.dumps({'quotes': rows})}\n\n".encode()
+
+
+async def cache_feed(symbols):
+    """Ticker rows from the shared quote cache (one provider call per TTL across all workers)."""
+    return await run_blocking(quote_cache.get, symbols)
+
+
+class RandomWalkFeed:
+    """Local fake feed: every tick moves a random ``fraction`` of the symbols by up to 1%."""
+
+    def __init__(self, fraction=0.3, seed=None):
+        self.fraction = fraction
+        self.random = random.Random(seed)
+        self.prices = {}
+
+    async def __call__(self, symbols):
+        rows = []
+        for symbol in symbols:
+            open_price, last_price = self.prices.get(symbol) or (100.0, 100.0)
+            if symbol not in self.prices or self.random.random() < self.fraction:
+                last_price = round(last_price * (1 + self.random.uniform(-0.01, 0.01)), 2)
+                self.prices[symbol] = (open_price, last_price)
+            rows.append({
+                'symbol': symbol,
+                'last_price': last_price,
+                'open_price': open_price,
+                'change_percent': round((last_price - open_price) / open_price * 100, 2),
+            })
+        return rows
+
+
+FEEDS = {
+    'cache': lambda: cache_feed,
+    'fake': RandomWalkFeed,
+}
+
+
+def get_feed(name=None):
+    name = name or getattr(settings, 'QUOTE_STREAM_FEED', 'cache')
+    factory = FEEDS.get(name) or import_string(name)
+    return factory()
+
+
+class Subscriber:
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def send(self, message):
+        """Queue ``message``; a full queue drops the subscriber and returns False."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+    async def next(self, timeout):
+        """Next encoded message, ``HEARTBEAT`` after ``timeout`` idle seconds, or None once dropped."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return HEARTBEAT
+
+
+class Channel:
+
+    def __init__(self, hub, symbols):
+        self.hub = hub
+        self.symbols = symbols
+        self.subscribers = set()
+        self.rows = {}
+        self.task = None
+
+    def snapshot(self):
+        return encode('snapshot', [self.rows[symbol] for symbol in self.symbols if symbol in self.rows])
+
+    def publish(self, rows):
+        changed = [row for row in rows if self.rows.get(row['symbol']) != row]
+        self.hub.counters['ticks'] += 1
+        if not changed:
+            return 0
+        self.rows.update((row['symbol'], row) for row in changed)
+
+        message = encode('quotes', changed)
+        for subscriber in list(self.subscribers):
+            if not subscriber.send(message):
+                self.subscribers.discard(subscriber)
+                self.hub.counters['dropped'] += 1
+        self.hub.counters['messages'] += len(self.subscribers)
+        return len(changed)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            started = loop.time()
+            try:
+                self.publish(await self.hub.feed(self.symbols))
+            except Exception:
+                self.hub.counters['errors'] += 1
+                logger.exception("Error polling quotes for %s", self.symbols)
+            await asyncio.sleep(max(0.0, self.hub.interval - (loop.time() - started)))
+
+
+class QuoteHub:
+    """Per-process registry of channels, keyed by the (ordered) symbol list."""
+
+    def __init__(self, feed=None):
+        self.feed_override = feed
+        self._feeds = {}
+        self.channels = {}
+        self.counters = {'ticks': 0, 'messages': 0, 'dropped': 0, 'errors': 0}
+
+    # settings are read on every call so override_settings works in tests
+    @property
+    def interval(self):
+        return getattr(settings, 'QUOTE_STREAM_INTERVAL', 1.0)
+
+    @property
+    def queue_size(self):
+        return getattr(settings, 'QUOTE_STREAM_QUEUE_SIZE', 32)
+
+    @property
+    def feed(self):
+        if self.feed_override is not None:
+            return self.feed_override
+        name = getattr(settings, 'QUOTE_STREAM_FEED', 'cache')
+        if name not in self._feeds:
+            self._feeds[name] = get_feed(name)
+        return self._feeds[name]
+
+    def subscribe(self, symbols):
+        key = tuple(dict.fromkeys(s.upper() for s in symbols))
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(self, key)
+        subscriber = Subscriber(channel, self.queue_size)
+        if channel.rows:
+            subscriber.send(channel.snapshot())
+        channel.subscribers.add(subscriber)
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.get_running_loop().create_task(channel.run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        channel = subscriber.channel
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers and self.channels.get(channel.symbols) is channel:
+            del self.channels[channel.symbols]
+            if channel.task is not None:
+                channel.task.cancel()
+
+    def stats(self):
+        return {
+            **self.counters,
+            'channels': len(self.channels),
+            'subscribers': sum(len(channel.subscribers) for channel in self.channels.values()),
+        }
+
+    async def stream(self, symbols):
+        """Async iterator of SSE bytes for one client; unsubscribes when the client goes away."""
+        subscriber = self.subscribe(symbols)
+        heartbeat = getattr(settings, 'QUOTE_STREAM_HEARTBEAT', 15)
+        try:
+            yield RETRY
+            while True:
+                message = await subscriber.next(heartbeat)
+                if message is None:
+                    # too slow: the browser reconnects after ``retry`` and starts from a snapshot
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+
+quote_hub = QuoteHub()
+
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+    (b'x-content-type-options', b'nosniff'),
+]
+
+
+async def stream_app(scope, receive, send, hub=quote_hub):
+    """Bare ASGI endpoint for ``GET STREAM_PATH?symbols=``, same contract as ``views.quote_stream``."""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    symbols = parse_symbols(query.get('symbols', [''])[-1])
+    if scope['method'] not in ('GET', 'HEAD') or symbols is None:
+        status, body = (405, b'GET only') if symbols is not None else (400, f'At most {MAX_SYMBOLS} symbols'.encode())
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': body})
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+    stream = hub.stream(symbols)
+
+    async def pump():
+        async for chunk in stream:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await stream.aclose()
@@ -1,3 +1,1691 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, connections, transaction
+from django.test import (AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import metrics
+from .activity import activity, start_session
+from .charts import ChartCache, RenderedChart, chart_cache
+from .dbstats import InstrumentedConnectionMixin, connection_stats
+from .history import InvalidCursor, transaction_page
+from .ingestion import ingest_once
+from .ledger import rebuild
+from .models import (Asset, Lot, Order, Portfolio, PortfolioPosition, PortfolioSnapshot, PositionLedger, PriceBar,
+                     Quote, Transaction, UserProfile, UserSession)
+from .orders import OrderBook, cancel_order, match_quotes, order_book, place_order
+from .pagination import EstimatedCountPaginator, estimate_rows
+from .providers import DatabaseProvider, FakeProvider, FileProvider
+from .provisioning import provision
+from .registry import asset_registry
+from .quotes import FINANCIAL_TABLE_SYMBOLS, QuoteBatcher, QuoteCache, empty_quote, quote_batcher
+from .risk import analyse, cache_key, portfolio_risk
+from .search import MEMO_THRESHOLD, SymbolIndex, read_listing, symbol_index
+from .series import decimate_ohlc, lttb_indices
+from .snapshots import backfill, take_snapshots
+from .streaming import STREAM_PATH, QuoteHub, RandomWalkFeed, quote_hub, stream_app
+from .trading import TRADE_QUERY_BUDGET, TradeError, execute_batch, execute_trade
+from .valuation import value_portfolios
+from .warmup import HEAVY_MODULES, warm_up
+from .watchlists import set_symbols
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def write_bars(directory, symbol, closes, start=datetime(2025, 1, 2, 14, 30, tzinfo=dt_timezone.utc)):
+    # one 1m bar per close, open = previous close
+    lines = ['timestamp,open,high,low,close,volume']
+    previous = closes[0]
+    for minute, close in enumerate(closes):
+        timestamp = (start + timedelta(minutes=minute)).isoformat()
+        lines.append(f"{timestamp},{previous},{max(previous, close)},{min(previous, close)},{close},100")
+        previous = close
+    with open(os.path.join(directory, f'{symbol}.csv'), 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def fake_quote(symbol, price):
+    return {'symbol': symbol, 'last_price': price, 'open_price': price, 'change_percent': 0.0}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, QUOTE_CACHE_TTL=30, QUOTE_CACHE_STALE_TTL=300,
+                   QUOTE_CACHE_BACKGROUND_REFRESH=False, QUOTE_CACHE_WAIT=0)
+class QuoteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.fetched = []
+        self.price = 100.0
+        self.quote_cache = QuoteCache(fetch=self.fetch)
+
+    def fetch(self, symbols):
+        self.calls += 1
+        self.fetched.append(list(symbols))
+        return [fake_quote(symbol, self.price) for symbol in symbols]
+
+    def age_snapshot(self, symbols, seconds):
+        for symbol in symbols:
+            key = self.quote_cache._key('snapshot', symbol)
+            entry = cache.get(key)
+            entry['fetched_at'] -= seconds
+            cache.set(key, entry)
+
+    def test_fresh_snapshot_is_served_from_cache(self):
+        first = self.quote_cache.get(['aapl', 'MSFT'])
+        second = self.quote_cache.get(['AAPL', 'MSFT'])
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first, second)
+        # counters stay in the process until they are read or STATS_FLUSH_SECONDS pass
+        self.assertIsNone(cache.get('quotes:stats:hit'))
+        stats = self.quote_cache.stats()
+        self.assertEqual((stats['miss'], stats['hit'], stats['refresh']), (1, 1, 1))
+
+    def test_stale_snapshot_is_served_while_revalidating(self):
+        self.quote_cache.get(['AAPL'])
+        self.age_snapshot(['AAPL'], 60)
+        self.price = 101.0
+
+        stale = self.quote_cache.get(['AAPL'])
+        fresh = self.quote_cache.get(['AAPL'])
+
+        self.assertEqual(stale[0]['last_price'], 100.0)
+        self.assertEqual(fresh[0]['last_price'], 101.0)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.quote_cache.stats()['stale'], 1)
+
+    def test_failed_refresh_keeps_last_good_snapshot(self):
+        self.quote_cache.get(['AAPL'])
+        self.age_snapshot(['AAPL'], 60)
+        self.quote_cache.fetch = lambda symbols: [empty_quote(s) for s in symbols]
+
+        self.assertEqual(self.quote_cache.get(['AAPL'])[0]['last_price'], 100.0)
+        self.assertEqual(self.quote_cache.get(['AAPL'])[0]['last_price'], 100.0)
+        self.assertEqual(self.quote_cache.stats()['error'], 2)
+
+    def test_only_one_refresh_per_symbol(self):
+        token, locked = self.quote_cache._acquire(['AAPL'])
+        self.assertEqual(locked, ['AAPL'])
+
+        # another worker is refreshing: no upstream call, placeholder rows instead
+        self.assertIsNone(self.quote_cache.refresh(['AAPL']))
+        self.assertEqual(self.quote_cache.get(['AAPL']), [empty_quote('AAPL')])
+        self.assertEqual(self.calls, 0)
+
+        self.quote_cache._release(['AAPL'], token)
+        self.quote_cache.get(['AAPL'])
+        self.assertEqual(self.calls, 1)
+
+    def test_overlapping_symbol_sets_share_rows(self):
+        self.quote_cache.get(['AAPL', 'MSFT'])
+        rows = self.quote_cache.get(['msft', 'TSLA', 'AAPL'])
+
+        self.assertEqual([row['symbol'] for row in rows], ['MSFT', 'TSLA', 'AAPL'])
+        self.assertEqual(self.fetched, [['AAPL', 'MSFT'], ['TSLA']])
+
+    def test_unknown_symbols_are_cached_but_never_replace_good_rows(self):
+        self.quote_cache.fetch = lambda symbols: [
+            empty_quote(s) if s in ('NOPE', 'AAPL') else fake_quote(s, 1.0) for s in symbols]
+        self.quote_cache.get(['NOPE', 'MSFT'])
+        self.assertEqual(self.quote_cache.stats()['miss'], 1)
+        self.quote_cache.get(['NOPE'])
+        self.assertEqual(self.quote_cache.stats()['hit'], 1)
+
+        self.quote_cache.fetch = self.fetch
+        self.quote_cache.get(['AAPL'])
+        self.age_snapshot(['AAPL'], 60)
+        self.quote_cache.fetch = lambda symbols: [empty_quote(s) if s == 'AAPL' else fake_quote(s, 1.0)
+                                                  for s in symbols]
+        self.quote_cache.get(['AAPL', 'MSFT'])
+        self.assertEqual(self.quote_cache.get(['AAPL'])[0]['last_price'], 100.0)
+
+
+@override_settings(QUOTE_BATCH_WINDOW_MS=200)
+class QuoteBatcherTests(SimpleTestCase):
+
+    def test_concurrent_fetches_share_one_upstream_call(self):
+        calls = []
+
+        def fetch(symbols):
+            calls.append(sorted(symbols))
+            return [fake_quote(symbol, 1.0) for symbol in symbols if symbol != 'NOPE']
+
+        batcher = QuoteBatcher(fetch=fetch)
+        results = {}
+
+        def request(name, symbols):
+            results[name] = batcher(symbols)
+
+        threads = [threading.Thread(target=request, args=(name, symbols)) for name, symbols in (
+            ('a', ['AAPL', 'MSFT']), ('b', ['MSFT', 'TSLA']), ('c', ['NOPE']))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, [['AAPL', 'MSFT', 'NOPE', 'TSLA']])
+        self.assertEqual([row['symbol'] for row in results['b']], ['MSFT', 'TSLA'])
+        self.assertEqual(results['c'], [empty_quote('NOPE')])
+        self.assertEqual(batcher.stats(), {'requests': 3, 'batches': 1, 'symbols': 4})
+
+    def test_errors_reach_every_caller(self):
+        def fetch(symbols):
+            raise ConnectionError('upstream down')
+
+        with override_settings(QUOTE_BATCH_WINDOW_MS=0), self.assertRaises(ConnectionError):
+            QuoteBatcher(fetch=fetch)(['AAPL'])
+
+
+@override_settings(QUOTE_STREAM_INTERVAL=0.01, QUOTE_STREAM_QUEUE_SIZE=4, QUOTE_STREAM_HEARTBEAT=5)
+class QuoteStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.polls = 0
+        self.feed = RandomWalkFeed(fraction=1.0, seed=7)
+
+    async def counting_feed(self, symbols):
+        self.polls += 1
+        return await self.feed(symbols)
+
+    async def test_one_upstream_poll_per_tick_for_all_subscribers(self):
+        hub = QuoteHub(feed=self.counting_feed)
+        subscribers = [hub.subscribe(['aapl', 'msft']) for _ in range(200)]
+        self.assertEqual(hub.stats()['channels'], 1)
+
+        first = await asyncio.gather(*(s.next(timeout=1) for s in subscribers))
+        self.assertEqual(len(set(first)), 1)
+        self.assertEqual([row['symbol'] for row in json.loads(first[0].split(b'data: ')[1])['quotes']],
+                         ['AAPL', 'MSFT'])
+        await asyncio.gather(*(s.next(timeout=1) for s in subscribers))
+        self.assertLessEqual(self.polls, 3)
+
+        # a late subscriber starts from a snapshot, the last one out stops the poller
+        late = hub.subscribe(['AAPL', 'MSFT'])
+        self.assertTrue((await late.next(timeout=1)).startswith(b'event: snapshot'))
+        task = subscribers[0].channel.task
+        for subscriber in subscribers + [late]:
+            hub.unsubscribe(subscriber)
+        await asyncio.sleep(0)
+        self.assertEqual(hub.stats()['channels'], 0)
+        self.assertTrue(task.cancelled() or task.done())
+
+    def test_only_changed_rows_are_broadcast_and_slow_consumers_dropped(self):
+        async def scenario():
+            hub = QuoteHub(feed=self.counting_feed)
+            fast, slow = hub.subscribe(['AAPL', 'TSLA']), hub.subscribe(['AAPL', 'TSLA'])
+            channel = fast.channel
+            channel.task.cancel()
+
+            self.assertEqual(channel.publish([fake_quote('AAPL', 1.0), fake_quote('TSLA', 2.0)]), 2)
+            self.assertEqual(channel.publish([fake_quote('AAPL', 1.0), fake_quote('TSLA', 2.5)]), 1)
+            message = await fast.next(timeout=1)
+            message = await fast.next(timeout=1)
+            self.assertEqual(json.loads(message.split(b'data: ')[1])['quotes'], [fake_quote('TSLA', 2.5)])
+
+            for price in range(3, 6):
+                channel.publish([fake_quote('AAPL', float(price))])
+                await fast.next(timeout=1)
+            self.assertTrue(slow.dropped)
+            self.assertIsNone(await slow.next(timeout=1))
+            self.assertEqual((hub.stats()['dropped'], hub.stats()['subscribers']), (1, 1))
+
+        asyncio.run(scenario())
+
+    @override_settings(QUOTE_STREAM_FEED='fake')
+    async def test_event_stream_endpoint(self):
+        response = await AsyncClient().get(reverse('quote_stream'), {'symbols': 'AAPL'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        try:
+            self.assertTrue((await anext(events)).startswith(b'retry:'))
+            self.assertIn(b'"symbol": "AAPL"', await anext(events))
+        finally:
+            for channel in list(quote_hub.channels.values()):
+                for subscriber in list(channel.subscribers):
+                    quote_hub.unsubscribe(subscriber)
+
+    async def test_bare_asgi_stream_unsubscribes_on_disconnect(self):
+        hub = QuoteHub(feed=self.counting_feed)
+        sent, disconnect = [], asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if b'event: quotes' in message.get('body', b''):
+                disconnect.set()
+
+        scope = {'type': 'http', 'method': 'GET', 'path': STREAM_PATH, 'query_string': b'symbols=aapl'}
+        await asyncio.wait_for(stream_app(scope, receive, send, hub=hub), timeout=5)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(hub.stats()['channels'], 0)
+
+        await stream_app(dict(scope, query_string=b'symbols=' + b','.join(b'S%d' % i for i in range(51))),
+                         receive, send, hub=hub)
+        self.assertEqual(sent[-2]['status'], 400)
+
+    def test_event_stream_needs_asgi(self):
+        self.assertEqual(self.client.get(reverse('quote_stream')).status_code, 501)
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_url_conf_does_not_import_market_data_libraries(self):
+        code = ('import sys, django; django.setup(); import portfolio.urls; '
+                'print(",".join(m for m in ("pandas", "yfinance", "matplotlib") if m in sys.modules))')
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'portfolio.settings')}
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_warm_up_loads_everything_and_renders(self):
+        timings = warm_up()
+        self.assertEqual(set(timings), {*HEAVY_MODULES, 'render'})
+        self.assertTrue(all(name in sys.modules for name in HEAVY_MODULES))
+
+
+class FakeProviderTests(SimpleTestCase):
+
+    def test_bars_are_deterministic_per_symbol(self):
+        first = FakeProvider().get_bars(['AAPL', 'msft'], period='5d', interval='1h')
+        again = FakeProvider().get_bars(['AAPL', 'msft'], period='5d', interval='1h')
+
+        self.assertEqual(len(first['AAPL']), 120)
+        self.assertTrue(first['AAPL'].equals(again['AAPL']))
+        self.assertFalse(np.allclose(first['AAPL']['close'], first['msft']['close']))
+        self.assertTrue((first['AAPL']['high'] >= first['AAPL'][['open', 'close']].max(axis=1)).all())
+
+    def test_long_periods_are_capped_and_quotes_use_the_last_bar(self):
+        bars = FakeProvider().get_bars(['AAPL'], period='5y', interval='1m')['AAPL']
+        self.assertEqual(len(bars), FakeProvider.FAKE_MAX_BARS)
+        quote = FakeProvider().get_quotes(['AAPL'])['AAPL']
+        minute = int(quote['timestamp'].timestamp()) // 60
+        self.assertEqual(quote['last_price'], round(float(FakeProvider.closes('AAPL', minute)), 4))
+
+
+class IngestMarketDataTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        write_bars(self.directory, 'AAPL', [100, 101, 102])
+        write_bars(self.directory, 'MSFT', [200, 199])
+
+    def test_ingest_upserts_bars_and_quotes(self):
+        bars, quotes = ingest_once(FileProvider(self.directory), ['aapl', 'MSFT', 'NOPE'])
+
+        self.assertEqual((bars, quotes), (5, 2))
+        self.assertEqual(PriceBar.objects.filter(asset__symbol='AAPL').count(), 3)
+        self.assertEqual(Quote.objects.get(asset__symbol='AAPL').last_price, Decimal('102'))
+        self.assertFalse(Asset.objects.filter(symbol='NOPE').exists())
+
+    def test_repeated_cycles_only_rewrite_the_latest_bar(self):
+        provider = FileProvider(self.directory)
+        ingest_once(provider, ['AAPL'])
+        write_bars(self.directory, 'AAPL', [100, 101, 103, 104])
+
+        bars, _ = ingest_once(provider, ['AAPL'])
+
+        self.assertEqual(bars, 2)
+        self.assertEqual(PriceBar.objects.filter(asset__symbol='AAPL').count(), 4)
+        self.assertEqual(Asset.objects.filter(symbol='AAPL').count(), 1)
+        self.assertEqual(Quote.objects.get(asset__symbol='AAPL').last_price, Decimal('104'))
+
+    def test_database_provider_reads_ingested_data(self):
+        call_command('ingest_market_data', '--once', '--symbols', 'AAPL,MSFT', '--data-dir', self.directory,
+                     stdout=StringIO())
+        provider = DatabaseProvider()
+
+        self.assertEqual(provider.get_quotes(['AAPL'])['AAPL']['last_price'], 102.0)
+        # stored bars are older than a day, the quote table still serves them
+        self.assertEqual(provider.get_bars(['AAPL'], period='1d'), {})
+
+
+class ChartTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_bars(directory, 'AAPL', [100, 101, 102])
+        chart_cache.clear()
+        self.addCleanup(chart_cache.clear)
+        settings_override = override_settings(MARKET_DATA_PROVIDER='file', MARKET_DATA_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_png_with_etag_and_conditional_get(self):
+        url = reverse('get_chart', args=['aapl'])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(len(chart_cache), 1)
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(len(chart_cache), 1)
+
+    def test_legacy_json_contract(self):
+        response = self.client.get(reverse('get_chart', args=['AAPL']), {'format': 'json'})
+        self.assertIn('image', response.json())
+
+        missing = self.client.get(reverse('get_chart', args=['NOPE']), {'format': 'json'})
+        self.assertIn('error', missing.json())
+
+    def test_unknown_symbol_and_bad_range(self):
+        self.assertEqual(self.client.get(reverse('get_chart', args=['NOPE'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('get_chart', args=['AAPL']), {'range': '7y'}).status_code, 400)
+
+    async def test_async_chart_and_quotes_endpoint(self):
+        await sync_to_async(cache.clear)()
+        client = AsyncClient()
+        chart = await client.get(reverse('get_chart', args=['AAPL']), {'format': 'svg'})
+        self.assertEqual((chart.status_code, chart['Content-Type']), (200, 'image/svg+xml'))
+
+        response = await client.get(reverse('quotes'), {'symbols': 'aapl,nope'})
+        rows = {row['symbol']: row for row in response.json()['quotes']}
+        self.assertEqual((rows['AAPL']['last_price'], rows['NOPE']['last_price']), (102.0, 'N/A'))
+        too_many = await client.get(reverse('quotes'), {'symbols': ','.join(f'S{i}' for i in range(51))})
+        self.assertEqual(too_many.status_code, 400)
+
+    def test_cache_evicts_least_recently_used(self):
+        lru = ChartCache(max_entries=2, max_bytes=10)
+        for key in 'abc':
+            if key == 'c':
+                lru.get('a')
+            lru.set(key, RenderedChart(b'1234', 'image/png', expires_at=0))
+
+        self.assertIsNone(lru.get('b'))
+        self.assertIsNotNone(lru.get('a'))
+        lru.set('d', RenderedChart(b'12345678', 'image/png', expires_at=0))
+        self.assertEqual((len(lru), lru.size), (1, 8))
+
+
+class SeriesTests(SimpleTestCase):
+
+    def test_ohlc_buckets_keep_extremes_and_volume(self):
+        n = 1000
+        t = np.arange(n)
+        c = np.sin(t / 50.0) * 10 + 100
+        v = np.ones(n)
+        out = decimate_ohlc(t, c, c + 1, c - 1, c, v, 100)
+
+        self.assertEqual(len(out[0]), 100)
+        self.assertAlmostEqual(out[2].max(), (c + 1).max())
+        self.assertAlmostEqual(out[3].min(), (c - 1).min())
+        self.assertEqual(out[4][-1], c[-1])
+        self.assertEqual(out[5].sum(), n)
+
+    def test_lttb_keeps_endpoints_and_spikes(self):
+        x = np.arange(10000, dtype='float64')
+        y = np.zeros(10000)
+        y[4321] = 50.0
+        keep = lttb_indices(x, y, 200)
+
+        self.assertEqual(len(keep), 200)
+        self.assertEqual((keep[0], keep[-1]), (0, 9999))
+        self.assertIn(4321, keep)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_series_endpoint(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_bars(directory, 'AAPL', list(range(100, 130)))
+        chart_cache.clear()
+        self.addCleanup(chart_cache.clear)
+
+        with override_settings(MARKET_DATA_PROVIDER='file', MARKET_DATA_DIR=directory):
+            url = reverse('series', args=['AAPL'])
+            response = self.client.get(url, {'points': 10})
+            body = response.json()
+            not_modified = self.client.get(url, {'points': 10}, HTTP_IF_NONE_MATCH=response['ETag'])
+            bad = self.client.get(url, {'points': 'many'})
+
+        self.assertEqual(body['source_points'], 30)
+        self.assertEqual(len(body['t']), 10)
+        self.assertEqual(body['c'][-1], 129)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(bad.status_code, 400)
+
+    def test_missing_bar_fields_do_not_reach_the_series(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_bars(directory, 'AAPL', list(range(100, 130)))
+        path = os.path.join(directory, 'AAPL.csv')
+        with open(path) as f:
+            lines = f.read().split('\n')
+        # no high in bar 4, no open, low or volume in bar 5
+        timestamp, open_, _, low, close, volume = lines[5].split(',')
+        lines[5] = ','.join([timestamp, open_, '', low, close, volume])
+        timestamp, _, high, _, close, _ = lines[6].split(',')
+        lines[6] = ','.join([timestamp, '', high, '', close, ''])
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+        chart_cache.clear()
+        self.addCleanup(chart_cache.clear)
+
+        with override_settings(MARKET_DATA_PROVIDER='file', MARKET_DATA_DIR=directory):
+            body = self.client.get(reverse('series', args=['AAPL']), {'points': 10}).json()
+
+        values = [value for column in 'ohlcv' for value in body[column]]
+        self.assertTrue(all(math.isfinite(value) for value in values), body)
+        # the second bucket holds bars 3 to 5 (closes 103 to 105), bar 5 is flat at its close
+        self.assertEqual(body['h'][1], 105)
+        self.assertEqual(body['v'][1], 200)
+
+
+class TradeExecutionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', password='secret-pass-123')
+        Asset.objects.create(symbol='AAPL', name='Apple', asset_type='stock')
+
+    def balance(self):
+        return UserProfile.objects.get(user=self.user).account_balance
+
+    def trade_within_budget(self, *order):
+        with CaptureQueriesContext(connection) as queries:
+            result = execute_trade(self.user, *order)
+        # TestCase wraps atomic() in savepoints, a real request only adds BEGIN/COMMIT
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(statements), TRADE_QUERY_BUDGET, '\n'.join(statements))
+        return result
+
+    def test_buy_and_sell_within_query_budget(self):
+        result = self.trade_within_budget('aapl', 'BUY', '10', '100')
+        self.assertEqual((result.balance, result.position_quantity), (Decimal('9000'), Decimal('10')))
+
+        self.trade_within_budget('AAPL', 'BUY', '5', '100')
+        result = self.trade_within_budget('AAPL', 'SELL', '15', '110')
+
+        self.assertEqual(result.balance, Decimal('10150'))
+        self.assertEqual(self.balance(), Decimal('10150'))
+        self.assertFalse(PortfolioPosition.objects.exists())
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_buy_is_one_position_upsert(self):
+        table = PortfolioPosition._meta.db_table
+        for quantity, expected in (('1.5', Decimal('1.5')), ('0.25', Decimal('1.75'))):
+            with CaptureQueriesContext(connection) as queries:
+                result = execute_trade(self.user, 'AAPL', 'BUY', quantity, '10')
+            writes = [q['sql'] for q in queries.captured_queries if table in q['sql']]
+            self.assertEqual(len(writes), 1, writes)
+            self.assertEqual(result.position_quantity, expected)
+        self.assertEqual(PortfolioPosition.objects.get().quantity, Decimal('1.75'))
+
+    def test_positions_are_unique_per_asset(self):
+        execute_trade(self.user, 'AAPL', 'BUY', '1', '100')
+        position = PortfolioPosition.objects.get()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PortfolioPosition.objects.create(portfolio=position.portfolio, asset=position.asset, quantity=1)
+
+    def test_rejected_orders_write_nothing(self):
+        cases = [
+            (('AAPL', 'BUY', '1000', '100'), 'insufficient_balance'),
+            (('AAPL', 'SELL', '1', '100'), 'no_position'),
+            (('AAPL', 'BUY', '-1', '100'), 'invalid'),
+            (('AAPL', 'HOLD', '1', '100'), 'invalid'),
+            (('', 'BUY', '1', '100'), 'invalid'),
+        ]
+        for order, code in cases:
+            with self.subTest(order=order), self.assertRaises(TradeError) as raised:
+                execute_trade(self.user, *order)
+            self.assertEqual(raised.exception.code, code)
+
+        execute_trade(self.user, 'AAPL', 'BUY', '1', '100')
+        with self.assertRaises(TradeError) as raised:
+            execute_trade(self.user, 'AAPL', 'SELL', '2', '100')
+        self.assertEqual(raised.exception.code, 'insufficient_quantity')
+        self.assertEqual(self.balance(), Decimal('9900'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_trade_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('trade_asset'), {
+            'symbol': 'AAPL', 'quantity': '1', 'price': '100', 'transaction_type': 'BUY'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+        response = self.client.post(reverse('trade_asset'), {
+            'symbol': 'AAPL', 'quantity': 'abc', 'price': '100', 'transaction_type': 'BUY'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchTradeTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('batch', password='secret-pass-123')
+
+    def order(self, symbol, side, quantity, price='10'):
+        return {'symbol': symbol, 'transaction_type': side, 'quantity': quantity, 'price': price}
+
+    def test_orders_are_checked_against_running_balance_and_holdings(self):
+        result = execute_batch(self.user, [
+            self.order('AAPL', 'BUY', '500'),
+            self.order('MSFT', 'SELL', '1'),
+            self.order('AAPL', 'SELL', '200'),
+            self.order('MSFT', 'BUY', '800'),
+            self.order('AAPL', 'SELL', '300'),
+            self.order('TSLA', 'BUY', 'x'),
+        ])
+
+        self.assertEqual([r['status'] for r in result.results],
+                         ['filled', 'rejected', 'filled', 'rejected', 'filled', 'rejected'])
+        self.assertEqual([r.get('code') for r in result.results],
+                         [None, 'no_position', None, 'insufficient_balance', None, 'invalid'])
+        self.assertEqual(result.balance, Decimal('10000'))
+        self.assertEqual(UserProfile.objects.get(user=self.user).account_balance, Decimal('10000'))
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertFalse(PortfolioPosition.objects.exists())
+
+    def test_all_or_none_writes_nothing_on_rejection(self):
+        result = execute_batch(self.user, [self.order('AAPL', 'BUY', '1'), self.order('AAPL', 'SELL', '5')],
+                               all_or_none=True)
+
+        self.assertEqual([r['status'] for r in result.results], ['cancelled', 'rejected'])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def queries_for(n):
+            orders = [self.order(f'S{i % 5}', 'BUY', '1', '1') for i in range(n)]
+            with CaptureQueriesContext(connection) as queries:
+                execute_batch(self.user, orders)
+            return len(queries)
+
+        queries_for(5)  # create the assets and positions
+        # stays under one bulk insert chunk on every backend (SQLite caps a statement at 999 params)
+        self.assertEqual(queries_for(10), queries_for(150))
+
+    def test_batch_view_accepts_csv(self):
+        self.client.force_login(self.user)
+        body = 'symbol,transaction_type,quantity,price\nAAPL,BUY,2,10\nAAPL,SELL,1,12\n'
+        response = self.client.post(reverse('trade_batch'), body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['filled'], 2)
+        self.assertEqual(PortfolioPosition.objects.get().quantity, Decimal('1'))
+
+        bad = self.client.post(reverse('trade_batch'), '{"orders": 1}', content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MARKET_DATA_PROVIDER='file', MARKET_DATA_DIR=tempfile.gettempdir())
+class OrderBookTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('resting', password='secret-pass-123')
+        self.asset = Asset.objects.create(symbol='AAPL', name='Apple', asset_type='stock')
+
+    def quote(self, price):
+        Quote.objects.update_or_create(asset=self.asset, defaults={
+            'last_price': Decimal(price), 'open_price': Decimal(price), 'timestamp': datetime.now(dt_timezone.utc)})
+
+    def balance(self):
+        return UserProfile.objects.get(user=self.user).account_balance
+
+    def test_heaps_trigger_by_price_then_age(self):
+        book = OrderBook()
+        book.load([(1, 7, True, Decimal('95')), (2, 7, True, Decimal('98')), (3, 7, False, Decimal('105'))])
+        book.add(4, 7, True, Decimal('98'))
+        book.add(5, 7, False, Decimal('101'))
+
+        self.assertEqual(book.match(7, Decimal('100')), [])
+        self.assertEqual(book.match(8, Decimal('1')), [])
+        self.assertEqual(book.match(7, Decimal('97')), [2, 4])
+        self.assertTrue(book.remove(1))
+        self.assertFalse(book.remove(1))
+        self.assertEqual(book.match(7, Decimal('90')), [])
+        self.assertEqual(book.match(7, Decimal('110')), [5, 3])
+        self.assertEqual((len(book), book.books), (0, {}))
+
+    def test_cancelled_entries_are_compacted(self):
+        book = OrderBook()
+        book.load([(order_id, 7, order_id % 2 == 0, Decimal(order_id)) for order_id in range(1, 101)])
+        for order_id in range(1, 91):
+            book.remove(order_id)
+        heaps = book.books[7]
+        self.assertLessEqual(len(heaps.falling) + len(heaps.rising), 2 * heaps.live)
+        self.assertEqual(sorted(book.match(7, Decimal('95'))), [91, 93, 95, 96, 98, 100])
+
+    def test_limit_and_stop_orders_fill_through_the_trade_path(self):
+        execute_trade(self.user, 'AAPL', 'BUY', '10', '100')
+        buy = place_order(self.user, 'aapl', 'BUY', 'limit', '5', '95')
+        stop = place_order(self.user, 'AAPL', 'SELL', 'stop', '10', '90')
+        take_profit = place_order(self.user, 'AAPL', 'SELL', 'limit', '2', '120')
+        book = OrderBook()
+
+        self.quote('100')
+        self.assertEqual(match_quotes(book), {'filled': 0, 'rejected': 0, 'gone': 0, 'failed': 0})
+        self.quote('94.50')
+        self.assertEqual(match_quotes(book)['filled'], 1)
+        # the same quote is not matched twice
+        self.assertEqual(match_quotes(book)['filled'], 0)
+        self.quote('89')
+        self.assertEqual(match_quotes(book)['filled'], 1)
+
+        buy.refresh_from_db()
+        stop.refresh_from_db()
+        self.assertEqual((buy.status, buy.fill_price, buy.trade.price), ('filled', Decimal('94.5'), Decimal('94.5')))
+        self.assertEqual((stop.status, stop.fill_price), ('filled', Decimal('89')))
+        self.assertEqual(Order.objects.get(pk=take_profit.pk).status, 'open')
+        self.assertEqual(PortfolioPosition.objects.get().quantity, Decimal('5'))
+        self.assertEqual(self.balance(), Decimal('10000') - 1000 - Decimal('472.5') + 890)
+        self.assertEqual(PositionLedger.objects.get().quantity, Decimal('5'))
+        self.assertEqual(list(book.orders), [take_profit.pk])
+
+    def test_rejected_and_cancelled_orders(self):
+        too_big = place_order(self.user, 'AAPL', 'BUY', 'limit', '1000', '100')
+        cancelled = place_order(self.user, 'AAPL', 'BUY', 'limit', '1', '100')
+        book = OrderBook()
+        book.sync()
+        cancel_order(self.user, cancelled.pk)
+        with self.assertRaises(TradeError) as raised:
+            cancel_order(self.user, cancelled.pk)
+        self.assertEqual(raised.exception.code, 'not_found')
+
+        self.quote('99')
+        self.assertEqual(match_quotes(book), {'filled': 0, 'rejected': 1, 'gone': 0, 'failed': 0})
+        too_big.refresh_from_db()
+        self.assertEqual((too_big.status, too_big.reason), ('rejected', "Not enough balance!"))
+        self.assertEqual(self.balance(), Decimal('10000'))
+        self.assertFalse(Transaction.objects.exists())
+
+        for order in [('AAPL', 'HOLD', 'limit', '1', '1'), ('AAPL', 'BUY', 'market', '1', '1'),
+                      ('AAPL', 'BUY', 'stop', '1', '-1')]:
+            with self.subTest(order=order), self.assertRaises(TradeError):
+                place_order(self.user, *order)
+        with override_settings(ORDERS_MAX_OPEN=1):
+            place_order(self.user, 'AAPL', 'BUY', 'limit', '1', '1')
+            with self.assertRaises(TradeError) as raised:
+                place_order(self.user, 'AAPL', 'BUY', 'limit', '1', '1')
+        self.assertEqual(raised.exception.code, 'too_many_orders')
+
+    def test_book_is_rebuilt_from_the_table(self):
+        first = OrderBook()
+        first.sync()
+        order = place_order(self.user, 'AAPL', 'BUY', 'limit', '1', '50')
+        first.sync()
+        self.assertEqual(list(first.orders), [order.pk])
+        cancel_order(self.user, order.pk)
+        first.sync()
+        self.assertEqual(len(first), 0)
+
+        kept = place_order(self.user, 'AAPL', 'BUY', 'stop', '1', '150')
+        restarted = OrderBook()
+        with self.assertNumQueries(1):
+            restarted.sync()
+        self.assertEqual(list(restarted.orders), [kept.pk])
+        self.quote('150')
+        self.assertEqual(match_quotes(restarted)['filled'], 1)
+
+    def test_stale_quotes_do_not_fill_after_a_restart(self):
+        place_order(self.user, 'AAPL', 'BUY', 'limit', '1', '100')
+        self.quote('90')
+        Quote.objects.update(updated_at=datetime.now(dt_timezone.utc) - timedelta(days=3))
+
+        book = OrderBook()
+        self.assertEqual(match_quotes(book)['filled'], 0)
+        book.reset()
+        self.assertEqual(match_quotes(book)['filled'], 0)
+        self.assertEqual(len(book), 1)
+
+        self.quote('95')
+        self.assertEqual(match_quotes(book)['filled'], 1)
+
+    def test_ingest_command_matches_new_quotes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        order_book.reset()
+        order_book.quoted_at = None
+        write_bars(directory, 'AAPL', [100, 99, 98])
+        order = place_order(self.user, 'AAPL', 'BUY', 'limit', '3', '98.50')
+
+        out = StringIO()
+        call_command('ingest_market_data', '--once', '--symbols', 'AAPL', '--data-dir', directory, stdout=out)
+
+        self.assertIn("Orders: 1 filled", out.getvalue())
+        self.assertEqual(Order.objects.get(pk=order.pk).fill_price, Decimal('98'))
+        self.assertEqual(self.balance(), Decimal('9706'))
+
+    def test_order_views(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('orders'), {
+            'symbol': 'AAPL', 'transaction_type': 'BUY', 'order_type': 'limit', 'quantity': '2', 'price': '90'})
+        self.assertEqual(response.status_code, 201)
+        placed = response.json()
+        self.assertEqual((placed['symbol'], placed['status'], placed['price']), ('AAPL', 'open', '90'))
+
+        response = self.client.post(reverse('orders'), {
+            'symbol': 'AAPL', 'transaction_type': 'BUY', 'order_type': 'limit', 'quantity': 'x', 'price': '90'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([order['id'] for order in self.client.get(reverse('orders')).json()['orders']],
+                         [placed['id']])
+
+        other = User.objects.create_user('other', password='secret-pass-123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(reverse('cancel_order', args=[placed['id']])).status_code, 404)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(reverse('cancel_order', args=[placed['id']])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('orders')).json(), {'orders': []})
+        self.assertEqual(self.client.get(reverse('orders'), {'status': 'all'}).json()['orders'][0]['status'],
+                         'cancelled')
+        self.assertEqual(self.client.get(reverse('orders'), {'status': 'nope'}).status_code, 400)
+
+
+class TransactionHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('history', password='secret-pass-123')
+        apple = Asset.objects.create(symbol='AAPL', name='Apple', asset_type='stock')
+        tesla = Asset.objects.create(symbol='TSLA', name='Tesla', asset_type='stock')
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        # pairs of rows share a timestamp so the id tie-breaker matters
+        Transaction.objects.bulk_create([
+            Transaction(portfolio=cls.user.portfolio, asset=apple if i % 3 else tesla,
+                        transaction_type='BUY' if i % 2 else 'SELL', quantity=1, price=i,
+                        timestamp=start + timedelta(minutes=i // 2))
+            for i in range(60)
+        ])
+
+    def test_cursor_walks_every_row_once_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = transaction_page(self.user.portfolio.pk, cursor=cursor, limit=7)
+            seen.extend(rows)
+            if cursor is None:
+                break
+
+        keys = [(t.timestamp, t.pk) for t in seen]
+        self.assertEqual(len(set(keys)), 60)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_filters_and_bad_cursor(self):
+        rows, _ = transaction_page(self.user.portfolio.pk, limit=200, symbol='tsla', side='buy')
+        self.assertEqual(len(rows), 10)
+        self.assertTrue(all(t.asset.symbol == 'TSLA' and t.transaction_type == 'BUY' for t in rows))
+        with self.assertRaises(InvalidCursor):
+            transaction_page(self.user.portfolio.pk, cursor='nope')
+
+    @override_settings(CACHES=LOCMEM_CACHES, MARKET_DATA_PROVIDER='fake', MARKET_DATA_FAKE_LATENCY_MS=0,
+                       QUOTE_CACHE_BACKGROUND_REFRESH=False, QUOTE_CACHE_WAIT=0, QUOTE_BATCH_WINDOW_MS=0)
+    def test_dashboard_renders_first_page_and_api_continues(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        dashboard = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(dashboard.context['transactions']), 25)
+
+        response = self.client.get(reverse('transaction_history'),
+                                   {'cursor': dashboard.context['transactions_next_cursor'], 'limit': 50})
+        body = response.json()
+        self.assertEqual(len(body['results']), 35)
+        self.assertIsNone(body['next_cursor'])
+        self.assertEqual(self.client.get(reverse('transaction_history'), {'cursor': '!!'}).status_code, 400)
+
+
+class ValuationTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='secret-pass-123')
+        self.bob = User.objects.create_user('bob', password='secret-pass-123')
+        execute_trade(self.alice, 'AAPL', 'BUY', '10', '100')
+        execute_trade(self.alice, 'AAPL', 'BUY', '10', '200')
+        execute_trade(self.alice, 'MSFT', 'BUY', '5', '100')
+        execute_trade(self.bob, 'MSFT', 'BUY', '1', '100')
+        msft = Asset.objects.get(symbol='MSFT')
+        Quote.objects.create(asset=msft, last_price=120, open_price=110, timestamp=datetime.now(dt_timezone.utc))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_values_all_portfolios_in_one_pass(self):
+        alice, bob = self.alice.portfolio.pk, self.bob.portfolio.pk
+        valuation = value_portfolios(prices={'AAPL': 160.0, 'MSFT': 120.0})
+
+        self.assertEqual(valuation.totals_for(alice),
+                         {'cash': 6500.0, 'market_value': 3800.0, 'unrealized_pnl': 300.0, 'realized_pnl': 0.0,
+                          'equity': 10300.0})
+        self.assertEqual(valuation.totals_for(bob)['equity'], 10020.0)
+        positions = {p['symbol']: p for p in valuation.positions_for(alice)}
+        self.assertEqual(positions['AAPL']['cost_basis'], 3000.0)
+        self.assertEqual(positions['AAPL']['weight'], round(3200 / 10300 * 100, 2))
+
+    @override_settings(CACHES=LOCMEM_CACHES, MARKET_DATA_PROVIDER='file', MARKET_DATA_DIR=tempfile.gettempdir())
+    def test_missing_prices_are_reported_not_zeroed(self):
+        cache.clear()
+        # MSFT comes from the Quote table, AAPL has no price anywhere
+        valuation = value_portfolios([self.alice.portfolio.pk])
+        positions = {p['symbol']: p for p in valuation.positions_for(self.alice.portfolio.pk)}
+
+        self.assertIsNone(positions['AAPL']['market_value'])
+        self.assertEqual(positions['MSFT']['market_value'], 600.0)
+        self.assertEqual(valuation.totals_for(self.alice.portfolio.pk)['equity'], 7100.0)
+
+
+class CostBasisLedgerTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', password='secret-pass-123')
+        self.portfolio_id = self.user.portfolio.pk
+
+    def trade_history(self):
+        execute_trade(self.user, 'AAPL', 'BUY', '10', '100')
+        execute_trade(self.user, 'AAPL', 'BUY', '10', '200')
+        execute_batch(self.user, [
+            {'symbol': 'AAPL', 'transaction_type': 'SELL', 'quantity': '15', 'price': '300'},
+            {'symbol': 'MSFT', 'transaction_type': 'BUY', 'quantity': '2', 'price': '50'},
+        ])
+
+    def ledger(self, symbol):
+        return PositionLedger.objects.get(portfolio_id=self.portfolio_id, asset__symbol=symbol)
+
+    @override_settings(COST_BASIS_METHOD='fifo')
+    def test_fifo_consumes_oldest_lots(self):
+        self.trade_history()
+        aapl = self.ledger('AAPL')
+        # 10 @ 100 and 5 @ 200 sold at 300
+        self.assertEqual(aapl.realized_pnl, Decimal('2500'))
+        self.assertEqual((aapl.quantity, aapl.avg_cost), (Decimal('5'), Decimal('200')))
+        self.assertEqual(list(Lot.objects.filter(portfolio_id=self.portfolio_id, asset=aapl.asset)
+                              .values_list('quantity', 'price')), [(Decimal('5'), Decimal('200'))])
+
+    @override_settings(COST_BASIS_METHOD='average')
+    def test_average_cost(self):
+        self.trade_history()
+        aapl = self.ledger('AAPL')
+        self.assertEqual(aapl.realized_pnl, Decimal('2250'))
+        self.assertEqual((aapl.quantity, aapl.avg_cost), (Decimal('5'), Decimal('150')))
+        self.assertFalse(Lot.objects.exists())
+
+    def test_closing_a_position_keeps_realised_pnl(self):
+        execute_trade(self.user, 'AAPL', 'BUY', '4', '100')
+        execute_trade(self.user, 'AAPL', 'SELL', '4', '90')
+        aapl = self.ledger('AAPL')
+        self.assertEqual((aapl.quantity, aapl.avg_cost, aapl.realized_pnl), (0, 0, Decimal('-40')))
+        self.assertFalse(Lot.objects.exists())
+
+    def test_rebuild_matches_incremental_ledger(self):
+        self.trade_history()
+        execute_trade(self.user, 'MSFT', 'SELL', '1', '70')
+        fields = ('asset__symbol', 'method', 'quantity', 'avg_cost', 'realized_pnl')
+        incremental = list(PositionLedger.objects.order_by('asset__symbol').values_list(*fields))
+        lots = list(Lot.objects.order_by('asset_id', 'opened_at', 'id').values_list('asset_id', 'quantity', 'price'))
+
+        PositionLedger.objects.all().delete()
+        Lot.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_ledger', stdout=out)
+
+        self.assertIn('Rebuilt 2 ledger rows', out.getvalue())
+        self.assertEqual(list(PositionLedger.objects.order_by('asset__symbol').values_list(*fields)), incremental)
+        self.assertEqual(list(Lot.objects.order_by('asset_id', 'opened_at', 'id')
+                              .values_list('asset_id', 'quantity', 'price')), lots)
+
+    def test_rebuild_can_switch_method(self):
+        self.trade_history()
+        rebuild([self.portfolio_id], method='average')
+        self.assertEqual(self.ledger('AAPL').realized_pnl, Decimal('2250'))
+        self.assertFalse(Lot.objects.exists())
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_valuation_reads_ledger(self):
+        self.trade_history()
+        valuation = value_portfolios([self.portfolio_id], prices={'AAPL': 250.0, 'MSFT': 50.0})
+        positions = {p['symbol']: p for p in valuation.positions_for(self.portfolio_id)}
+        self.assertEqual(positions['AAPL']['unrealized_pnl'], 250.0)
+        self.assertEqual(valuation.totals_for(self.portfolio_id)['realized_pnl'], 2500.0)
+
+
+class PortfolioSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', password='secret-pass-123')
+        self.portfolio_id = self.user.portfolio.pk
+        self.today = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.day0 = self.today - timedelta(days=4)
+        buy = execute_trade(self.user, 'AAPL', 'BUY', '10', '100').transaction
+        sell = execute_trade(self.user, 'AAPL', 'SELL', '4', '130').transaction
+        Transaction.objects.filter(pk=buy.pk).update(timestamp=self.day0 + timedelta(hours=15))
+        Transaction.objects.filter(pk=sell.pk).update(timestamp=self.day0 + timedelta(days=2, hours=15))
+        # no bar on day 3, its close is carried forward
+        aapl = Asset.objects.get(symbol='AAPL')
+        PriceBar.objects.bulk_create([
+            PriceBar(asset=aapl, interval='1d', timestamp=self.day0 + timedelta(days=day),
+                     open=close, high=close, low=close, close=close, volume=100)
+            for day, close in ((0, 110), (1, 120), (2, 130), (4, 140))
+        ])
+
+    def curve(self):
+        return list(PortfolioSnapshot.objects.filter(portfolio_id=self.portfolio_id).order_by('date')
+                    .values_list('cash', 'market_value', 'equity'))
+
+    def test_backfill_replays_history(self):
+        self.assertEqual(backfill(provider='database'), 5)
+        self.assertEqual(self.curve(), [
+            (Decimal('9000'), Decimal('1100'), Decimal('10100')),
+            (Decimal('9000'), Decimal('1200'), Decimal('10200')),
+            (Decimal('9520'), Decimal('780'), Decimal('10300')),
+            (Decimal('9520'), Decimal('780'), Decimal('10300')),
+            (Decimal('9520'), Decimal('840'), Decimal('10360')),
+        ])
+        first = PortfolioSnapshot.objects.get(portfolio_id=self.portfolio_id, date=self.day0.date())
+        self.assertEqual(first.holdings, {'AAPL': 10.0})
+
+    def test_backfill_window_starts_from_running_totals(self):
+        backfill(start=(self.day0 + timedelta(days=3)).date(), provider='database')
+        self.assertEqual(self.curve(), [
+            (Decimal('9520'), Decimal('780'), Decimal('10300')),
+            (Decimal('9520'), Decimal('840'), Decimal('10360')),
+        ])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_daily_snapshot_matches_backfill_and_serves_curve(self):
+        backfill(provider='database')
+        self.assertEqual(take_snapshots(prices={'AAPL': 140.0}), 1)
+        today = PortfolioSnapshot.objects.get(portfolio_id=self.portfolio_id, date=self.today.date())
+        self.assertEqual((today.equity, today.holdings), (Decimal('10360'), {'AAPL': 6.0}))
+
+        self.client.force_login(self.user)
+        body = self.client.get(reverse('equity_curve')).json()
+        self.assertEqual(body['t'][0], self.day0.date().isoformat())
+        self.assertEqual(body['equity'], [10100.0, 10200.0, 10300.0, 10300.0, 10360.0])
+        self.assertEqual(self.client.get(reverse('equity_curve'), {'start': 'x'}).status_code, 400)
+
+
+class AssetRegistryTests(TestCase):
+
+    def setUp(self):
+        asset_registry.clear()
+        # cached ids outlive the rows each test rolls back
+        self.addCleanup(asset_registry.clear)
+
+    def test_resolves_from_memory_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = asset_registry.resolve(['AAPL', 'MSFT'])
+        self.assertEqual(Asset.objects.filter(symbol__in=['AAPL', 'MSFT']).count(), 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(asset_registry.resolve(['MSFT', 'AAPL']), created)
+            self.assertEqual(asset_registry.symbols([created['AAPL'].id]), {created['AAPL'].id: 'AAPL'})
+        self.assertIsNone(asset_registry.get('NOPE', create=False))
+
+    def test_signals_invalidate_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ref = asset_registry.get('BTC')
+        asset = Asset.objects.get(pk=ref.id)
+        asset.asset_type = 'crypto'
+        asset.save()
+        self.assertEqual(asset_registry.get('BTC').asset_type, 'crypto')
+
+        asset.delete()
+        self.assertEqual(len(asset_registry), 0)
+        self.assertIsNone(asset_registry.get('BTC', create=False))
+
+    def test_rolled_back_assets_are_not_cached(self):
+        with self.assertRaises(TradeError):
+            with transaction.atomic():
+                asset_registry.get('TSLA')
+                raise TradeError("rejected", 'invalid')
+        self.assertEqual(len(asset_registry), 0)
+        self.assertFalse(Asset.objects.filter(symbol='TSLA').exists())
+
+    def test_symbol_is_unique(self):
+        Asset.objects.create(symbol='AAPL', name='Apple', asset_type='stock')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Asset.objects.create(symbol='AAPL', name='Apple again', asset_type='stock')
+
+
+LISTING = """Symbol|Security Name|Market Category|Test Issue|Financial Status|Round Lot Size|ETF|NextShares
+AAPL|Apple Inc. - Common Stock|Q|N|N|100|N|N
+AAP|Advance Auto Parts Inc.|Q|N|N|100|N|N
+APLE|Apple Hospitality REIT, Inc.|Q|N|N|100|N|N
+MSFT|Microsoft Corporation - Common Stock|Q|N|N|100|N|N
+BAC|Bank of America Corporation|Q|N|N|100|N|N
+QQQ|Invesco QQQ Trust, Series 1|G|N|N|100|Y|N
+File Creation Time: 0101202400:00||||||
+"""
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SYMBOL_INDEX_SYNC_SECONDS=0)
+class SymbolSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.listing = os.path.join(directory, 'nasdaqlisted.txt')
+        with open(self.listing, 'w') as f:
+            f.write(LISTING)
+        symbol_index.built = False
+        # the shared index must not keep rows this test rolls back
+        self.addCleanup(setattr, symbol_index, 'built', False)
+
+    def symbols(self, index, query, limit=10):
+        return [result['symbol'] for result in index.search(query, limit)]
+
+    def test_reads_pipe_and_csv_listings(self):
+        listing = read_listing(self.listing)
+        self.assertEqual(listing['QQQ'], ('Invesco QQQ Trust, Series 1', 'etf'))
+        self.assertEqual(len(listing), 6)
+        path = os.path.join(os.path.dirname(self.listing), 'listing.csv')
+        with open(path, 'w') as f:
+            f.write('symbol,name,asset_type\nBTC-USD,Bitcoin USD,crypto\n')
+        self.assertEqual(read_listing(path), {'BTC-USD': ('Bitcoin USD', 'crypto')})
+        self.assertEqual(read_listing(path + '.missing'), {})
+
+    def test_unreadable_listings_are_empty(self):
+        path = os.path.join(os.path.dirname(self.listing), 'listing.csv')
+        for content in ('', '\n', 'Symbol\nAAPL\n', 'code,description\nAAPL,Apple Inc.\n', '<html></html>'):
+            with self.subTest(content=content):
+                with open(path, 'w') as f:
+                    f.write(content)
+                with self.assertLogs('trading_portfolio.search', 'WARNING'):
+                    self.assertEqual(read_listing(path), {})
+        with self.assertLogs('trading_portfolio.search', 'WARNING'):
+            self.assertEqual(self.symbols(SymbolIndex(listing_path=path), 'aapl'), [])
+
+    def test_ranks_symbols_before_name_words(self):
+        index = SymbolIndex(listing_path=self.listing)
+        self.assertEqual(self.symbols(index, 'aap'), ['AAP', 'AAPL'])
+        self.assertEqual(self.symbols(index, 'ap'), ['APLE', 'AAPL'])
+        self.assertEqual(self.symbols(index, 'apple'), ['AAPL', 'APLE'])
+        self.assertEqual(self.symbols(index, 'apple hosp'), ['APLE'])
+        self.assertEqual(self.symbols(index, 'micro'), ['MSFT'])
+        # filler words are not indexed
+        self.assertEqual(self.symbols(index, 'corporation'), [])
+        self.assertEqual(self.symbols(index, '  '), [])
+        self.assertEqual(index.search('q')[0], {'symbol': 'QQQ', 'name': 'Invesco QQQ Trust, Series 1',
+                                                 'asset_type': 'etf'})
+
+    def test_known_assets_rank_first(self):
+        Asset.objects.create(symbol='AAPL', name='Apple Inc.', asset_type='stock')
+        index = SymbolIndex(listing_path=self.listing)
+        self.assertEqual(self.symbols(index, 'a', limit=3), ['AAPL', 'AAP', 'APLE'])
+
+    def test_asset_changes_update_the_index(self):
+        with override_settings(SYMBOL_LISTING_FILE=self.listing, SYMBOL_INDEX_SYNC_SECONDS=3600):
+            self.assertEqual(self.symbols(symbol_index, 'nvid'), [])
+            with self.assertNumQueries(0):
+                self.assertEqual(self.symbols(symbol_index, 'aapl'), ['AAPL'])
+
+            asset = Asset.objects.create(symbol='NVDA', name='NVIDIA Corporation', asset_type='stock')
+            self.assertEqual(self.symbols(symbol_index, 'nvid'), ['NVDA'])
+            asset.symbol, asset.name = 'NVDX', 'Nvidia Leveraged'
+            asset.save()
+            self.assertEqual(self.symbols(symbol_index, 'nv'), ['NVDX'])
+            self.assertEqual(self.symbols(symbol_index, 'lever'), ['NVDX'])
+            asset.delete()
+            self.assertEqual(self.symbols(symbol_index, 'nv'), [])
+
+            # deleting a listed asset keeps the listing entry
+            Asset.objects.create(symbol='MSFT', name='Microsoft', asset_type='stock').delete()
+            self.assertEqual(self.symbols(symbol_index, 'msft'), ['MSFT'])
+
+    def test_other_workers_sync_from_the_table(self):
+        # a second index stands in for another worker: it gets no signals
+        other = SymbolIndex(listing_path=self.listing)
+        self.assertEqual(self.symbols(other, 'bitc'), [])
+
+        Asset.objects.bulk_create([Asset(symbol='BTC-USD', name='Bitcoin USD', asset_type='crypto')])
+        self.assertEqual(self.symbols(other, 'bitc'), ['BTC-USD'])
+
+        asset = Asset.objects.get(symbol='BTC-USD')
+        asset.name = 'Bitcoin'
+        asset.save()
+        self.assertEqual(other.search('btc')[0]['name'], 'Bitcoin')
+        asset.delete()
+        self.assertEqual(self.symbols(other, 'btc'), [])
+        self.assertEqual(len(other), 6)
+
+    def test_large_prefixes_are_memoised_until_they_change(self):
+        index = SymbolIndex()
+        index.load({f'Z{i:04d}': (f'Zeta Fund {i}', 'etf') for i in range(MEMO_THRESHOLD + 10)}, [])
+        self.assertEqual(self.symbols(index, 'z', limit=2), ['Z0000', 'Z0001'])
+        self.assertEqual(index.stats()['memoised_prefixes'], 1)
+        index.update_asset(1, 'Z', 'Zed', 'stock')
+        self.assertEqual(index.stats()['memoised_prefixes'], 0)
+        self.assertEqual(self.symbols(index, 'z', limit=2), ['Z', 'Z0000'])
+        self.assertEqual(self.symbols(index, 'zeta 12', limit=2), ['Z0012', 'Z0120'])
+
+    def test_endpoint(self):
+        with override_settings(SYMBOL_LISTING_FILE=self.listing):
+            response = self.client.get(reverse('symbol_search'), {'q': 'app', 'limit': 1})
+        self.assertEqual(response.json(), {'results': [
+            {'symbol': 'AAPL', 'name': 'Apple Inc. - Common Stock', 'asset_type': 'stock'}]})
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('symbol_search'), {'q': 'a', 'limit': 'x'}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RISK_BENCHMARK='SPY', RISK_LOOKBACK_DAYS=40, RISK_CONFIDENCE=0.95)
+class RiskAnalyticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(7)
+        cls.market = rng.normal(0.0005, 0.01, 60)
+        closes = {
+            'SPY': 400 * np.cumprod(1 + cls.market),
+            # twice the market's daily moves
+            'LEV': 50 * np.cumprod(1 + 2 * cls.market),
+            'IDI': 20 * np.cumprod(1 + rng.normal(0, 0.02, 60)),
+        }
+        today = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        bars = []
+        for symbol, series in closes.items():
+            asset = Asset.objects.create(symbol=symbol, name=symbol, asset_type='stock')
+            for i, close in enumerate(series):
+                price = Decimal(f'{close:.8f}')
+                bars.append(PriceBar(asset=asset, interval='1d', timestamp=today - timedelta(days=59 - i),
+                                     open=price, high=price, low=price, close=price))
+        PriceBar.objects.bulk_create(bars)
+        Asset.objects.create(symbol='NOBARS', name='No bars', asset_type='stock')
+        cls.closes = closes
+
+        cls.levered = User.objects.create_user('levered', password='secret-pass-123')
+        cls.mixed = User.objects.create_user('mixed', password='secret-pass-123')
+        UserProfile.objects.filter(user=cls.levered).update(account_balance=0)
+        for user, holdings in ((cls.levered, {'LEV': 10}), (cls.mixed, {'LEV': 5, 'IDI': 40, 'NOBARS': 3})):
+            for symbol, quantity in holdings.items():
+                PortfolioPosition.objects.create(portfolio=user.portfolio, asset=Asset.objects.get(symbol=symbol),
+                                                 quantity=quantity)
+
+    def setUp(self):
+        cache.clear()
+        asset_registry.clear()
+        self.addCleanup(asset_registry.clear)
+
+    def test_fully_invested_figures(self):
+        report = portfolio_risk(self.levered.portfolio.pk)
+        daily = 2 * self.market[-40:]
+        self.assertEqual((report['observations'], report['benchmark']), (40, 'SPY'))
+        self.assertAlmostEqual(report['equity'], 10 * self.closes['LEV'][-1], places=2)
+        self.assertAlmostEqual(report['beta'], 2.0, places=4)
+        self.assertAlmostEqual(report['volatility'], daily.std(ddof=1) * np.sqrt(252), places=4)
+        self.assertAlmostEqual(report['var_historical'], -np.quantile(daily, 0.05), places=4)
+        self.assertAlmostEqual(report['var_parametric'], -(daily.mean() - 1.6448536 * daily.std(ddof=1)), places=4)
+        wealth = np.cumprod(1 + daily)
+        self.assertAlmostEqual(report['max_drawdown'], max(1 - w / wealth[:i + 1].max() for i, w in enumerate(wealth)),
+                               places=4)
+        self.assertEqual(report['correlation'], {'symbols': ['LEV'], 'matrix': [[None]]})
+
+    def test_cash_and_missing_bars(self):
+        report = portfolio_risk(self.mixed.portfolio.pk)
+        self.assertEqual(report['missing'], ['NOBARS'])
+        self.assertEqual(report['correlation']['symbols'], ['IDI', 'LEV'])
+        invested = 5 * self.closes['LEV'][-1] + 40 * self.closes['IDI'][-1]
+        self.assertAlmostEqual(report['invested'], invested, places=2)
+        self.assertAlmostEqual(report['equity'], 10000 + invested, places=2)
+        self.assertAlmostEqual(report['var_historical_amount'], report['var_historical'] * report['equity'], places=1)
+
+    def test_batches_match_single_reports(self):
+        together = list(analyse(chunk_size=1)) + list(analyse(chunk_size=100))
+        singles = [next(analyse([report['portfolio_id']])) for report in together[:len(together) // 2]]
+        self.assertEqual(together[:len(singles)], singles)
+        self.assertEqual(together[len(singles):], singles)
+
+    def test_cached_per_day_until_a_trade(self):
+        portfolio_id = self.mixed.portfolio.pk
+        self.client.force_login(self.mixed)
+        first = self.client.get(reverse('risk')).json()
+        with self.assertNumQueries(3):  # session, user, portfolio id
+            self.assertEqual(self.client.get(reverse('risk')).json(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_trade(self.mixed, 'SPY', 'BUY', '10', '400')
+        self.assertIsNone(cache.get(cache_key(portfolio_id)))
+        self.assertEqual(self.client.get(reverse('risk')).json()['correlation']['symbols'], ['IDI', 'LEV', 'SPY'])
+
+    def test_command_warms_the_cache(self):
+        out = StringIO()
+        call_command('score_portfolios', stdout=out)
+        self.assertIn('Scored 2 portfolios', out.getvalue())
+        self.assertEqual(cache.get(cache_key(self.levered.portfolio.pk))['beta'], round(2.0, 6))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AccountProvisioningTests(TestCase):
+
+    def test_registration_and_login_write_the_profile_once(self):
+        # SQL per request: 17 and 13 while every User save re-read and re-saved the profile
+        with self.assertNumQueries(13):
+            response = self.client.post(reverse('register'), {
+                'username': 'newbie', 'first_name': 'New', 'last_name': 'Bie', 'email': 'new@example.com',
+                'password1': 'Very-secret-123', 'password2': 'Very-secret-123'})
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+        user = User.objects.get(username='newbie')
+        self.assertTrue(Portfolio.objects.filter(user=user).exists())
+        updated = user.profile.updated_at
+
+        self.client.logout()
+        with self.assertNumQueries(11):
+            self.client.post(reverse('login'), {'username': 'newbie', 'password': 'Very-secret-123'})
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.updated_at, profile.last_login_ip), (updated, '127.0.0.1'))
+
+        with self.assertNumQueries(3):
+            User.objects.create_user('another', password='secret-pass-123')
+
+    def test_profile_changes_are_saved_with_the_user(self):
+        user = User.objects.create_user('trader', password='secret-pass-123')
+        user = User.objects.get(pk=user.pk)
+        user.profile.phone_number = '5550100'
+        user.save()
+        self.assertEqual(UserProfile.objects.get(user=user).phone_number, '5550100')
+
+    def test_bulk_provisioning(self):
+        User.objects.create_user('user0001', password='secret-pass-123')
+        rows = [{'username': f'user{i:04d}', 'email': f'User{i}@EXAMPLE.com', 'account_balance': '2500'}
+                for i in range(1500)]
+        rows += [{'username': 'user0002'}, {'username': 'bad name'}, {'username': 'hashed', 'password_hash': 'nope'},
+                 {'username': 'own', 'password': 'own-secret-123'}]
+
+        with CaptureQueriesContext(connection) as queries:
+            result = provision(rows, password='shared-secret-123', chunk=500)
+        self.assertEqual((result['created'], result['skipped']), (1500, 2))
+        self.assertEqual([line for line, _ in result['errors']], [1502, 1503])
+        # a handful of statements per chunk instead of three per user
+        self.assertLess(len(queries), 60)
+
+        user = User.objects.select_related('profile', 'portfolio').get(username='user0500')
+        self.assertEqual((user.email, user.profile.account_balance), ('User500@example.com', Decimal('2500')))
+        self.assertTrue(user.check_password('shared-secret-123'))
+        self.assertTrue(User.objects.get(username='own').check_password('own-secret-123'))
+        self.assertEqual(UserProfile.objects.count(), Portfolio.objects.count())
+        self.assertEqual(UserProfile.objects.count(), User.objects.count())
+
+    def test_command_reads_csv_and_json(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'accounts.csv'), 'w') as f:
+            f.write('username,email,first_name,last_name\nada,ada@example.com,Ada,Lovelace\n')
+        with open(os.path.join(directory, 'accounts.json'), 'w') as f:
+            json.dump([{'username': 'grace'}, {'username': 'ada'}], f)
+
+        out = StringIO()
+        call_command('provision_accounts', os.path.join(directory, 'accounts.csv'), stdout=out)
+        call_command('provision_accounts', os.path.join(directory, 'accounts.json'), password='x', stdout=out)
+        self.assertIn('Created 1 accounts, skipped 1', out.getvalue())
+        self.assertEqual(User.objects.get(username='ada').last_name, 'Lovelace')
+        self.assertFalse(User.objects.get(username='ada').has_usable_password())
+        self.assertTrue(Portfolio.objects.filter(user__username='grace').exists())
+
+
+class AdminChangelistTests(TestCase):
+    CHANGELISTS = {
+        'trading_portfolio_transaction': 7,
+        'trading_portfolio_portfolioposition': 5,
+        'trading_portfolio_portfolio': 5,
+        'trading_portfolio_watchlist': 5,
+        'trading_portfolio_userprofile': 5,
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.client.force_login(self.admin)
+        self.assets = Asset.objects.bulk_create([Asset(symbol=f'ADM{i}', name=f'Admin {i}', asset_type='stock')
+                                                 for i in range(5)])
+
+    def add_rows(self, users):
+        for i in range(users):
+            user = User.objects.create_user(f'holder{User.objects.count()}', password='secret-pass-123')
+            set_symbols(user.pk, ['AAPL'])
+            Transaction.objects.bulk_create([
+                Transaction(portfolio=user.portfolio, asset=asset, transaction_type='BUY', quantity=1, price=10,
+                            timestamp=datetime(2024 + j % 2, 1 + j, 1, tzinfo=dt_timezone.utc))
+                for j, asset in enumerate(self.assets)
+            ])
+            PortfolioPosition.objects.bulk_create([PortfolioPosition(portfolio=user.portfolio, asset=asset,
+                                                                     quantity=1) for asset in self.assets])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for users in (2, 20):
+            self.add_rows(users)
+            for name, queries in self.CHANGELISTS.items():
+                with self.subTest(changelist=name, rows=users), self.assertNumQueries(queries):
+                    response = self.client.get(reverse(f'admin:{name}_changelist'))
+                self.assertEqual(response.status_code, 200)
+        self.assertContains(self.client.get(reverse('admin:trading_portfolio_transaction_changelist')),
+                            "holder1&#x27;s Portfolio")
+
+    def test_filtered_and_searched_pages(self):
+        self.add_rows(3)
+        url = reverse('admin:trading_portfolio_transaction_changelist')
+        # a filtered page is counted exactly, once, and the date hierarchy skips min/max
+        with self.assertNumQueries(5):
+            response = self.client.get(url, {'q': 'ADM1', 'transaction_type__exact': 'BUY', 'timestamp__year': 2025})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_autocomplete_instead_of_select_boxes(self):
+        response = self.client.get(reverse('admin:trading_portfolio_transaction_add'))
+        self.assertContains(response, 'class="admin-autocomplete"', count=2)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'adm3', 'app_label': 'trading_portfolio', 'model_name': 'transaction', 'field_name': 'asset'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['ADM3 - Admin 3'])
+
+    def test_estimated_count_for_big_unfiltered_tables(self):
+        self.add_rows(2)
+        rows = Transaction.objects.count()
+        self.assertEqual(estimate_rows(Transaction), Transaction.objects.order_by('-id').first().id)
+        Transaction.objects.filter(pk=Transaction.objects.order_by('id').first().pk).delete()
+
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1), self.assertNumQueries(1):
+            # max(rowid) instead of COUNT(*): the deleted row is still counted
+            self.assertEqual(EstimatedCountPaginator(Transaction.objects.order_by('id'), 5).count, rows)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1):
+            filtered = Transaction.objects.filter(quantity=1).order_by('id')
+            self.assertEqual(EstimatedCountPaginator(filtered, 5).count, rows - 1)
+        self.assertEqual(EstimatedCountPaginator(Transaction.objects.order_by('id'), 5).count, rows - 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SESSION_ACTIVITY_FLUSH_SECONDS=3600)
+class SessionActivityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        activity.flush()
+        self.user = User.objects.create_user('trader', password='secret-pass-123')
+
+    def login(self):
+        client = Client(HTTP_USER_AGENT='test')
+        client.post(reverse('login'), {'username': 'trader', 'password': 'secret-pass-123'})
+        return client
+
+    def test_each_login_gets_its_own_session_row(self):
+        laptop, phone = self.login(), self.login()
+        keys = {laptop.session.session_key, phone.session.session_key}
+        self.assertEqual(set(UserSession.objects.filter(user=self.user, is_active=True)
+                             .values_list('session_key', flat=True)), keys)
+
+        phone.get(reverse('logout'))
+        self.assertEqual(list(UserSession.objects.filter(user=self.user, is_active=True)
+                              .values_list('session_key', flat=True)), [laptop.session.session_key])
+
+    def test_login_is_an_upsert(self):
+        request = RequestFactory().post('/login/', REMOTE_ADDR='10.0.0.1')
+        request.session = SimpleNamespace(session_key='k' * 32)
+        start_session(request, self.user)
+        UserSession.objects.update(is_active=False)
+        with self.assertNumQueries(1):
+            start_session(request, self.user)
+        session = UserSession.objects.get()
+        self.assertEqual((session.session_key, session.is_active, session.ip_address), ('k' * 32, True, '10.0.0.1'))
+
+    def test_activity_is_coalesced_and_flushed_in_bulk(self):
+        client = self.login()
+        cache.clear()
+        long_ago = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        UserSession.objects.update(last_activity=long_ago)
+
+        for _ in range(3):
+            client.get(reverse('transaction_history'))
+        self.assertEqual(len(activity), 1)
+        self.assertEqual(UserSession.objects.get().last_activity, long_ago)
+
+        # one update for the pending sessions, nothing at all when none are pending
+        with self.assertNumQueries(1):
+            self.assertEqual(activity.flush(), 1)
+        self.assertGreater(UserSession.objects.get().last_activity, long_ago)
+        with self.assertNumQueries(0):
+            self.assertEqual(activity.flush(), 0)
+
+    def test_flush_does_not_revive_logged_out_sessions(self):
+        client = self.login()
+        session_key = client.session.session_key
+        cache.clear()
+        client.get(reverse('transaction_history'))
+        # the logout is handled by another worker, this one still holds the mark
+        UserSession.objects.update(is_active=False)
+
+        activity.flush()
+        self.assertFalse(UserSession.objects.get(session_key=session_key).is_active)
+
+    def test_idle_sweep_runs_once_per_interval(self):
+        self.login()
+        UserSession.objects.update(last_activity=datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        cache.delete('session_activity:sweep')
+
+        self.assertEqual(activity.sweep(), 1)
+        self.assertFalse(UserSession.objects.get().is_active)
+        with self.assertNumQueries(0):
+            self.assertIsNone(activity.sweep())
+
+
+class ConnectionStatsTests(TestCase):
+
+    def setUp(self):
+        if not isinstance(connections[DEFAULT_DB_ALIAS], InstrumentedConnectionMixin):
+            self.skipTest('DB_INSTRUMENT is off')
+        connection_stats.reset()
+        self.addCleanup(connection_stats.reset)
+
+    def test_new_connections_are_timed(self):
+        fresh = connections.create_connection(DEFAULT_DB_ALIAS)
+        fresh.connect()
+        fresh.close()
+        stats = connection_stats.stats()[DEFAULT_DB_ALIAS]
+        self.assertEqual(stats['connects'], 1)
+        self.assertGreaterEqual(stats['avg_connect_ms'], 0)
+
+    def test_requests_on_an_open_connection_count_as_reused(self):
+        user = User.objects.create_user('trader', password='secret-pass-123', is_staff=True)
+        client = Client()
+        client.force_login(user)
+        client.get(reverse('transaction_history'))
+        response = client.get(reverse('db_connection_stats'))
+
+        stats = response.json()[DEFAULT_DB_ALIAS]
+        self.assertEqual((stats['requests'], stats['reused'], stats['reuse_ratio']), (2, 2, 1.0))
+        self.assertEqual(stats['connects'], 0)
+
+    def test_stats_are_staff_only(self):
+        User.objects.create_user('trader', password='secret-pass-123')
+        client = Client()
+        client.login(username='trader', password='secret-pass-123')
+        self.assertEqual(client.get(reverse('db_connection_stats')).status_code, 302)
+
+
+def server_timing(response):
+    metrics = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MARKET_DATA_PROVIDER='fake', MARKET_DATA_FAKE_LATENCY_MS=0,
+                   QUOTE_CACHE_BACKGROUND_REFRESH=False, QUOTE_CACHE_WAIT=0, QUOTE_BATCH_WINDOW_MS=0)
+class WatchlistTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('trader', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def table(self):
+        return [row['symbol'] for row in self.client.get(reverse('dashboard')).context['financialTableData']]
+
+    def test_default_table_then_added_and_reordered_symbols(self):
+        self.assertEqual(self.table(), FINANCIAL_TABLE_SYMBOLS)
+
+        response = self.client.post(reverse('dashboard'), {'Symbols': 'nvda, aapl'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.table(), [*FINANCIAL_TABLE_SYMBOLS, 'NVDA'])
+
+        response = self.client.post(reverse('watchlist'), {'symbols': 'tsla,AAPL,tsla'})
+        self.assertEqual(response.json(), {'symbols': ['TSLA', 'AAPL']})
+        self.assertEqual(self.table(), ['TSLA', 'AAPL'])
+        self.assertEqual(self.client.get(reverse('watchlist')).json(), {'symbols': ['TSLA', 'AAPL']})
+
+    def test_upstream_fetches_scale_with_distinct_symbols(self):
+        before = quote_batcher.stats()
+        for i, symbols in enumerate((['AAA', 'BBB'], ['BBB', 'CCC'], ['CCC', 'AAA'], ['AAA', 'BBB', 'CCC'])):
+            user = User.objects.create_user(f'watcher{i}', password='secret-pass-123')
+            set_symbols(user.pk, symbols)
+            client = Client()
+            client.force_login(user)
+            self.assertEqual(client.get(reverse('dashboard')).status_code, 200)
+
+        after = quote_batcher.stats()
+        self.assertEqual(after['symbols'] - before['symbols'], 3)
+        self.assertEqual(after['batches'] - before['batches'], 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, QUOTE_CACHE_BACKGROUND_REFRESH=False, QUOTE_CACHE_WAIT=0)
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_bars(directory, 'AAPL', [100, 101, 102])
+        settings_override = override_settings(MARKET_DATA_PROVIDER='file', MARKET_DATA_DIR=directory,
+                                              METRICS_TOKEN='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        self.user = User.objects.create_user('trader', password='secret-pass-123', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_server_timing_breaks_down_the_request(self):
+        response = self.client.get(reverse('dashboard'))
+
+        timing = server_timing(response)
+        self.assertGreater(int(timing['db']['desc'].strip('"').split()[0]), 0)
+        self.assertGreaterEqual(int(timing['upstream']['desc'].strip('"').split()[0]), 1)
+        self.assertGreater(float(timing['render']['dur']), 0)
+        self.assertGreaterEqual(float(timing['total']['dur']), float(timing['render']['dur']))
+
+    def test_database_provider_is_counted_as_db_only(self):
+        with override_settings(MARKET_DATA_PROVIDER='database'):
+            response = self.client.get(reverse('dashboard'))
+
+        timing = server_timing(response)
+        self.assertEqual(timing['upstream']['desc'], '"0 calls"')
+        self.assertGreater(int(timing['db']['desc'].strip('"').split()[0]), 0)
+
+    def test_query_count_matches_the_queries_run(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('transaction_history'))
+        self.assertEqual(server_timing(response)['db']['desc'], f'"{len(queries)} queries"')
+
+    def test_metrics_endpoint_exposes_per_view_histograms(self):
+        for _ in range(3):
+            self.client.get(reverse('transaction_history'))
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('portfolio_request_duration_seconds_count{view="transaction_history"} 3', body)
+        self.assertIn('portfolio_request_duration_seconds_bucket{view="transaction_history",le="+Inf"} 3', body)
+        self.assertIn('portfolio_request_duration_quantile_seconds{view="transaction_history",quantile="0.99"}', body)
+        self.assertIn('portfolio_db_queries_total{view="transaction_history"}', body)
+
+    def test_metrics_endpoint_access(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape-me'):
+            self.assertEqual(Client().get(reverse('metrics')).status_code, 401)
+            response = Client().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+            self.assertEqual(response.status_code, 200)
+
+    def test_disabled_metrics_skip_the_middleware(self):
+        with override_settings(METRICS_ENABLED=False):
+            client = Client()
+            client.force_login(self.user)
+            response = client.get(reverse('transaction_history'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.views, {})
+
+    def test_quantiles_interpolate_within_buckets(self):
+        buckets = [0] * (len(metrics.BUCKETS) + 1)
+        buckets[0], buckets[5] = 50, 50
+        self.assertEqual(metrics.quantile(buckets, 0.5), metrics.BUCKETS[0])
+        self.assertTrue(metrics.BUCKETS[4] < metrics.quantile(buckets, 0.99) <= metrics.BUCKETS[5])
+        self.assertIsNone(metrics.quantile([0] * len(buckets), 0.5))
+
+
+class TradeConcurrencyTests(TransactionTestCase):
+    threads = 8
+    trades_per_thread = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            # SQLite has no SELECT ... FOR UPDATE: the worker threads' transactions take the write lock up
+            # front instead, which serialises them the way the row lock does elsewhere (as benchmarks/load.py).
+            # The in-memory test database uses a shared cache, which reports a held lock at once instead of
+            # waiting for it, so the workers retry a trade that was rolled back on "table is locked"
+            options = connection.settings_dict['OPTIONS']
+            self.addCleanup(options.pop, 'transaction_mode', None)
+            options['transaction_mode'] = 'IMMEDIATE'
+
+    def test_concurrent_trades_keep_account_consistent(self):
+        user = User.objects.create_user('stress', password='secret-pass-123')
+        UserProfile.objects.filter(user=user).update(account_balance=Decimal('100'))
+        errors = []
+        rejected = [0]
+        lock = threading.Lock()
+
+        def worker(seed):
+            try:
+                for i in range(self.trades_per_thread):
+                    side = 'BUY' if (seed + i) % 3 else 'SELL'
+                    while True:
+                        try:
+                            execute_trade(user, 'AAPL', side, '1', '10')
+                        except TradeError:
+                            with lock:
+                                rejected[0] += 1
+                        except OperationalError as e:
+                            if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                                raise
+                            time.sleep(0.001)
+                            continue
+                        break
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        buys = Transaction.objects.filter(transaction_type='BUY').count()
+        sells = Transaction.objects.filter(transaction_type='SELL').count()
+        positions = list(PortfolioPosition.objects.filter(portfolio__user=user))
+        held = positions[0].quantity if positions else Decimal('0')
+
+        self.assertEqual(buys + sells, self.threads * self.trades_per_thread - rejected[0])
+        self.assertLessEqual(len(positions), 1)
+        self.assertEqual(held, buys - sells)
+        self.assertGreaterEqual(self.balance(user), 0)
+        self.assertEqual(self.balance(user) + held * 10, Decimal('100'))
+
+    def balance(self, user):
+        return UserProfile.objects.get(user=user).account_balance
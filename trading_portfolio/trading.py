@@ -0,0 +1,244 @@
+"""
+Trade execution service.
+
+Every order runs in one database transaction. The account's ``UserProfile``
+row is locked with ``select_for_update`` first, so concurrent orders for the
+same account are serialised while other accounts trade in parallel; balance
+changes are then written with ``F()`` expressions, positions through the
+upserts in ``positions.py``, and the cost basis ledger is updated in the
+same transaction (see ``ledger.py``). A fill
+costs at most ``TRADE_QUERY_BUDGET`` queries once the symbol is in the
+registry (see ``registry.py``).
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import ledger, risk
+from .models import Portfolio, PortfolioPosition, Transaction, UserProfile
+from .positions import increment_position, write_positions
+from .registry import asset_registry
+
+SIDES = ('BUY', 'SELL')
+
+# lock profile, portfolio id, position upsert (buys) or position lock + write (sells), balance write,
+# transaction insert, then the ledger: lock row, lock lots (sells), ledger write, lot insert or lot update + lot delete
+# (the asset comes from the symbol registry, a query only on a registry miss)
+TRADE_QUERY_BUDGET = 11
+
+ORDER_FIELDS = ('symbol', 'transaction_type', 'quantity', 'price')
+
+
+class TradeError(Exception):
+    """An order that was rejected; nothing was written."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+@dataclass(frozen=True)
+class TradeResult:
+    transaction: Transaction
+    balance: Decimal
+    position_quantity: Decimal
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    results: list
+    balance: Decimal
+    filled: int
+    rejected: int
+
+    def as_dict(self):
+        return {
+            'balance': str(self.balance),
+            'filled': self.filled,
+            'rejected': self.rejected,
+            'results': self.results,
+        }
+
+
+def parse_decimal(value, field):
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError, ValueError):
+        raise TradeError(f"Invalid {field}!", 'invalid')
+    if not number.is_finite() or number <= 0:
+        raise TradeError(f"Invalid {field}!", 'invalid')
+    return number
+
+
+def validate_order(symbol, transaction_type, quantity, price):
+    """Normalise raw order fields, raising ``TradeError`` on bad input."""
+    symbol = (symbol or '').strip().upper()
+    if not symbol:
+        raise TradeError("Invalid symbol!", 'invalid')
+    if transaction_type not in SIDES:
+        raise TradeError("Invalid transaction type!", 'invalid')
+    return symbol, transaction_type, parse_decimal(quantity, 'quantity'), parse_decimal(price, 'price')
+
+
+def execute_trade(user, symbol, transaction_type, quantity, price):
+    """Fill one BUY/SELL order for ``user`` at ``price`` and return a ``TradeResult``."""
+    return fill(user.pk, *validate_order(symbol, transaction_type, quantity, price))
+
+
+def fill(user_id, symbol, transaction_type, quantity, price):
+    """``execute_trade`` on validated fields; also used by the order book (see orders.py)."""
+    total_cost = quantity * price
+    # check or create asset, outside the transaction so the registry can cache it
+    asset = asset_registry.get(symbol)
+
+    with transaction.atomic():
+        try:
+            profile = (UserProfile.objects.select_for_update()
+                       .only('id', 'account_balance').get(user_id=user_id))
+        except UserProfile.DoesNotExist:
+            raise TradeError("No trading account!", 'no_account')
+        portfolio_id = Portfolio.objects.values_list('id', flat=True).get(user_id=user_id)
+
+        if transaction_type == 'BUY':
+            if profile.account_balance < total_cost:
+                raise TradeError("Not enough balance!", 'insufficient_balance')
+            balance = profile.account_balance - total_cost
+            position_quantity = increment_position(portfolio_id, asset.id, quantity)
+            UserProfile.objects.filter(pk=profile.pk).update(account_balance=F('account_balance') - total_cost)
+
+        else:
+            position = (PortfolioPosition.objects.select_for_update()
+                        .filter(portfolio_id=portfolio_id, asset_id=asset.id).only('id', 'quantity').first())
+            if position is None:
+                raise TradeError("You don't own this asset!", 'no_position')
+            if position.quantity < quantity:
+                raise TradeError("Not enough asset quantity to sell!", 'insufficient_quantity')
+            balance = profile.account_balance + total_cost
+            position_quantity = position.quantity - quantity
+            if position_quantity == 0:
+                PortfolioPosition.objects.filter(pk=position.pk).delete()
+            else:
+                PortfolioPosition.objects.filter(pk=position.pk).update(quantity=F('quantity') - quantity)
+            UserProfile.objects.filter(pk=profile.pk).update(account_balance=F('account_balance') + total_cost)
+
+        now = timezone.now()
+        ledger.apply_fills(portfolio_id, [(asset.id, transaction_type, quantity, price, now)])
+        trade = Transaction.objects.create(
+            portfolio_id=portfolio_id, asset_id=asset.id, transaction_type=transaction_type,
+            quantity=quantity, price=price, timestamp=now
+        )
+        # the cached risk report describes the old holdings
+        transaction.on_commit(partial(risk.invalidate, portfolio_id))
+
+    return TradeResult(transaction=trade, balance=balance, position_quantity=position_quantity)
+
+
+def parse_orders(body, content_type):
+    """Read a batch of orders from a JSON list (or ``{"orders": [...]}``) or a CSV with a header row."""
+    text = body.decode('utf-8-sig') if isinstance(body, bytes) else body
+    if content_type.startswith('text/csv'):
+        orders = list(csv.DictReader(io.StringIO(text)))
+    else:
+        try:
+            orders = json.loads(text)
+        except ValueError:
+            raise TradeError("Orders must be JSON or CSV!", 'invalid')
+        if isinstance(orders, dict):
+            orders = orders.get('orders')
+    if not isinstance(orders, list) or not all(isinstance(order, dict) for order in orders):
+        raise TradeError("Orders must be a list of objects!", 'invalid')
+    return orders
+
+
+def execute_batch(user, orders, all_or_none=False):
+    """
+    Fill a list of orders in one transaction and return a ``BatchResult``.
+
+    Orders are checked in sequence against the running balance and holdings, so a
+    SELL can use shares bought earlier in the same batch. Rejected orders are reported
+    per index; with ``all_or_none`` any rejection leaves the account untouched.
+    The writes are one ``bulk_create`` of transactions, one balance update and
+    one bulk write per kind of position or ledger change, whatever the batch size.
+    """
+    results = [None] * len(orders)
+    valid = []
+    for index, order in enumerate(orders):
+        try:
+            valid.append((index, *validate_order(*(order.get(field) for field in ORDER_FIELDS))))
+        except TradeError as e:
+            results[index] = {'index': index, 'status': 'rejected', 'code': e.code, 'error': e.message}
+    assets = asset_registry.resolve(sorted({symbol for _, symbol, _, _, _ in valid}))
+
+    with transaction.atomic():
+        try:
+            profile = (UserProfile.objects.select_for_update()
+                       .only('id', 'account_balance').get(user_id=user.pk))
+        except UserProfile.DoesNotExist:
+            raise TradeError("No trading account!", 'no_account')
+        portfolio_id = Portfolio.objects.values_list('id', flat=True).get(user_id=user.pk)
+
+        positions = {
+            position.asset_id: position for position in PortfolioPosition.objects.select_for_update()
+            .filter(portfolio_id=portfolio_id, asset_id__in=[asset.id for asset in assets.values()])
+            .only('id', 'asset_id', 'quantity')
+        }
+        holdings = {asset_id: position.quantity for asset_id, position in positions.items()}
+        balance = profile.account_balance
+        now = timezone.now()
+        fills = []
+
+        for index, symbol, transaction_type, quantity, price in valid:
+            asset = assets[symbol]
+            total_cost = quantity * price
+            held = holdings.get(asset.id, Decimal('0'))
+            if transaction_type == 'BUY' and balance < total_cost:
+                error = TradeError("Not enough balance!", 'insufficient_balance')
+            elif transaction_type == 'SELL' and held == 0:
+                error = TradeError("You don't own this asset!", 'no_position')
+            elif transaction_type == 'SELL' and held < quantity:
+                error = TradeError("Not enough asset quantity to sell!", 'insufficient_quantity')
+            else:
+                error = None
+
+            if error is not None:
+                results[index] = {'index': index, 'status': 'rejected', 'code': error.code, 'error': error.message}
+                continue
+
+            if transaction_type == 'BUY':
+                balance -= total_cost
+                holdings[asset.id] = held + quantity
+            else:
+                balance += total_cost
+                holdings[asset.id] = held - quantity
+            fills.append(Transaction(portfolio_id=portfolio_id, asset_id=asset.id,
+                                     transaction_type=transaction_type, quantity=quantity, price=price,
+                                     timestamp=now))
+            results[index] = {'index': index, 'status': 'filled', 'symbol': symbol,
+                              'transaction_type': transaction_type, 'quantity': str(quantity), 'price': str(price)}
+
+        rejected = len(orders) - len(fills)
+        if all_or_none and rejected:
+            for result in results:
+                if result['status'] == 'filled':
+                    result.update(status='cancelled')
+            return BatchResult(results=results, balance=profile.account_balance, filled=0, rejected=rejected)
+
+        if fills:
+            Transaction.objects.bulk_create(fills, batch_size=500)
+            UserProfile.objects.filter(pk=profile.pk).update(
+                account_balance=F('account_balance') + (balance - profile.account_balance))
+            write_positions(portfolio_id, positions, holdings)
+            ledger.apply_fills(portfolio_id, [(fill.asset_id, fill.transaction_type, fill.quantity, fill.price, now)
+                                              for fill in fills])
+            transaction.on_commit(partial(risk.invalidate, portfolio_id))
+
+    return BatchResult(results=results, balance=balance, filled=len(fills), rejected=rejected)
+
@@ -2,6 +2,7 @@
 from django.contrib import admin
 from django.urls import path
 from . import views
+from .streaming import STREAM_PATH
 
 
 urlpatterns = [
@@ -12,5 +13,19 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('get-chart/<str:symbol>/', views.get_chart, name='get_chart'),
+    path('series/<str:symbol>/', views.get_series, name='series'),
     path('trade_asset/', views.trade_asset, name='trade_asset'),
+    path('trade_batch/', views.trade_batch, name='trade_batch'),
+    path('orders/', views.orders_view, name='orders'),
+    path('orders/<int:order_id>/cancel/', views.cancel_order_view, name='cancel_order'),
+    path('transactions/', views.transaction_history, name='transaction_history'),
+    path('equity/', views.equity_curve, name='equity_curve'),
+    path('risk/', views.risk_view, name='risk'),
+    path('quotes/', views.quotes_view, name='quotes'),
+    path('watchlist/', views.watchlist_view, name='watchlist'),
+    path('symbols/search/', views.symbol_search, name='symbol_search'),
+    path(STREAM_PATH.lstrip('/'), views.quote_stream, name='quote_stream'),
+    path('quotes/stats/', views.quote_cache_stats, name='quote_cache_stats'),
+    path('db/stats/', views.db_connection_stats, name='db_connection_stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -0,0 +1,176 @@
+"""
+Vectorised portfolio valuation.
+
+Positions for one, many or all portfolios are loaded with a single
+``values_list`` query and turned into NumPy arrays; prices come from one
+batched lookup (the ``Quote`` table, then the shared quote cache for symbols
+the ingestion worker does not track). Market value, cost, unrealised P&L,
+weights and per-portfolio totals are then plain array arithmetic, with
+``np.bincount`` doing the group-by per portfolio. Cost basis and realised
+P&L are read from the ledger rows (one per position), never from the
+transaction history.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+
+from .models import Portfolio, PortfolioPosition, PositionLedger, Quote
+from .quotes import quote_cache
+from .registry import asset_registry
+
+
+def get_prices(symbols):
+    """Return ``{symbol: last_price}`` for ``symbols`` without one upstream call per symbol."""
+    symbols = sorted(set(symbols))
+    assets = asset_registry.resolve(symbols, create=False)
+    by_id = {asset.id: symbol for symbol, asset in assets.items()}
+    prices = {by_id[asset_id]: float(price) for asset_id, price in
+              Quote.objects.filter(asset_id__in=list(by_id)).values_list('asset_id', 'last_price')}
+    missing = [symbol for symbol in symbols if symbol not in prices]
+    if missing:
+        for quote in quote_cache.get(missing):
+            if quote['last_price'] != 'N/A':
+                prices[quote['symbol']] = float(quote['last_price'])
+    return prices
+
+
+def ledger_costs(portfolio_ids=None):
+    """Return ``({(portfolio, asset): avg_cost}, {portfolio: realized_pnl})`` from the cost basis ledger."""
+    rows = PositionLedger.objects.all()
+    if portfolio_ids is not None:
+        rows = rows.filter(portfolio_id__in=portfolio_ids)
+    costs, realized = {}, {}
+    for portfolio_id, asset_id, quantity, avg_cost, realized_pnl in rows.values_list(
+            'portfolio_id', 'asset_id', Cast('quantity', FloatField()), Cast('avg_cost', FloatField()),
+            Cast('realized_pnl', FloatField())):
+        if quantity:
+            costs[(portfolio_id, asset_id)] = avg_cost
+        realized[portfolio_id] = realized.get(portfolio_id, 0.0) + realized_pnl
+    return costs, realized
+
+
+@dataclass
+class Valuation:
+    # one entry per position
+    portfolio_id: np.ndarray
+    asset_id: np.ndarray
+    symbol: np.ndarray
+    quantity: np.ndarray
+    price: np.ndarray
+    market_value: np.ndarray
+    cost_basis: np.ndarray
+    unrealized_pnl: np.ndarray
+    weight: np.ndarray
+    # one entry per portfolio
+    portfolios: np.ndarray
+    cash: np.ndarray
+    total_market_value: np.ndarray
+    total_unrealized_pnl: np.ndarray
+    total_realized_pnl: np.ndarray
+    equity: np.ndarray
+
+    def positions_for(self, portfolio_id):
+        """Rows for one portfolio as dicts, ``None`` where no price is known."""
+        def value(array, i):
+            return None if np.isnan(array[i]) else round(float(array[i]), 2)
+
+        return [{
+            'symbol': self.symbol[i],
+            'quantity': float(self.quantity[i]),
+            'price': value(self.price, i),
+            'market_value': value(self.market_value, i),
+            'cost_basis': value(self.cost_basis, i),
+            'unrealized_pnl': value(self.unrealized_pnl, i),
+            'weight': value(self.weight * 100, i),
+        } for i in np.flatnonzero(self.portfolio_id == portfolio_id)]
+
+    def totals_for(self, portfolio_id):
+        i = int(np.searchsorted(self.portfolios, portfolio_id))
+        if i >= len(self.portfolios) or self.portfolios[i] != portfolio_id:
+            return None
+        return {
+            'cash': round(float(self.cash[i]), 2),
+            'market_value': round(float(self.total_market_value[i]), 2),
+            'unrealized_pnl': round(float(self.total_unrealized_pnl[i]), 2),
+            'realized_pnl': round(float(self.total_realized_pnl[i]), 2),
+            'equity': round(float(self.equity[i]), 2),
+        }
+
+
+def value_portfolios(portfolio_ids=None, prices=None, costs=None):
+    """
+    Value the given portfolios (every portfolio when ``portfolio_ids`` is None) in one pass.
+
+    ``prices`` ({symbol: price}) and ``costs`` ({(portfolio, asset): avg_cost}) override
+    the quote and ledger lookups; realised P&L is only reported from the ledger.
+    """
+    portfolio_filter = Q() if portfolio_ids is None else Q(id__in=portfolio_ids)
+    cash_rows = list(Portfolio.objects.filter(portfolio_filter).order_by('id')
+                     .values_list('id', Cast('user__profile__account_balance', FloatField())))
+    portfolios = np.array([row[0] for row in cash_rows], dtype=np.int64)
+    cash = np.array([row[1] or 0.0 for row in cash_rows], dtype=np.float64)
+
+    positions = PortfolioPosition.objects.all()
+    if portfolio_ids is not None:
+        positions = positions.filter(portfolio_id__in=portfolio_ids)
+    # numbers only, cast in SQL: no join, no Decimal or str objects per row
+    rows = positions.values_list('portfolio_id', 'asset_id', Cast('quantity', FloatField()))
+    table = np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+    portfolio_id = table[:, 0].astype(np.int64)
+    asset_id = table[:, 1].astype(np.int64)
+    quantity = table[:, 2]
+
+    # one lookup per distinct asset, broadcast back to every position
+    assets, asset_index = np.unique(asset_id, return_inverse=True)
+    symbols = asset_registry.symbols(assets.tolist())
+    asset_symbols = np.array([symbols[a] for a in assets.tolist()], dtype=object)
+    if prices is None:
+        prices = get_prices(asset_symbols.tolist())
+    price = np.array([prices.get(s, np.nan) for s in asset_symbols], dtype=np.float64)[asset_index]
+    symbol = asset_symbols[asset_index]
+
+    realized = {}
+    if costs is None:
+        costs, realized = ledger_costs(None if portfolio_ids is None else portfolios.tolist())
+    avg_cost = lookup_costs(costs, portfolio_id, asset_id)
+
+    market_value = quantity * price
+    cost_basis = quantity * avg_cost
+    unrealized_pnl = market_value - cost_basis
+
+    # group by portfolio: position -> row in the portfolios array
+    slot = np.searchsorted(portfolios, portfolio_id)
+    total_market_value = np.bincount(slot, weights=np.nan_to_num(market_value), minlength=len(portfolios))
+    total_unrealized_pnl = np.bincount(slot, weights=np.nan_to_num(unrealized_pnl), minlength=len(portfolios))
+    total_realized_pnl = np.array([realized.get(p, 0.0) for p in portfolios.tolist()], dtype=np.float64)
+    equity = cash + total_market_value
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(equity[slot] > 0, market_value / equity[slot], np.nan)
+
+    return Valuation(
+        portfolio_id=portfolio_id, asset_id=asset_id, symbol=symbol, quantity=quantity, price=price,
+        market_value=market_value, cost_basis=cost_basis, unrealized_pnl=unrealized_pnl, weight=weight,
+        portfolios=portfolios, cash=cash, total_market_value=total_market_value,
+        total_unrealized_pnl=total_unrealized_pnl, total_realized_pnl=total_realized_pnl, equity=equity,
+    )
+
+
+def lookup_costs(costs, portfolio_id, asset_id):
+    """Vectorised ``costs[(portfolio, asset)]`` for every position, NaN when unknown."""
+    avg_cost = np.full(len(portfolio_id), np.nan)
+    if not costs or not len(portfolio_id):
+        return avg_cost
+    keys = np.array(list(costs.keys()), dtype=np.int64)
+    values = np.array(list(costs.values()), dtype=np.float64)
+    stride = int(max(keys[:, 1].max(), asset_id.max())) + 1
+    cost_keys = keys[:, 0] * stride + keys[:, 1]
+    order = np.argsort(cost_keys)
+    cost_keys, values = cost_keys[order], values[order]
+
+    position_keys = portfolio_id * stride + asset_id
+    found = np.minimum(np.searchsorted(cost_keys, position_keys), len(cost_keys) - 1)
+    hit = cost_keys[found] == position_keys
+    avg_cost[hit] = values[found[hit]]
+    return avg_cost
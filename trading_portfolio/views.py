@@ -1,7 +1,11 @@
+import asyncio
+import hmac
 import http
-from datetime import timezone
+from datetime import date, timedelta, timezone
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.dispatch import receiver
@@ -11,20 +15,35 @@ from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_protect
 from typing_extensions import assert_type
 
+from .activity import end_session, get_client_ip, start_session
+from .blocking import run_blocking
+from .charts import get_chart_image
+from .dbstats import connection_stats
 from .forms import SignUpForm, ProfileForm, StockSearchForm
-from .models import UserSession, Portfolio, Asset, Transaction, PortfolioPosition
+from .history import DEFAULT_PAGE_SIZE, serialize_transaction, transaction_page
+from .metrics import exposition, registry
+from .models import UserProfile, UserSession, Portfolio, Asset, Transaction, PortfolioPosition
+from .orders import cancel_order, list_orders, place_order, serialize_orders
+from .providers import INTERVALS, PERIODS
+from .quotes import FINANCIAL_TABLE_SYMBOLS, MAX_SYMBOLS, get_quotes, parse_symbols, quote_batcher, quote_cache
+from .risk import portfolio_risk
+from .search import symbol_index
+from .series import METHODS as SERIES_METHODS, get_series as get_series_payload
+from .snapshots import equity_curve as get_equity_curve
+from .streaming import quote_hub
+from .trading import TradeError, execute_batch, execute_trade, parse_orders
+from .valuation import value_portfolios
+from .watchlists import add_symbols, aget_symbols, get_symbols, set_symbols
 from django.db.models.signals import post_save
 from decimal import Decimal
 
-import yfinance as yf
-import matplotlib
-
-matplotlib.use(
-    'Agg')  # use non-GUI backend to prevent 'Starting a Matplotlib GUI outside of the main thread will likely fail' error
-import matplotlib.pyplot as plt
-from io import BytesIO
 import base64
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.timezone import localdate
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
 
 
 # Create your views here.
@@ -32,16 +51,6 @@ def home(request):
     return render(request, 'home.html', {})
 
 
-# get the client_ip
-def get_client_ip(request):
-    ip = request.META.get('REMOTE_ADDR')
-    if request.META.get('HTTP_X_FORWARDED_FOR'):
-        ip = request.META.get('HTTP_X_FORWARDED_FOR').split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
-
-
 def register(request):
     if request.user.is_authenticated:
         return redirect('accounts/dashboard')
@@ -49,12 +58,9 @@ def register(request):
     if request.method == 'POST':
         form = SignUpForm(request.POST)
         if form.is_valid():
-            form.save()
-            # add Authenticate and login functionality in register
-            username = form.cleaned_data['username']
-            password = form.cleaned_data['password1']
-            user = authenticate(username=username, password=password)
-            login(request, user)
+            user = form.save()
+            # log the new user in without authenticate(), which would read the row back and hash the password again
+            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             messages.success(request, "You Have Successfully Registered! Welcome!")
             return redirect('profile')
     else:
@@ -92,34 +98,11 @@ def login_view(request):
         # Authenticate
         user = authenticate(request, username=username, password=password)
         if user:
+            previous_key = request.session.session_key
             login(request, user)
-            try:
-
-                user_session = UserSession.objects.create(
-                    user=user,
-                    session_key=request.session.session_key,
-                    ip_address=get_client_ip(request),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                )
-            except Exception as e:
-
-                # If session_key already exists, update the existing one
-                try:
-                    user_session = UserSession.objects.get(session_key=request.session.session_key)
-                    user_session.user = user
-                    user_session.ip_address = get_client_ip(request)
-                    user_session.user_agent = request.META.get('HTTP_USER_AGENT', '')
-                    user_session.is_active = True
-                    user_session.last_activity = timezone.now()
-                    user_session.save()
-                except UserSession.DoesNotExist:
-                    # Log the error for debugging
-                    print(f"Session creation error: {e}")
-                    pass
-
-            if hasattr(user, 'profile'):
-                user.profile.last_login_ip = get_client_ip(request)
-                user.profile.save(update_fields=['last_login_ip'])
+            start_session(request, user, replaced_key=previous_key)
+
+            UserProfile.objects.filter(user=user).update(last_login_ip=get_client_ip(request))
 
             messages.success(request, "You Have Been Logged In!")
             return redirect('dashboard')
@@ -135,94 +118,245 @@ def login_view(request):
 @login_required
 def logout_view(request):
     # deactivate user session
-    try:
-        user_session = UserSession.objects.get(
-            user=request.user,
-            session_key=request.session.session_key,
-            is_active=True
-        )
-        user_session.is_active = False
-        user_session.save()
-    except UserSession.DoesNotExist:
-        pass
+    end_session(request.user, request.session.session_key)
     logout(request)
     messages.success(request, "You Have Been Logged Out!")
     return redirect('login')
 
 
-def dashboard(request):
+# the watchlist's ticker table (upstream quotes, in the blocking pool) and the portfolio (database) load concurrently
+# POST (the search box) adds symbols to the watchlist
+@login_required
+async def dashboard(request):
+    user = await request.auser()
+    if request.method == 'POST':
+        symbols = parse_symbols(request.POST.get('Symbols', ''))
+        if symbols is None:
+            messages.error(request, f"At most {MAX_SYMBOLS} symbols")
+        else:
+            await sync_to_async(add_symbols)(user.pk, symbols)
+        return redirect('dashboard')
+
+    symbols = await aget_symbols(user.pk)
+    quotes, context = await asyncio.gather(
+        run_blocking(financial_table_view, symbols),
+        portfolio_context(user),
+    )
+    context['financialTableData'] = quotes
+    context['watchlist'] = symbols
+    return await sync_to_async(render)(request, 'accounts/dashboard.html', context)
+
+
+async def portfolio_context(user):
     # Get current user portfolio
-    portfolio = Portfolio.objects.get(user=request.user)
+    portfolio_id = await Portfolio.objects.values_list('id', flat=True).aget(user=user)
+    return await sync_to_async(portfolio_summary)(portfolio_id)
+
+
+def portfolio_summary(portfolio_id):
+    # only the first page of history, the rest is loaded from transaction_history
+    transactions, next_cursor = transaction_page(portfolio_id)
 
-    context = {
-        'financialTableData': financial_table_view(),
-        'positions': portfolio.positions.select_related("asset"),
-        'transactions': portfolio.transactions.select_related("asset"),
+    valuation = value_portfolios([portfolio_id])
+
+    return {
+        'positions': valuation.positions_for(portfolio_id),
+        'totals': valuation.totals_for(portfolio_id),
+        'transactions': transactions,
+        'transactions_next_cursor': next_cursor,
     }
-    return render(request, 'accounts/dashboard.html', context)
 
 
-def financial_table_view():
-    symbols = ['AAPL', 'MSFT', 'TSLA', 'GOOG', 'AMZN', 'RGTI', 'UBER', 'JEPQ', 'LCID']
-    result = []
+# cursor-paginated transaction history: ?cursor=&limit=&symbol=&side=
+@login_required
+@require_GET
+def transaction_history(request):
+    side = request.GET.get('side')
+    if side and side.upper() not in ('BUY', 'SELL'):
+        return JsonResponse({'error': 'Invalid side'}, status=400)
     try:
-        data = yf.download(tickers=symbols, period="1d", interval="1m", group_by='ticker', auto_adjust=True)
-
-        for symbol in symbols:
-            try:
-                last_price = data[symbol]['Close'].dropna().iloc[-1]
-                open_price = data[symbol]['Open'].dropna().iloc[-1]
-                percent_change = ((last_price - open_price) / open_price) * 100
-
-                result.append({
-                    'symbol': symbol,
-                    'last_price': round(last_price, 2),
-                    'open_price': round(open_price, 2),
-                    'change_percent': round(percent_change, 2)
-                })
-            except (KeyError, IndexError):
-                result.append({
-                    'symbol': symbol,
-                    'last_price': 'N/A',
-                    'open_price': 'N/A',
-                    'change_percent': 'N/A'
-                })
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+        transactions, next_cursor = transaction_page(
+            Portfolio.objects.values_list('id', flat=True).get(user=request.user),
+            cursor=request.GET.get('cursor'),
+            limit=limit,
+            symbol=request.GET.get('symbol'),
+            side=side,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-    except Exception as e:
-        print("Error fetching data:", e)
+    return JsonResponse({
+        'results': [serialize_transaction(trans) for trans in transactions],
+        'next_cursor': next_cursor,
+    })
 
-    return result
 
+def financial_table_view(symbols=FINANCIAL_TABLE_SYMBOLS):
+    # served from the shared per-symbol quote cache, see quotes.py
+    return get_quotes(symbols)
 
-# Get chart
-def get_chart(request, symbol):
+
+# the user's watchlist as json; POST symbols=AAPL,MSFT replaces it (reorder or remove)
+@login_required
+def watchlist_view(request):
+    if request.method == 'POST':
+        symbols = [s for s in request.POST.get('symbols', '').split(',') if s.strip()]
+        if len(symbols) > MAX_SYMBOLS or any(len(s.strip()) > 20 for s in symbols):
+            return JsonResponse({'error': f"At most {MAX_SYMBOLS} symbols"}, status=400)
+        return JsonResponse({'symbols': set_symbols(request.user.pk, symbols)})
+    return JsonResponse({'symbols': get_symbols(request.user.pk)})
+
+
+# ticker rows as json: ?symbols=AAPL,MSFT (default the dashboard table)
+@require_GET
+async def quotes_view(request):
+    symbols = parse_symbols(request.GET.get('symbols', ''))
+    if symbols is None:
+        return JsonResponse({'error': f"At most {MAX_SYMBOLS} symbols"}, status=400)
+    return JsonResponse({'quotes': await run_blocking(get_quotes, symbols)})
+
+
+# instrument autocomplete: ?q=app (symbol or name words, prefixes allowed) and an optional &limit=
+@require_GET
+def symbol_search(request):
     try:
-        data = yf.download(symbol, period='1d', interval='1m', auto_adjust=True)
+        limit = max(1, int(request.GET.get('limit', 10)))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    response = JsonResponse({'results': symbol_index.search(request.GET.get('q', '')[:60], limit)})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+# server-sent events: a snapshot, then only the rows that changed, see streaming.py
+@require_GET
+async def quote_stream(request):
+    symbols = parse_symbols(request.GET.get('symbols', ''))
+    if symbols is None:
+        return JsonResponse({'error': f"At most {MAX_SYMBOLS} symbols"}, status=400)
+    if not isinstance(request, ASGIRequest):
+        # a WSGI worker would buffer the endless stream; portfolio.asgi serves it without this view
+        return JsonResponse({'error': 'Quote streaming needs the ASGI server'}, status=501)
+
+    response = StreamingHttpResponse(quote_hub.stream(symbols), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# quote cache hit/miss/staleness counters
+@staff_member_required
+def quote_cache_stats(request):
+    return JsonResponse({**quote_cache.stats(), 'batches': quote_batcher.stats(), 'stream': quote_hub.stats()})
 
-        plt.figure(figsize=(10, 5))
-        plt.plot(data.index, data['Close'], label='Close Price', color='r')
-        plt.title(f'{symbol} - 1 Day')
-        plt.xlabel('Date')
-        plt.ylabel('Price (USD)')
-        plt.grid(True)
-        plt.legend()
 
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close()
-        buf.seek(0)
+# database connects, handshake time and connection reuse for this worker
+@staff_member_required
+def db_connection_stats(request):
+    return JsonResponse(connection_stats.stats())
 
-        image_base64 = base64.b64encode(buf.read()).decode('utf-8')
 
-        return JsonResponse({'image': image_base64})
+# per-view latency histograms, SQL, market data and render totals of every worker, Prometheus text format
+# scrapers send ``Authorization: Bearer <METRICS_TOKEN>``; without a token configured it is staff only
+@never_cache
+@require_GET
+def metrics_view(request):
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), expected):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    elif not (request.user.is_active and request.user.is_staff):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    registry.flush()
+    return HttpResponse(exposition(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Get chart
+# binary image by default, ?format=json (or CHART_DEFAULT_FORMAT = 'json') keeps the old base64 contract
+@require_GET
+async def get_chart(request, symbol):
+    symbol = symbol.upper()
+    period = request.GET.get('range', '1d')
+    interval = request.GET.get('interval', '1m')
+    fmt = request.GET.get('format', settings.CHART_DEFAULT_FORMAT)
+    if period not in PERIODS or interval not in INTERVALS or fmt not in ('png', 'svg', 'json'):
+        return JsonResponse({'error': 'Invalid range, interval or format'}, status=400)
+
+    try:
+        chart = await run_blocking(get_chart_image, symbol, period, interval, 'png' if fmt == 'json' else fmt)
+    except Exception as e:
+        if fmt == 'json':
+            return JsonResponse({'error': str(e)})
+        return JsonResponse({'error': str(e)}, status=404 if isinstance(e, LookupError) else 502)
+
+    if fmt == 'json':
+        return JsonResponse({'image': base64.b64encode(chart.content).decode('utf-8')})
+
+    response = get_conditional_response(request, etag=chart.etag)
+    if response is None:
+        response = HttpResponse(chart.content, content_type=chart.content_type)
+    response['ETag'] = chart.etag
+    patch_cache_control(response, public=True, max_age=chart.max_age)
+    return response
+
+
+# columnar OHLCV json for client-side charts, decimated to ?points= (default 500)
+@require_GET
+def get_series(request, symbol):
+    symbol = symbol.upper()
+    period = request.GET.get('range', '1d')
+    interval = request.GET.get('interval', '1m')
+    method = request.GET.get('method', 'ohlc')
+    try:
+        points = min(int(request.GET.get('points', 500)), settings.SERIES_MAX_POINTS)
+    except ValueError:
+        points = 0
+    if period not in PERIODS or interval not in INTERVALS or method not in SERIES_METHODS or points < 3:
+        return JsonResponse({'error': 'Invalid range, interval, method or points'}, status=400)
+
+    try:
+        series = get_series_payload(symbol, period, interval, points, method)
+    except LookupError as e:
+        return JsonResponse({'error': str(e)}, status=404)
     except Exception as e:
-        return JsonResponse({'error': str(e)})
+        return JsonResponse({'error': str(e)}, status=502)
+
+    response = get_conditional_response(request, etag=series.etag)
+    if response is None:
+        response = HttpResponse(series.content, content_type=series.content_type)
+    response['ETag'] = series.etag
+    patch_cache_control(response, public=True, max_age=series.max_age)
+    return response
+
+
+# daily equity curve from the snapshot table: ?start=&end= (YYYY-MM-DD), default the last year
+@login_required
+@require_GET
+def equity_curve(request):
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+        start = (date.fromisoformat(request.GET['start']) if request.GET.get('start')
+                 else (end or localdate()) - timedelta(days=365))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start or end date'}, status=400)
+
+    portfolio_id = Portfolio.objects.values_list('id', flat=True).get(user=request.user)
+    return JsonResponse(get_equity_curve(portfolio_id, start, end))
+
+
+# volatility, beta, VaR, drawdown and correlations of the current holdings, cached for the day, see risk.py
+@login_required
+@require_GET
+def risk_view(request):
+    portfolio_id = Portfolio.objects.values_list('id', flat=True).get(user=request.user)
+    return JsonResponse(portfolio_risk(portfolio_id))
 
 
 # create automatic portfolio when created user
 @receiver(post_save, sender=User)
-def create_portfolio(sender, instance, created, **kwargs):
-    if created:
+def create_portfolio(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
         Portfolio.objects.create(user=instance)
 
 
@@ -230,72 +364,69 @@ def create_portfolio(sender, instance, created, **kwargs):
 @login_required
 def trade_asset(request):
     if request.method == "POST":
-        symbol = request.POST.get("symbol").upper()
-        quantity = Decimal(request.POST.get("quantity"))
-        price = Decimal(request.POST.get("price"))
-        transaction_type = request.POST.get('transaction_type')
-
-        portfolio = request.user.portfolio
-        profile = request.user.profile  # 👈 user’s balance
-
-        # check or create asset
-        asset, created = Asset.objects.get_or_create(
-            symbol=symbol,
-            defaults={'name': symbol, 'asset_type': 'stock'}
-        )
+        try:
+            execute_trade(
+                request.user,
+                symbol=request.POST.get("symbol"),
+                transaction_type=request.POST.get('transaction_type'),
+                quantity=request.POST.get("quantity"),
+                price=request.POST.get("price"),
+            )
+        except TradeError as e:
+            return HttpResponse(e.message, status=400)
 
-        total_cost = quantity * price
+        return redirect('dashboard')
 
-        if transaction_type == "BUY":
-            # check if user has enough balance
-            if profile.account_balance < total_cost:
-                return HttpResponse("Not enough balance!", status=400)
+    return HttpResponse("Invalid request", status=400)
 
-            # decrease balance
-            profile.account_balance -= total_cost
-            profile.save()
 
-            # save transaction
-            Transaction.objects.create(
-                portfolio=portfolio, asset=asset, transaction_type="BUY",
-                quantity=quantity, price=price
-            )
+# submit many BUY/SELL orders at once (JSON list or CSV), filled in one DB transaction
+@login_required
+@require_POST
+def trade_batch(request):
+    try:
+        orders = parse_orders(request.body, request.content_type or '')
+    except TradeError as e:
+        return JsonResponse({'error': e.message}, status=400)
+    if len(orders) > settings.TRADE_BATCH_MAX_ORDERS:
+        return JsonResponse({'error': f"At most {settings.TRADE_BATCH_MAX_ORDERS} orders per batch"}, status=400)
 
-            # update portfolio position
-            position, _ = PortfolioPosition.objects.get_or_create(
-                portfolio=portfolio, asset=asset, defaults={'quantity': Decimal('0')}
-            )
-            position.quantity += quantity
-            position.save()
-
-        elif transaction_type == "SELL":
-            # check if user has enough asset
-            try:
-                position = PortfolioPosition.objects.get(portfolio=portfolio, asset=asset)
-            except PortfolioPosition.DoesNotExist:
-                return HttpResponse("You don't own this asset!", status=400)
-
-            if position.quantity < quantity:
-                return HttpResponse("Not enough asset quantity to sell!", status=400)
-
-            # decrease asset, increase balance
-            position.quantity -= quantity
-            if position.quantity == 0:
-                position.delete()
-            else:
-                position.save()
-
-            profile.account_balance += total_cost
-            profile.save()
-
-            # save transaction
-            Transaction.objects.create(
-                portfolio=portfolio, asset=asset, transaction_type="SELL",
-                quantity=quantity, price=price
+    all_or_none = request.GET.get('all_or_none', '').lower() in ('1', 'true', 'yes')
+    try:
+        result = execute_batch(request.user, orders, all_or_none=all_or_none)
+    except TradeError as e:
+        return JsonResponse({'error': e.message}, status=400)
+    return JsonResponse(result.as_dict())
+
+
+# resting limit/stop orders: GET lists the user's orders (?status=open by default, 'all' for any),
+# POST places one from symbol, transaction_type, order_type, quantity and price; see orders.py
+@login_required
+@require_http_methods(['GET', 'POST'])
+def orders_view(request):
+    try:
+        if request.method == 'POST':
+            order = place_order(
+                request.user,
+                symbol=request.POST.get('symbol'),
+                transaction_type=request.POST.get('transaction_type'),
+                order_type=request.POST.get('order_type'),
+                quantity=request.POST.get('quantity'),
+                price=request.POST.get('price'),
             )
+            return JsonResponse(serialize_orders([order])[0], status=201)
+        status = request.GET.get('status', 'open')
+        orders = list_orders(request.user, status=None if status == 'all' else status)
+    except TradeError as e:
+        return JsonResponse({'error': e.message, 'code': e.code}, status=400)
+    return JsonResponse({'orders': serialize_orders(orders)})
 
-        return redirect('dashboard')
 
-    return HttpResponse("Invalid request", status=400)
-    assets = Asset.objects.all()
-    return render(request, 'accounts/dashboard.html')
+@login_required
+@require_POST
+def cancel_order_view(request, order_id):
+    try:
+        cancel_order(request.user, order_id)
+    except TradeError as e:
+        return JsonResponse({'error': e.message, 'code': e.code}, status=404)
+    return JsonResponse({'id': order_id, 'status': 'cancelled'})
@@ -0,0 +1,63 @@
+"""
+Optional warm-up for ``gunicorn --preload``.
+
+The market data and chart code import pandas, yfinance and matplotlib on
+first use, so a worker serving ``/login/`` never pays for them. numpy is not
+lazy: valuation.py, series.py, snapshots.py and risk.py import it at module
+level, so it loads with the URLconf (it is listed below only so the timings
+report it). With
+``--preload`` the application is loaded once in the gunicorn master; the
+``when_ready`` hook below then imports the heavy libraries there too, renders
+one throwaway chart (font cache, Agg backend), builds the symbol search index
+(see search.py) and freezes the garbage collector, so every forked worker shares those pages copy-on-write instead of
+loading its own copy on its first chart or quote request. Without
+``--preload`` the hook does nothing. Both ``gunicorn.conf.py`` and
+``portfolio/gunicorn_asgi.py`` install it.
+"""
+import gc
+import importlib
+import time
+from io import BytesIO
+
+HEAVY_MODULES = ('numpy', 'pandas', 'yfinance', 'matplotlib.figure', 'matplotlib.backends.backend_agg')
+
+
+def warm_up():
+    """Import ``HEAVY_MODULES`` and render a tiny chart; return seconds spent per step."""
+    timings = {}
+    for name in HEAVY_MODULES:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = time.perf_counter() - started
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    started = time.perf_counter()
+    fig = Figure(figsize=(1, 1))
+    FigureCanvasAgg(fig)
+    fig.add_subplot().plot([0, 1], label='warm-up')
+    fig.savefig(BytesIO(), format='png')
+    timings['render'] = time.perf_counter() - started
+    return timings
+
+
+def when_ready(server):
+    """gunicorn server hook: warm up in the master before the workers fork (``--preload`` only)."""
+    if not server.cfg.preload_app:
+        return
+    timings = warm_up()
+
+    from django.db import connections
+
+    from .search import symbol_index
+
+    started = time.perf_counter()
+    symbol_index.build()
+    # the workers must open their own database connections, not share the master's socket
+    connections.close_all()
+    timings['symbol index'] = time.perf_counter() - started
+    # objects created so far are never collected in the workers, so their pages stay shared
+    gc.freeze()
+    server.log.info("Warmed up in %.2fs: %s", sum(timings.values()),
+                    ', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings.items()))
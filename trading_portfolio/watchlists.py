@@ -0,0 +1,43 @@
+"""
+Per-user watchlists: the ordered symbols of the dashboard ticker table.
+
+A user without a ``Watchlist`` row sees ``FINANCIAL_TABLE_SYMBOLS``. Quotes
+for every watchlist come from the shared per-symbol quote cache, so overlapping
+watchlists cost one upstream fetch per distinct symbol (see quotes.py).
+"""
+from django.db import transaction
+
+from .models import Watchlist
+from .quotes import FINANCIAL_TABLE_SYMBOLS, MAX_SYMBOLS
+
+
+def normalise(symbols):
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))[:MAX_SYMBOLS]
+
+
+def get_symbols(user_id):
+    symbols = Watchlist.objects.filter(user_id=user_id).values_list('symbols', flat=True).first()
+    return FINANCIAL_TABLE_SYMBOLS if symbols is None else symbols
+
+
+async def aget_symbols(user_id):
+    symbols = await Watchlist.objects.filter(user_id=user_id).values_list('symbols', flat=True).afirst()
+    return FINANCIAL_TABLE_SYMBOLS if symbols is None else symbols
+
+
+def set_symbols(user_id, symbols):
+    """Replace the watchlist (reorder or remove) and return the stored symbols."""
+    symbols = normalise(symbols)
+    Watchlist.objects.update_or_create(user_id=user_id, defaults={'symbols': symbols})
+    return symbols
+
+
+def add_symbols(user_id, symbols):
+    """Append ``symbols`` that are not on the watchlist yet (up to ``MAX_SYMBOLS``)."""
+    with transaction.atomic():
+        watchlist = Watchlist.objects.select_for_update().filter(user_id=user_id).first()
+        if watchlist is None:
+            return set_symbols(user_id, [*FINANCIAL_TABLE_SYMBOLS, *symbols])
+        watchlist.symbols = normalise([*watchlist.symbols, *symbols])
+        watchlist.save(update_fields=['symbols', 'updated_at'])
+        return watchlist.symbols